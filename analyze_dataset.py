@@ -7,47 +7,40 @@ import os
 import glob
 from collections import Counter
 
+from label_scanner import scan_labels
+
 def analyze_labels():
     """Analyze all label files to find unique classes and their frequencies"""
     
-    # Find all label files in the dataset
-    label_patterns = [
-        'datasets/custom/labels/train/*.txt',
-        'datasets/custom/labels/val/*.txt',
+    # Label directories in the dataset
+    label_dirs = [
+        'datasets/custom/labels/train',
+        'datasets/custom/labels/val',
     ]
     
-    all_classes = []
+    class_counts = Counter()
     file_count = 0
     
     print("🔍 Scanning for label files...")
     
-    for pattern in label_patterns:
-        label_files = glob.glob(pattern, recursive=True)
-        if label_files:
-            print(f"Found {len(label_files)} label files in pattern: {pattern}")
-            
-            for label_file in label_files:
-                try:
-                    with open(label_file, 'r') as f:
-                        lines = f.readlines()
-                        
-                    for line in lines:
-                        line = line.strip()
-                        if line:  # Skip empty lines
-                            parts = line.split()
-                            if len(parts) >= 5:  # Valid YOLO format: class x y w h
-                                try:
-                                    class_id = int(parts[0])
-                                    all_classes.append(class_id)
-                                except ValueError:
-                                    print(f"⚠️  Invalid class ID in {label_file}: {parts[0]}")
-                    
-                    file_count += 1
-                        
-                except Exception as e:
-                    print(f"❌ Error reading {label_file}: {e}")
+    for label_dir in label_dirs:
+        if not os.path.isdir(label_dir):
+            continue
+        
+        # Files are parsed in parallel and cached in <label_dir>.scan.cache
+        scan = scan_labels(label_dir)
+        if scan['files']:
+            print(f"Found {scan['files']} label files in: {label_dir} "
+                  f"({scan['rescanned']} re-read, rest from cache)")
+        for message in scan['messages']:
+            print(message)
+        
+        class_counts.update({class_id: int(count)
+                             for class_id, count in enumerate(scan['counts']) if count})
+        file_count += scan['files']
     
-    if not all_classes:
+    total_annotations = sum(class_counts.values())
+    if not total_annotations:
         print("❌ No valid label files found!")
         print("\n🔍 Let me search for any .txt files in your project:")
         all_txt_files = glob.glob('**/*.txt', recursive=True)
@@ -58,13 +51,12 @@ def analyze_labels():
         return
     
     # Analyze the classes
-    class_counts = Counter(all_classes)
     unique_classes = sorted(class_counts.keys())
     
     print(f"\n📊 Dataset Analysis Results:")
     print(f"=" * 50)
     print(f"📁 Total label files processed: {file_count}")
-    print(f"🏷️  Total annotations: {len(all_classes)}")
+    print(f"🏷️  Total annotations: {total_annotations}")
     print(f"🎯 Unique classes found: {len(unique_classes)}")
     print(f"📈 Class range: {min(unique_classes)} to {max(unique_classes)}")
     
@@ -74,7 +66,7 @@ def analyze_labels():
     
     for class_id in unique_classes:
         count = class_counts[class_id]
-        percentage = (count / len(all_classes)) * 100
+        percentage = (count / total_annotations) * 100
         print(f"{class_id:8d} | {count:5d} | {percentage:7.1f}%")
     
     # Generate updated data.yaml content
@@ -87,6 +79,16 @@ def analyze_labels():
     for i, class_id in enumerate(unique_classes):
         print(f"  {class_id}: class_{class_id}")
     
+    # Object sizes in pixels decide how far imgsz can go down
+    if os.path.exists('data.yaml'):
+        from imgsz_advisor import box_pixel_sizes, print_size_report, size_report
+        sizes = box_pixel_sizes('data.yaml')
+        if len(sizes['image_long_side']) == 0:
+            print(f"\n📐 No images found next to the labels, skipping the box size report")
+        else:
+            print_size_report(size_report(sizes))
+            print(f"   Check val recall at smaller imgsz with: python imgsz_advisor.py")
+    
     print(f"\n💡 Next steps:")
     print(f"1. Update your data.yaml with nc: {len(unique_classes)}")
     print(f"2. Replace the generic 'class_X' names with meaningful names")
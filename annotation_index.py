@@ -0,0 +1,230 @@
+"""
+Memory-Mapped Annotation Index
+
+Packs every box from the YOLO label files of a dataset into a few .npy files
+that are opened with mmap, so analysis passes read one array instead of
+opening tens of thousands of small .txt files.
+
+Layout of the index directory (default: datasets/custom/labels.index):
+    boxes.npy            all boxes, grouped by image, with columns
+                         image_idx, class_id, x, y, w, h
+    image_offsets.npy    rows of image i are boxes[offsets[i]:offsets[i + 1]]
+    boxes_by_class.npy   the same boxes grouped by class
+    class_offsets.npy    rows of class c are boxes_by_class[offsets[c]:offsets[c + 1]]
+    manifest.json        label file path, split, size and mtime for every image
+
+Per-image and per-class queries return zero-copy slices of the memory map.
+Rebuilding only re-parses label files whose size or mtime changed; the rows
+of unchanged files are copied over from the previous index.
+
+Usage:
+    python annotation_index.py [dataset_root]
+"""
+
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from label_scanner import parse_label_file
+
+INDEX_VERSION = 1
+BOX_DTYPE = np.dtype([
+    ('image_idx', np.int32),
+    ('class_id', np.int32),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('w', np.float32),
+    ('h', np.float32),
+])
+
+
+def default_index_dir(dataset_root):
+    return os.path.join(dataset_root, 'labels.index')
+
+
+def _parse_boxes(label_file):
+    boxes, _ = parse_label_file(label_file)
+    return boxes
+
+
+def _save_array(path, array):
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+class AnnotationIndex:
+    """Read-only view of a built annotation index"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != INDEX_VERSION:
+            raise ValueError(f"Annotation index {index_dir} has an unsupported version")
+
+        self.images = manifest['images']
+        self.boxes = np.load(os.path.join(index_dir, 'boxes.npy'), mmap_mode='r')
+        self.image_offsets = np.load(os.path.join(index_dir, 'image_offsets.npy'))
+        self.boxes_by_class = np.load(os.path.join(index_dir, 'boxes_by_class.npy'), mmap_mode='r')
+        self.class_offsets = np.load(os.path.join(index_dir, 'class_offsets.npy'))
+
+        # The files are replaced one by one, so an interrupted build can leave
+        # arrays from different builds side by side
+        if (len(self.image_offsets) != len(self.images) + 1
+                or self.image_offsets[-1] != len(self.boxes)
+                or manifest.get('boxes', len(self.boxes)) != len(self.boxes)
+                or len(self.boxes_by_class) != len(self.boxes)
+                or (len(self.class_offsets) and self.class_offsets[-1] != len(self.boxes))):
+            raise ValueError(f"Annotation index {index_dir} is inconsistent (interrupted build?)")
+        self._positions = {image['label']: i for i, image in enumerate(self.images)}
+
+    def __len__(self):
+        return len(self.images)
+
+    def image_boxes(self, image_idx):
+        """Boxes of one image (zero-copy slice)"""
+
+        return self.boxes[self.image_offsets[image_idx]:self.image_offsets[image_idx + 1]]
+
+    def image_idx(self, label_file):
+        """Position of a label file in the index, or None"""
+
+        return self._positions.get(os.path.normpath(label_file))
+
+    def class_boxes(self, class_id):
+        """Boxes of one class across the whole dataset (zero-copy slice)"""
+
+        if class_id < 0 or class_id + 1 >= len(self.class_offsets):
+            return self.boxes_by_class[:0]
+        return self.boxes_by_class[self.class_offsets[class_id]:self.class_offsets[class_id + 1]]
+
+    def class_counts(self):
+        """Number of boxes per class id"""
+
+        return np.diff(self.class_offsets)
+
+    def split_mask(self, split):
+        """Boolean mask over images belonging to one split ('train', 'val')"""
+
+        return np.array([image['split'] == split for image in self.images], dtype=bool)
+
+
+def _list_label_files(dataset_root, splits):
+    for split in splits:
+        label_dir = os.path.join(dataset_root, 'labels', split)
+        if not os.path.isdir(label_dir):
+            continue
+        for entry in sorted(os.scandir(label_dir), key=lambda e: e.name):
+            if entry.is_file() and entry.name.endswith('.txt'):
+                stat = entry.stat()
+                yield {
+                    'label': os.path.normpath(entry.path),
+                    'split': split,
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                }
+
+
+def _load_previous(index_dir):
+    try:
+        previous = AnnotationIndex(index_dir)
+    except (OSError, KeyError):
+        return None
+    except ValueError as e:
+        print(f"⚠️  {e}, rebuilding it")
+        return None
+    return previous
+
+
+def build_index(dataset_root='datasets/custom', index_dir=None, splits=('train', 'val'),
+                workers=None):
+    """Build or incrementally update the index and return it opened"""
+
+    index_dir = index_dir or default_index_dir(dataset_root)
+    os.makedirs(index_dir, exist_ok=True)
+    images = list(_list_label_files(dataset_root, splits))
+    previous = _load_previous(index_dir)
+
+    reused, changed = {}, []
+    for i, image in enumerate(images):
+        old_idx = previous.image_idx(image['label']) if previous else None
+        old = previous.images[old_idx] if old_idx is not None else None
+        if old and old['size'] == image['size'] and old['mtime_ns'] == image['mtime_ns']:
+            reused[i] = old_idx
+        else:
+            changed.append(i)
+
+    if previous is not None and not changed and len(images) == len(previous):
+        print(f"✅ Annotation index up to date ({len(images)} images)")
+        return previous
+
+    parsed = {}
+    if changed:
+        paths = [images[i]['label'] for i in changed]
+        if len(paths) < 256:
+            results = list(map(_parse_boxes, paths))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_parse_boxes, paths, chunksize=256))
+        parsed = dict(zip(changed, results))
+
+    # Assemble image-major rows
+    counts = np.zeros(len(images), dtype=np.int64)
+    for i in range(len(images)):
+        counts[i] = len(parsed[i]) if i in parsed else len(previous.image_boxes(reused[i]))
+    image_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+    np.cumsum(counts, out=image_offsets[1:])
+
+    boxes = np.zeros(image_offsets[-1], dtype=BOX_DTYPE)
+    for i in range(len(images)):
+        start, end = image_offsets[i], image_offsets[i + 1]
+        if start == end:
+            continue
+        if i in parsed:
+            rows = parsed[i]
+            boxes['class_id'][start:end] = rows[:, 0]
+            for column, name in enumerate(('x', 'y', 'w', 'h'), start=1):
+                boxes[name][start:end] = rows[:, column]
+        else:
+            boxes[start:end] = previous.image_boxes(reused[i])
+        boxes['image_idx'][start:end] = i
+
+    # Class-major copy for zero-copy per-class queries
+    order = np.argsort(boxes['class_id'], kind='stable')
+    boxes_by_class = boxes[order]
+    num_classes = int(boxes['class_id'].max()) + 1 if len(boxes) else 0
+    class_offsets = np.zeros(num_classes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(boxes['class_id'], minlength=num_classes), out=class_offsets[1:])
+
+    previous = None  # release the old memory maps before replacing the files
+    _save_array(os.path.join(index_dir, 'boxes.npy'), boxes)
+    _save_array(os.path.join(index_dir, 'image_offsets.npy'), image_offsets)
+    _save_array(os.path.join(index_dir, 'boxes_by_class.npy'), boxes_by_class)
+    _save_array(os.path.join(index_dir, 'class_offsets.npy'), class_offsets)
+    with open(os.path.join(index_dir, 'manifest.json.tmp'), 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'boxes': len(boxes), 'images': images}, f)
+    os.replace(os.path.join(index_dir, 'manifest.json.tmp'),
+               os.path.join(index_dir, 'manifest.json'))
+
+    print(f"✅ Annotation index built: {len(images)} images, {len(boxes)} boxes "
+          f"({len(changed)} label files parsed, {len(reused)} reused)")
+    return AnnotationIndex(index_dir)
+
+
+def main():
+    dataset_root = sys.argv[1] if len(sys.argv) > 1 else 'datasets/custom'
+    print(f"🗂️  Building annotation index for {dataset_root}...")
+    index = build_index(dataset_root)
+
+    counts = index.class_counts()
+    print(f"\n📋 Boxes per class:")
+    for class_id in np.flatnonzero(counts):
+        print(f"{class_id:8d} | {counts[class_id]:7d}")
+
+
+if __name__ == "__main__":
+    main()
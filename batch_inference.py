@@ -0,0 +1,108 @@
+"""
+Batched Folder Inference Engine
+
+Runs a YOLO model over many images in batches instead of one image at a time:
+
+1. A thread pool decodes and letterboxes images ahead of the model into a
+   bounded queue (cv2 releases the GIL, so decoding runs in parallel).
+2. The model runs on batches of N preprocessed images.
+3. Detections go to a ResultSink: rows are written as JSONL/Parquet and
+   optional plotting/cv2.imwrite run on background threads, overlapping with
+   the next batch.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from inference_metrics import get_metrics
+from preprocess import load_and_letterbox, scale_boxes_to_original
+from result_sink import ResultSink
+
+_SENTINEL = object()
+metrics = get_metrics()
+
+
+def _prefetch(image_paths, imgsz, workers, out_queue):
+    """Submit decode jobs in order and hand their futures to the consumer"""
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for image_path in image_paths:
+            # put() blocks once the queue is full, bounding memory use
+            out_queue.put((image_path, pool.submit(load_and_letterbox, image_path, imgsz)))
+    out_queue.put(_SENTINEL)
+
+
+def iter_prepared_batches(image_paths, batch_size=8, imgsz=640, workers=4, prefetch_batches=2):
+    """Yield lists of (path, original, model_input, ratio_pad) of size batch_size"""
+
+    prepared = queue.Queue(maxsize=max(batch_size * prefetch_batches, 1))
+    producer = threading.Thread(target=_prefetch, args=(image_paths, imgsz, workers, prepared),
+                                daemon=True)
+    producer.start()
+
+    batch = []
+    while True:
+        item = prepared.get()
+        if item is _SENTINEL:
+            break
+        image_path, future = item
+        loaded = future.result()
+        if loaded is None:
+            print(f"⚠️  Could not read {image_path}, skipping")
+            continue
+        batch.append((image_path, *loaded))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    producer.join()
+
+
+def run_batched_inference(model, image_paths, batch_size=8, imgsz=640, workers=4,
+                          prefetch_batches=2, output_dir='.', save_images=True,
+                          detections_path=None, conf=0.25, device='cpu', on_result=None):
+    """Run model over image_paths in prefetched batches
+
+    on_result(result) is called for every image in input order with a
+    Results object whose boxes are in original image coordinates.
+    Annotated images go to output_dir when save_images is set, and detection
+    rows to detections_path (.jsonl or .parquet) when given.
+    Returns throughput statistics.
+    """
+
+    image_count = 0
+    start = time.perf_counter()
+    sink = ResultSink(detections_path, render_dir=output_dir if save_images else None,
+                      render_suffix='_custom_detection.jpg',
+                      max_pending_renders=batch_size * prefetch_batches)
+
+    with sink:
+        for batch in iter_prepared_batches(image_paths, batch_size, imgsz, workers, prefetch_batches):
+            inputs = torch.from_numpy(np.stack([item[2] for item in batch]))
+            predictions = model(inputs, imgsz=imgsz, conf=conf, device=device, verbose=False)
+            metrics.record_speed(predictions, preprocess=False)
+
+            for (image_path, original, _, ratio_pad), prediction in zip(batch, predictions):
+                with metrics.stage('postprocess'):
+                    boxes = scale_boxes_to_original(prediction.boxes.data, ratio_pad,
+                                                    original.shape)
+                    result = Results(original, path=image_path, names=model.names, boxes=boxes)
+                if on_result is not None:
+                    on_result(result)
+                sink.add(result)
+            image_count += len(batch)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'images': image_count,
+        'detections': sink.detections,
+        'seconds': elapsed,
+        'images_per_sec': image_count / elapsed if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,236 @@
+"""
+Inference Benchmark Suite
+
+Benchmarks yolov8n.pt and every runs/custom/*/weights/best.pt on the sample
+images in tests/ and datasets/coco8, sweeping imgsz, batch size and torch
+thread count. Each configuration runs in a fresh process so cold start and
+peak RSS are measured honestly.
+
+Recorded per configuration:
+    cold_start_s             import + model load + first inference
+    latency_p50/p95/p99_ms   warm latency per batch
+    throughput_ips           images per second over the warm iterations
+    peak_rss_mb              peak resident memory of the benchmark process
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --save-baseline benchmarks/baseline.json
+    python benchmark.py --baseline benchmarks/baseline.json --threshold 0.10
+
+With --baseline the script exits with status 1 if any metric regressed by
+more than --threshold compared to the stored baseline, or if none of the
+configs has a baseline entry (configs missing from the baseline are listed).
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import get_context
+
+from model_registry import PRETRAINED_MODEL_PATH
+
+DEFAULT_IMAGE_PATTERNS = ['tests/*.jpg', 'datasets/coco8/images/*/*.jpg']
+
+# Metric name -> True if higher is better
+METRICS = {
+    'cold_start_s': False,
+    'latency_p50_ms': False,
+    'latency_p95_ms': False,
+    'latency_p99_ms': False,
+    'throughput_ips': True,
+    'peak_rss_mb': False,
+}
+
+
+def find_models():
+    return [PRETRAINED_MODEL_PATH] + sorted(glob.glob('runs/custom/*/weights/best.pt'))
+
+
+def find_images(patterns=DEFAULT_IMAGE_PATTERNS):
+    images = []
+    for pattern in patterns:
+        images.extend(sorted(glob.glob(pattern)))
+    return images
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_config(weights, image_paths, imgsz, batch_size, threads, warmup=3, iterations=20):
+    """Benchmark one configuration; runs inside a fresh worker process"""
+
+    start = time.perf_counter()
+    import torch
+    torch.set_num_threads(threads)
+    import cv2
+    import numpy as np
+    from ultralytics import YOLO
+
+    images = [cv2.imread(path) for path in image_paths]
+    images = [image for image in images if image is not None]
+    batches = [[images[(i * batch_size + j) % len(images)] for j in range(batch_size)]
+               for i in range(warmup + iterations)]
+
+    model = YOLO(weights)
+    model(batches[0], imgsz=imgsz, verbose=False)
+    cold_start = time.perf_counter() - start
+
+    for batch in batches[1:warmup]:
+        model(batch, imgsz=imgsz, verbose=False)
+
+    latencies = []
+    for batch in batches[warmup:]:
+        batch_start = time.perf_counter()
+        model(batch, imgsz=imgsz, verbose=False)
+        latencies.append(time.perf_counter() - batch_start)
+
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        'model': weights,
+        'imgsz': imgsz,
+        'batch': batch_size,
+        'threads': threads,
+        'cold_start_s': cold_start,
+        'latency_p50_ms': float(p50),
+        'latency_p95_ms': float(p95),
+        'latency_p99_ms': float(p99),
+        'throughput_ips': batch_size * len(latencies) / float(sum(latencies)),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def run_sweep(models, image_paths, imgsz_values, batch_values, thread_values,
+              warmup=3, iterations=20):
+    results = []
+    spawn = get_context('spawn')
+    for weights, imgsz, batch_size, threads in product(models, imgsz_values, batch_values,
+                                                       thread_values):
+        print(f"⏱️  {weights} imgsz={imgsz} batch={batch_size} threads={threads}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            result = pool.submit(run_config, weights, image_paths, imgsz, batch_size, threads,
+                                 warmup, iterations).result()
+        print(f"   cold start {result['cold_start_s']:.2f}s, "
+              f"p50 {result['latency_p50_ms']:.1f} ms, "
+              f"{result['throughput_ips']:.2f} images/sec, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB")
+        results.append(result)
+    return results
+
+
+def _config_key(result):
+    return (os.path.normpath(result['model']), result['imgsz'], result['batch'], result['threads'])
+
+
+def _config_name(result):
+    return (f"{result['model']} imgsz={result['imgsz']} batch={result['batch']} "
+            f"threads={result['threads']}")
+
+
+def find_regressions(results, baseline_results, threshold):
+    """Compare results against a baseline
+
+    Returns (regressions, missing): human-readable regressions, and the
+    configs that have no baseline entry and so were not compared.
+    """
+
+    baseline = {_config_key(result): result for result in baseline_results}
+    regressions, missing = [], []
+    for result in results:
+        base = baseline.get(_config_key(result))
+        if base is None:
+            missing.append(_config_name(result))
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -threshold) or \
+                    (not higher_is_better and change > threshold):
+                regressions.append(f"{_config_name(result)}: {metric} {old:.2f} -> {new:.2f} "
+                                   f"({change * 100:+.1f}%)")
+    return regressions, missing
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='YOLO inference benchmark')
+    parser.add_argument('--models', help='comma-separated weights (default: yolov8n.pt and '
+                                         'runs/custom/*/weights/best.pt)')
+    parser.add_argument('--imgsz', type=_int_list, default=[320, 640])
+    parser.add_argument('--batch', type=_int_list, default=[1, 8])
+    parser.add_argument('--threads', type=_int_list, default=[1, os.cpu_count() or 1])
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='fail if results regress against this file')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='allowed relative regression per metric (default: 0.10)')
+    parser.add_argument('--save-baseline', help='also write the results to this baseline file')
+    args = parser.parse_args()
+
+    models = args.models.split(',') if args.models else find_models()
+    image_paths = find_images()
+    if not image_paths:
+        print("❌ No benchmark images found in tests/ or datasets/coco8")
+        return 1
+
+    print(f"🚀 Benchmarking {len(models)} models on {len(image_paths)} images")
+    print("=" * 60)
+    results = run_sweep(models, image_paths, args.imgsz, sorted(set(args.batch)),
+                        sorted(set(args.threads)), args.warmup, args.iterations)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'images': len(image_paths),
+            'warmup': args.warmup,
+            'iterations': args.iterations,
+        },
+        'results': results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results saved as: {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, missing = find_regressions(results, baseline['results'], args.threshold)
+        if missing:
+            print(f"\n⚠️  {len(missing)} of {len(results)} configs are not in {args.baseline}:")
+            for config in missing:
+                print(f"   - {config}")
+        if len(missing) == len(results):
+            print(f"❌ No configs matched the baseline, nothing was compared")
+            return 1
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions beyond {args.threshold * 100:.0f}%:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            return 1
+        print(f"\n✅ No regressions beyond {args.threshold * 100:.0f}% in "
+              f"{len(results) - len(missing)} configs against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
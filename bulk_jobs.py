@@ -0,0 +1,353 @@
+"""
+Resumable Sharded Bulk Inference
+
+Runs the custom model over a whole directory tree (hundreds of thousands of
+images) so that a crash only costs the chunk in flight:
+
+- the tree is walked lazily with os.scandir generators in directory order
+  (nothing is sorted, so memory does not grow with the size of a directory)
+- images are assigned to shard i of n by a hash of their path relative to
+  the source root, so several machines or processes can each run one shard
+  of the same corpus without coordinating
+- within a shard, images are assigned to chunks by a second hash of their
+  path. The number of chunks is fixed when the job starts (images in the
+  shard / chunk_size) and kept in the shard's manifest
+- every run spools the shard's paths into one small file per chunk
+  (<job dir>/shard-IofN/.spool/), so only the chunk being processed is
+  held in memory
+- every chunk writes its detections to its own file and is then recorded in
+  the shard's append-only manifest (<job dir>/shard-IofN/manifest.jsonl)
+- a restarted job skips every chunk whose images are unchanged since it was
+  recorded
+
+A chunk is identified by a hash of its sorted image paths. An image added
+or removed since the last run only changes the chunk it hashes to, so only
+that chunk runs again; its newer manifest row supersedes the old one. Chunks
+grow past chunk_size if the corpus grows a lot; start a new job dir then.
+
+Usage:
+    python bulk_jobs.py run --source /data/corpus --job-dir runs/bulk/corpus [--shard 0 --shards 4]
+    python bulk_jobs.py status --job-dir runs/bulk/corpus
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+import zlib
+
+from model_registry import CUSTOM_MODEL_PATH, file_hash
+from preprocess import IMAGE_EXTENSIONS
+
+MANIFEST_VERSION = 2
+# Paths buffered in memory before they are appended to the spool files
+SPOOL_FLUSH_LINES = 50000
+
+
+def iter_images(root):
+    """Image paths under root, depth-first in directory order
+
+    Hidden directories (e.g. .image_cache) and symlinked directories are skipped.
+    """
+
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith('.'):
+                    yield from iter_images(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+
+
+def shard_of(relative_path, shards):
+    """Deterministic shard of an image: same on every machine and every run"""
+
+    return zlib.crc32(relative_path.replace(os.sep, '/').encode()) % shards
+
+
+def chunk_of(relative_path, chunks):
+    """Deterministic chunk of an image within its shard
+
+    Uses a different hash than shard_of, so chunks of one shard stay balanced.
+    """
+
+    digest = hashlib.blake2b(relative_path.replace(os.sep, '/').encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % chunks
+
+
+def iter_shard_images(root, shard=0, shards=1):
+    """Paths of one shard's images, relative to root"""
+
+    root = os.path.abspath(root)
+    for path in iter_images(root):
+        relative = os.path.relpath(path, root)
+        if shards == 1 or shard_of(relative, shards) == shard:
+            yield relative
+
+
+def _spool_path(spool_dir, index):
+    return os.path.join(spool_dir, f'chunk-{index:06d}.txt')
+
+
+def spool_chunks(root, spool_dir, shard=0, shards=1, chunks=1):
+    """Walk the tree once, appending every image of the shard to its chunk's spool file"""
+
+    shutil.rmtree(spool_dir, ignore_errors=True)
+    os.makedirs(spool_dir)
+    buffers, pending = {}, 0
+
+    def flush():
+        for index, lines in buffers.items():
+            with open(_spool_path(spool_dir, index), 'a') as f:
+                f.write(''.join(lines))
+        buffers.clear()
+
+    for relative in iter_shard_images(root, shard, shards):
+        buffers.setdefault(chunk_of(relative, chunks), []).append(relative + '\n')
+        pending += 1
+        if pending >= SPOOL_FLUSH_LINES:
+            flush()
+            pending = 0
+    flush()
+
+
+def read_chunk(spool_dir, index):
+    """Sorted relative paths of one spooled chunk"""
+
+    path = _spool_path(spool_dir, index)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return sorted(f.read().splitlines())
+
+
+def chunk_key(relative_paths):
+    digest = hashlib.sha1('\n'.join(relative_paths).encode()).hexdigest()
+    return f'{len(relative_paths)}:{digest}'
+
+
+class ShardManifest:
+    """Append-only record of finished chunks of one shard
+
+    The first line describes the job and its number of chunks; every further
+    line is one finished chunk, and a later line for the same chunk replaces
+    an earlier one. Lines are fsynced, and a torn last line from a crash is
+    ignored.
+    """
+
+    def __init__(self, shard_dir, job):
+        self.shard_dir = shard_dir
+        self.path = os.path.join(shard_dir, 'manifest.jsonl')
+        self.job = job
+        self.chunks = None
+        self.done = {}
+        if os.path.exists(self.path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if not data.endswith(b'\n'):
+                # Torn write of the last line: cut it off so appends start on a fresh line
+                data = data[:data.rfind(b'\n') + 1]
+                f.truncate(len(data))
+        records = [json.loads(line) for line in data.decode().splitlines()]
+        if not records:
+            return
+        if records[0].get('job') != self.job:
+            raise ValueError(f"{self.path} belongs to a different job "
+                             f"(source, shard, model or settings changed); "
+                             f"use a new --job-dir")
+        self.chunks = records[0]['chunks']
+        for record in records[1:]:
+            self.done[record['chunk']] = record
+
+    def start(self, chunks):
+        """Write the header of a new manifest"""
+
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.chunks = chunks
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({'job': self.job, 'chunks': chunks}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append(self, record):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, index, key):
+        return self.done.get(index, {}).get('key') == key
+
+    def record(self, **chunk):
+        self._append(chunk)
+        self.done[chunk['chunk']] = chunk
+
+
+def run_shard(source, job_dir, shard=0, shards=1, weights=CUSTOM_MODEL_PATH, chunk_size=1000,
+              batch_size=8, imgsz=640, conf=0.25, processes=1, output_format='jsonl'):
+    """Run (or resume) shard i of n of a bulk job
+
+    Returns totals, or None if job_dir holds a different job.
+    """
+
+    source = os.path.abspath(source)
+    job = {'version': MANIFEST_VERSION, 'source': source, 'shard': shard, 'shards': shards,
+           'chunk_size': chunk_size, 'weights': file_hash(weights), 'imgsz': imgsz, 'conf': conf}
+    shard_dir = os.path.join(job_dir, f'shard-{shard}of{shards}')
+    try:
+        manifest = ShardManifest(shard_dir, job)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return None
+
+    if manifest.chunks is None:
+        images = sum(1 for _ in iter_shard_images(source, shard, shards))
+        manifest.start(max(1, math.ceil(images / chunk_size)))
+    spool_dir = os.path.join(shard_dir, '.spool')
+    spool_chunks(source, spool_dir, shard, shards, manifest.chunks)
+
+    # Models are only loaded once there is work left
+    model = None
+    totals = {'chunks': 0, 'skipped_chunks': 0, 'images': 0, 'detections': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+    for index in range(manifest.chunks):
+        relative_paths = read_chunk(spool_dir, index)
+        key = chunk_key(relative_paths)
+        if manifest.is_done(index, key):
+            totals['skipped_chunks'] += 1
+            continue
+
+        output_path = os.path.join(shard_dir, f'chunk-{index:06d}.{output_format}')
+        if not relative_paths:
+            # Every image of a finished chunk was removed: retire its output
+            if index in manifest.done:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                manifest.record(key=key, chunk=index, images=0, detections=0, output=None,
+                                seconds=0.0, finished=time.strftime('%Y-%m-%dT%H:%M:%S'))
+            continue
+
+        paths = [os.path.join(source, relative) for relative in relative_paths]
+        tmp_path = os.path.join(shard_dir, f'.chunk-{index:06d}.tmp.{output_format}')
+        chunk_start = time.perf_counter()
+        if processes > 1:
+            from worker_pool import load_shared_model, run_pool
+            model = model or load_shared_model(weights, imgsz)
+            stats = run_pool(weights, paths, processes, batch_size=batch_size, imgsz=imgsz,
+                             conf=conf, detections_path=tmp_path, model=model)
+        else:
+            from batch_inference import run_batched_inference
+            from model_registry import get_model
+            model = model or get_model(weights)
+            stats = run_batched_inference(model, paths, batch_size, imgsz, conf=conf,
+                                          save_images=False, detections_path=tmp_path)
+        # The chunk's output is complete before the manifest says so
+        os.replace(tmp_path, output_path)
+        seconds = time.perf_counter() - chunk_start
+        manifest.record(key=key, chunk=index, images=stats['images'],
+                        detections=stats['detections'], output=os.path.basename(output_path),
+                        seconds=round(seconds, 3), finished=time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+        totals['chunks'] += 1
+        totals['images'] += stats['images']
+        totals['detections'] += stats['detections']
+        print(f"✅ chunk {index}: {stats['images']} images, {stats['detections']} detections "
+              f"in {seconds:.1f}s ({stats['images'] / max(seconds, 1e-9):.1f} images/sec)")
+
+    shutil.rmtree(spool_dir, ignore_errors=True)
+    totals['seconds'] = time.perf_counter() - start
+    return totals
+
+
+def job_status(job_dir):
+    """Finished chunks, images and detections per shard manifest of a job"""
+
+    status = []
+    for path in sorted(glob.glob(os.path.join(job_dir, 'shard-*', 'manifest.jsonl'))):
+        with open(path) as f:
+            records = []
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        # A later row for the same chunk supersedes the earlier one
+        chunks = {record['chunk']: record for record in records[1:]}
+        chunks = {index: record for index, record in chunks.items() if record['images']}
+        status.append({
+            'shard': os.path.basename(os.path.dirname(path)),
+            'chunks': len(chunks),
+            'images': sum(record['images'] for record in chunks.values()),
+            'detections': sum(record['detections'] for record in chunks.values()),
+            'seconds': sum(record['seconds'] for record in chunks.values()),
+            'last_finished': max((record['finished'] for record in chunks.values()), default='-'),
+        })
+    return status
+
+
+def print_job_status(status):
+    print(f"\n{'Shard':<14} | {'Chunks':>6} | {'Images':>9} | {'Detections':>10} | "
+          f"{'Images/s':>8} | Last chunk")
+    print("-" * 80)
+    for row in status:
+        ips = row['images'] / row['seconds'] if row['seconds'] else 0.0
+        print(f"{row['shard']:<14} | {row['chunks']:>6} | {row['images']:>9} | "
+              f"{row['detections']:>10} | {ips:8.1f} | {row['last_finished']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumable sharded bulk inference')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run or resume one shard of a job')
+    run.add_argument('--source', required=True, help='root of the image tree')
+    run.add_argument('--job-dir', required=True, help='manifests and detections go here')
+    run.add_argument('--shard', type=int, default=0, help='shard index i (0-based)')
+    run.add_argument('--shards', type=int, default=1, help='number of shards n')
+    run.add_argument('--weights', default=CUSTOM_MODEL_PATH)
+    run.add_argument('--chunk-size', type=int, default=1000)
+    run.add_argument('--batch', type=int, default=8)
+    run.add_argument('--imgsz', type=int, default=640)
+    run.add_argument('--conf', type=float, default=0.25)
+    run.add_argument('--processes', type=int, default=1,
+                     help='worker processes per chunk (see worker_pool.py)')
+    run.add_argument('--format', choices=('jsonl', 'parquet'), default='jsonl')
+
+    status = commands.add_parser('status', help='show progress of every shard')
+    status.add_argument('--job-dir', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        print_job_status(job_status(args.job_dir))
+        return
+
+    if not os.path.isdir(args.source):
+        print(f"❌ Folder {args.source} not found!")
+        return
+    if not os.path.exists(args.weights):
+        print(f"❌ Model {args.weights} not found!")
+        return
+    if not 0 <= args.shard < args.shards:
+        print(f"❌ --shard must be between 0 and {args.shards - 1}")
+        return
+
+    print(f"🚀 Shard {args.shard} of {args.shards} of {args.source} -> {args.job_dir}")
+    totals = run_shard(args.source, args.job_dir, args.shard, args.shards, args.weights,
+                       args.chunk_size, args.batch, args.imgsz, args.conf, args.processes,
+                       args.format)
+    if totals is None:
+        return
+    print(f"\n⚡ {totals['chunks']} chunks ({totals['images']} images, {totals['detections']} "
+          f"detections) in {totals['seconds']:.1f}s; {totals['skipped_chunks']} chunks "
+          f"already done")
+
+
+if __name__ == "__main__":
+    main()
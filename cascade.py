@@ -0,0 +1,346 @@
+"""
+Confidence-Gated Model Cascade
+
+Most indoor/night frames are easy, so running the full model on every frame
+pays full cost for little gain. The cascade runs a fast model first (e.g.
+the custom model at imgsz=320) and only escalates an image to the full model
+(larger weights and/or higher imgsz) when the fast result is uncertain:
+
+- low confidence: a fast detection with min_conf <= conf < escalate_conf,
+  i.e. something that is neither clearly there nor clearly background
+- ambiguous: two fast detections of different classes overlapping with
+  IoU >= ambiguous_iou (the model can't decide what the object is)
+
+Images without any detection above min_conf stay with the fast model.
+
+evaluate_cascade() runs both models once over the val split through the
+prediction cache of incremental_validation.py and then replays the cascade
+for a sweep of escalate_conf values without further inference, giving the
+escalation rate and an accuracy-vs-cost curve (mAP50-95 against measured
+per-image latency).
+
+Usage:
+    python cascade.py evaluate [--fast weights] [--full weights]
+    python cascade.py run --source folder/ [--escalate-conf 0.5]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from batch_inference import iter_prepared_batches
+from incremental_validation import (DEFAULT_CACHE_DIR, PredictionCache, evaluate,
+                                    filter_predictions, load_ground_truth)
+from model_comparison import box_iou
+from model_registry import CUSTOM_MODEL_PATH, get_model
+from preprocess import IMAGE_EXTENSIONS, prepare_image, scale_boxes_to_original
+from result_sink import ResultSink
+from shard_dataset import list_split_images, load_dataset_config
+
+DEFAULT_FAST_IMGSZ = 320
+DEFAULT_FULL_IMGSZ = 640
+
+
+def uncertainty(boxes, min_conf=0.1, iou=0.7, ambiguous_iou=0.6):
+    """(lowest confidence, ambiguous) of one image's fast-model detections
+
+    boxes are raw (N, 6) xyxy, conf, cls detections; they are filtered at
+    min_conf with NMS first. lowest is inf when nothing is left, so the
+    image escalates iff ambiguous or lowest < escalate_conf.
+    """
+
+    boxes = filter_predictions(boxes, min_conf, iou)
+    if not len(boxes):
+        return float('inf'), False
+    overlap = box_iou(boxes[:, :4], boxes[:, :4])
+    different_class = boxes[:, 5][:, None] != boxes[:, 5][None, :]
+    ambiguous = bool(((overlap >= ambiguous_iou) & different_class).any())
+    return float(boxes[:, 4].min()), ambiguous
+
+
+def needs_escalation(boxes, min_conf=0.1, escalate_conf=0.5, iou=0.7, ambiguous_iou=0.6):
+    lowest, ambiguous = uncertainty(boxes, min_conf, iou, ambiguous_iou)
+    return ambiguous or lowest < escalate_conf
+
+
+class Cascade:
+    """Fast model first, full model only for uncertain images"""
+
+    def __init__(self, fast_weights=CUSTOM_MODEL_PATH, full_weights=CUSTOM_MODEL_PATH,
+                 fast_imgsz=DEFAULT_FAST_IMGSZ, full_imgsz=DEFAULT_FULL_IMGSZ, min_conf=0.1,
+                 escalate_conf=0.5, ambiguous_iou=0.6, conf=0.25, iou=0.7, device='cpu'):
+        self.fast = get_model(fast_weights, device=device)
+        self.full = get_model(full_weights, device=device)
+        if self.fast.names != self.full.names:
+            print("⚠️  Fast and full model have different class names; "
+                  "results mix both label sets")
+        self.fast_imgsz, self.full_imgsz = fast_imgsz, full_imgsz
+        self.min_conf, self.escalate_conf = min_conf, escalate_conf
+        self.ambiguous_iou = ambiguous_iou
+        self.conf, self.iou = conf, iou
+        self.device = device
+        self.stats = {'images': 0, 'escalated': 0, 'fast_s': 0.0, 'full_s': 0.0}
+
+    def _predict(self, model, inputs, imgsz, conf):
+        return [p.boxes.data.cpu().numpy() for p in
+                model(torch.from_numpy(np.stack(inputs)), imgsz=imgsz, conf=conf, iou=self.iou,
+                      device=self.device, verbose=False)]
+
+    def predict_batch(self, batch):
+        """Cascade over (path, original, fast model_input, ratio_pad) items
+
+        Returns (boxes in original pixels, escalated) per image.
+        """
+
+        start = time.perf_counter()
+        # The fast model runs at min_conf so the uncertain band is visible
+        fast_boxes = self._predict(self.fast, [item[2] for item in batch], self.fast_imgsz,
+                                   self.min_conf)
+        self.stats['fast_s'] += time.perf_counter() - start
+
+        outputs = []
+        for (_, original, _, ratio_pad), boxes in zip(batch, fast_boxes):
+            escalated = needs_escalation(boxes, self.min_conf, self.escalate_conf, self.iou,
+                                         self.ambiguous_iou)
+            boxes = scale_boxes_to_original(boxes, ratio_pad, original.shape)
+            outputs.append([boxes[boxes[:, 4] >= self.conf], escalated])
+
+        escalated = [i for i, (_, flag) in enumerate(outputs) if flag]
+        if escalated:
+            start = time.perf_counter()
+            prepared = [prepare_image(batch[i][1], self.full_imgsz) for i in escalated]
+            full_boxes = self._predict(self.full, [model_input for model_input, _ in prepared],
+                                       self.full_imgsz, self.conf)
+            for i, (_, ratio_pad), boxes in zip(escalated, prepared, full_boxes):
+                outputs[i][0] = scale_boxes_to_original(boxes, ratio_pad, batch[i][1].shape)
+            self.stats['full_s'] += time.perf_counter() - start
+
+        self.stats['images'] += len(batch)
+        self.stats['escalated'] += len(escalated)
+        return [tuple(output) for output in outputs]
+
+    def run(self, image_paths, batch_size=8, workers=4, output_dir='.', save_images=True,
+            detections_path=None, on_result=None):
+        """Cascade over a list of images, writing results like run_batched_inference"""
+
+        start = time.perf_counter()
+        sink = ResultSink(detections_path, render_dir=output_dir if save_images else None,
+                          render_suffix='_cascade_detection.jpg',
+                          max_pending_renders=batch_size * 2)
+        with sink:
+            for batch in iter_prepared_batches(image_paths, batch_size, self.fast_imgsz, workers):
+                for (path, original, _, _), (boxes, escalated) in zip(batch,
+                                                                      self.predict_batch(batch)):
+                    names = self.full.names if escalated else self.fast.names
+                    result = Results(original, path=path, names=names,
+                                     boxes=torch.from_numpy(boxes))
+                    if on_result is not None:
+                        on_result(result, escalated)
+                    sink.add(result)
+
+        elapsed = time.perf_counter() - start
+        images = self.stats['images']
+        return dict(self.stats, detections=sink.detections, seconds=elapsed,
+                    images_per_sec=images / elapsed if elapsed > 0 else 0.0,
+                    escalation_rate=self.stats['escalated'] / max(images, 1))
+
+
+def measure_latency(weights, image_paths, imgsz, runs=16, device='cpu'):
+    """Median seconds per image (batch 1, after warmup) of weights at imgsz"""
+
+    model = get_model(weights, device=device)
+    times = []
+    for batch in iter_prepared_batches(image_paths[:runs], 1, imgsz):
+        inputs = torch.from_numpy(batch[0][2][None])
+        model(inputs, imgsz=imgsz, device=device, verbose=False)  # warm up this imgsz
+        start = time.perf_counter()
+        model(inputs, imgsz=imgsz, device=device, verbose=False)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) if times else 0.0
+
+
+def evaluate_cascade(fast_weights=CUSTOM_MODEL_PATH, full_weights=CUSTOM_MODEL_PATH,
+                     data='data.yaml', split='val', fast_imgsz=DEFAULT_FAST_IMGSZ,
+                     full_imgsz=DEFAULT_FULL_IMGSZ, min_conf=0.1, ambiguous_iou=0.6, iou=0.7,
+                     thresholds=None, cache_dir=DEFAULT_CACHE_DIR, tolerance=0.01):
+    """Escalation rate, mAP and cost of the cascade for a sweep of escalate_conf
+
+    Both models run once per image (cached); every point of the curve is a
+    replay of the cascade decision on the cached fast predictions.
+    """
+
+    config = load_dataset_config(data)
+    image_paths = [os.path.abspath(path) for path in list_split_images(config, split)]
+    if not image_paths:
+        raise FileNotFoundError(f"No images in the '{split}' split of {data}")
+
+    fast = PredictionCache(fast_weights, cache_dir, fast_imgsz).predict(image_paths)
+    full = PredictionCache(full_weights, cache_dir, full_imgsz).predict(image_paths)
+    paths = [path for path in image_paths if path in fast and path in full]
+    ground_truth = load_ground_truth({path: full[path] for path in paths})
+
+    fast_s = measure_latency(fast_weights, paths, fast_imgsz)
+    full_s = measure_latency(full_weights, paths, full_imgsz)
+
+    decisions = [uncertainty(fast[path]['boxes'], min_conf, iou, ambiguous_iou) for path in paths]
+    lowest = np.array([lowest for lowest, _ in decisions])
+    ambiguous = np.array([ambiguous for _, ambiguous in decisions], dtype=bool)
+
+    def point(name, escalate, threshold=None):
+        predictions = {path: full[path] if up else fast[path] for path, up in zip(paths, escalate)}
+        metrics = evaluate(predictions, ground_truth, config['names'], iou=iou)
+        rate = float(np.mean(escalate)) if len(escalate) else 0.0
+        # The fast model always runs in the cascade, only the full model is gated
+        cost = full_s if name == 'full only' else fast_s if name == 'fast only' \
+            else fast_s + rate * full_s
+        return {'name': name, 'escalate_conf': threshold, 'escalation_rate': rate,
+                'ms_per_image': cost * 1000, 'relative_cost': cost / full_s if full_s else 0.0,
+                'map50': metrics['map50'], 'map50_95': metrics['map50_95']}
+
+    if thresholds is None:
+        thresholds = np.round(np.linspace(min_conf, 1.0, 10), 3)
+    points = [point('fast only', np.zeros(len(paths), dtype=bool))]
+    points += [point('cascade', ambiguous | (lowest < threshold), float(threshold))
+               for threshold in thresholds]
+    points.append(point('full only', np.ones(len(paths), dtype=bool)))
+
+    # Cheapest cascade setting that stays within tolerance of the full model
+    # and is actually cheaper than it
+    target = points[-1]['map50_95'] - tolerance
+    candidates = [p for p in points[1:-1]
+                  if p['map50_95'] >= target and p['ms_per_image'] < points[-1]['ms_per_image']]
+    suggested = min(candidates, key=lambda p: p['ms_per_image']) if candidates else None
+
+    return {'images': len(paths), 'fast': {'weights': fast_weights, 'imgsz': fast_imgsz},
+            'full': {'weights': full_weights, 'imgsz': full_imgsz}, 'min_conf': min_conf,
+            'ambiguous_iou': ambiguous_iou, 'tolerance': tolerance, 'points': points,
+            'suggested': suggested}
+
+
+def plot_cascade_curve(report, output_path):
+    """mAP50-95 against ms per image for every cascade setting"""
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    points = report['points']
+    cascade = [p for p in points if p['name'] == 'cascade']
+    fig, ax = plt.subplots(figsize=(7, 4.5))
+    ax.plot([p['ms_per_image'] for p in cascade], [p['map50_95'] for p in cascade], 'o-',
+            label='cascade')
+    labelled = set()
+    for p in cascade:
+        # Neighbouring thresholds often give the same point; label it once
+        if (p['ms_per_image'], p['map50_95']) in labelled:
+            continue
+        labelled.add((p['ms_per_image'], p['map50_95']))
+        ax.annotate(f"{p['escalate_conf']:.2f} ({p['escalation_rate'] * 100:.0f}%)",
+                    (p['ms_per_image'], p['map50_95']), fontsize=7, textcoords='offset points',
+                    xytext=(4, -10))
+    for p in points:
+        if p['name'] != 'cascade':
+            ax.plot(p['ms_per_image'], p['map50_95'], 's', markersize=8, label=p['name'])
+    ax.set_xlabel('ms per image (batch 1)')
+    ax.set_ylabel('mAP50-95')
+    ax.set_title('Cascade accuracy vs cost (escalate_conf, escalation rate)')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=120)
+    plt.close(fig)
+
+
+def print_cascade_report(report):
+    print(f"\n📊 Cascade on {report['images']} images: fast {report['fast']['weights']} "
+          f"@{report['fast']['imgsz']} -> full {report['full']['weights']} "
+          f"@{report['full']['imgsz']}")
+    print(f"{'Setting':<18} | {'Escalated':>9} | {'ms/img':>7} | {'Cost':>5} | "
+          f"{'mAP50':>6} | {'mAP50-95':>8}")
+    print("-" * 70)
+    for p in report['points']:
+        setting = p['name'] if p['escalate_conf'] is None else f"conf < {p['escalate_conf']:.2f}"
+        print(f"{setting:<18} | {p['escalation_rate'] * 100:8.1f}% | {p['ms_per_image']:7.1f} | "
+              f"{p['relative_cost']:5.2f} | {p['map50']:6.3f} | {p['map50_95']:8.3f}")
+
+    suggested = report['suggested']
+    if suggested:
+        print(f"\n💡 escalate_conf={suggested['escalate_conf']:.2f} escalates "
+              f"{suggested['escalation_rate'] * 100:.0f}% of images at "
+              f"{suggested['relative_cost'] * 100:.0f}% of full-model cost, within "
+              f"{report['tolerance']} mAP50-95 of the full model")
+    else:
+        print(f"\n⚠️  No cascade setting is cheaper than the full model while staying "
+              f"within {report['tolerance']} mAP50-95 of it")
+
+
+def print_cascade_stats(stats):
+    print(f"\n⚡ Processed {stats['images']} images in {stats['seconds']:.1f}s "
+          f"({stats['images_per_sec']:.2f} images/sec)")
+    print(f"   escalated to the full model: {stats['escalated']} "
+          f"({stats['escalation_rate'] * 100:.1f}%)")
+    print(f"   model time: fast {stats['fast_s']:.1f}s, full {stats['full_s']:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fast model first, full model when uncertain')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in (commands.add_parser('evaluate', help='accuracy-vs-cost curve on val'),
+                    commands.add_parser('run', help='run the cascade on a folder of images')):
+        command.add_argument('--fast', default=CUSTOM_MODEL_PATH, help='fast model weights')
+        command.add_argument('--full', default=CUSTOM_MODEL_PATH, help='full model weights')
+        command.add_argument('--fast-imgsz', type=int, default=DEFAULT_FAST_IMGSZ)
+        command.add_argument('--full-imgsz', type=int, default=DEFAULT_FULL_IMGSZ)
+        command.add_argument('--min-conf', type=float, default=0.1,
+                             help='fast detections below this are ignored')
+        command.add_argument('--ambiguous-iou', type=float, default=0.6)
+
+    evaluate_parser = commands.choices['evaluate']
+    evaluate_parser.add_argument('--data', default='data.yaml')
+    evaluate_parser.add_argument('--split', default='val')
+    evaluate_parser.add_argument('--tolerance', type=float, default=0.01,
+                                 help='allowed mAP50-95 loss for the suggested setting')
+    evaluate_parser.add_argument('--report', default='cascade_report.json')
+    evaluate_parser.add_argument('--plot', default='cascade_curve.png')
+
+    run_parser = commands.choices['run']
+    run_parser.add_argument('--source', required=True, help='folder of images')
+    run_parser.add_argument('--escalate-conf', type=float, default=0.5)
+    run_parser.add_argument('--conf', type=float, default=0.25)
+    run_parser.add_argument('--batch', type=int, default=8)
+    run_parser.add_argument('--detections', default='detections.jsonl')
+    run_parser.add_argument('--no-save', action='store_true', help="don't save annotated images")
+    args = parser.parse_args()
+
+    for weights in {args.fast, args.full}:
+        if not os.path.exists(weights):
+            print(f"❌ Model {weights} not found!")
+            return
+
+    if args.command == 'evaluate':
+        report = evaluate_cascade(args.fast, args.full, args.data, args.split, args.fast_imgsz,
+                                  args.full_imgsz, args.min_conf, args.ambiguous_iou,
+                                  tolerance=args.tolerance)
+        print_cascade_report(report)
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        plot_cascade_curve(report, args.plot)
+        print(f"\n✅ Report saved as: {args.report}, curve as: {args.plot}")
+        return
+
+    image_paths = [os.path.join(args.source, f) for f in sorted(os.listdir(args.source))
+                   if f.lower().endswith(IMAGE_EXTENSIONS)]
+    cascade = Cascade(args.fast, args.full, args.fast_imgsz, args.full_imgsz, args.min_conf,
+                      args.escalate_conf, args.ambiguous_iou, args.conf)
+    stats = cascade.run(image_paths, args.batch, save_images=not args.no_save,
+                        detections_path=args.detections)
+    print_cascade_stats(stats)
+    print(f"📄 {stats['detections']} detections saved to: {args.detections}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Parallel, Incremental Dataset Integrity Checker
+
+Finds the files that would otherwise only break training halfway through:
+
+- corrupt or truncated images: header-only check with PIL, full decode only
+  when something looks off (unknown format, PIL error, JPEG without an end
+  marker, tiny images)
+- images without a label file (reported as backgrounds) and label files
+  without an image (orphans)
+- class ids outside 0..nc-1 of data.yaml, malformed lines, coordinates
+  outside [0, 1], zero-size and duplicate boxes
+
+Pairs are checked across a process pool. Verified pairs are remembered in
+<dataset root>/.integrity_manifest.json by size, mtime and content hash, so
+a repeated check only opens new or changed files.
+
+Usage:
+    python dataset_checker.py [--data data.yaml] [--splits train,val]
+"""
+
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from label_scanner import parse_label_file
+from shard_dataset import label_path_for, list_split_images, load_dataset_config
+
+MANIFEST_VERSION = 1
+MIN_IMAGE_SIZE = 10  # ultralytics rejects images smaller than this
+
+
+def _file_signature(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def check_image(data):
+    """Header check of encoded image bytes; full decode only on suspicion"""
+
+    from PIL import Image
+
+    errors, warnings = [], []
+    suspicious = False
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+            width, height = image.size
+            image.verify()
+    except Exception as e:
+        image_format, width, height = None, 0, 0
+        suspicious = True
+        warnings.append(f"header check failed ({type(e).__name__})")
+
+    if image_format == 'JPEG' and not data.rstrip(b'\0').endswith(b'\xff\xd9'):
+        suspicious = True
+        warnings.append("JPEG has no end-of-image marker (truncated?)")
+    if min(width, height) < MIN_IMAGE_SIZE:
+        suspicious = True
+
+    if suspicious:
+        import cv2
+        decoded = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) \
+            if data else None
+        if decoded is None:
+            errors.append("image cannot be decoded")
+        else:
+            height, width = decoded.shape[:2]
+    if (width or height) and min(width, height) < MIN_IMAGE_SIZE:
+        errors.append(f"image too small ({width}x{height})")
+    return errors, warnings
+
+
+def check_labels(label_path, nc):
+    """Class ids, coordinate ranges, box sizes and duplicates of a label file"""
+
+    errors, warnings = [], []
+    boxes, parse_warnings = parse_label_file(label_path)
+    errors.extend(parse_warnings)
+    if not len(boxes):
+        warnings.append("empty label file (background image)")
+        return errors, warnings
+
+    class_ids = boxes[:, 0]
+    bad_classes = np.unique(class_ids[class_ids >= nc]).astype(int)
+    if len(bad_classes):
+        errors.append(f"class ids {bad_classes.tolist()} out of range (nc={nc})")
+    coords = boxes[:, 1:5]
+    out_of_range = ~np.all((coords >= 0) & (coords <= 1), axis=1)
+    if out_of_range.any():
+        errors.append(f"{int(out_of_range.sum())} boxes with coordinates outside [0, 1]")
+    zero_size = (coords[:, 2] <= 0) | (coords[:, 3] <= 0)
+    if zero_size.any():
+        errors.append(f"{int(zero_size.sum())} boxes with zero width or height")
+    duplicates = len(boxes) - len(np.unique(boxes, axis=0))
+    if duplicates:
+        warnings.append(f"{duplicates} duplicate boxes")
+    return errors, warnings
+
+
+def check_pair(image_path, label_path, nc, previous=None):
+    """Pool worker: check one image/label pair; returns a manifest-style record"""
+
+    record = {'image': image_path, 'label': label_path, 'errors': [], 'warnings': []}
+    try:
+        with open(image_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        record['errors'].append(f"cannot read image ({e})")
+        return record
+
+    record['image_sig'] = _file_signature(image_path)
+    record['hash'] = hashlib.sha1(data).hexdigest()  # same as image_cache.content_hash
+    record['label_sig'] = _file_signature(label_path)
+
+    # Same content as the last verified version (e.g. only touched): no decode needed
+    if not (previous and previous.get('hash') == record['hash']):
+        errors, warnings = check_image(data)
+        record['errors'] += errors
+        record['warnings'] += warnings
+
+    if record['label_sig'] is None:
+        record['warnings'].append("no label file (background image)")
+    else:
+        try:
+            errors, warnings = check_labels(label_path, nc)
+        except (UnicodeDecodeError, OSError) as e:
+            record['errors'].append(f"cannot read label ({e})")
+            return record
+        record['errors'] += errors
+        record['warnings'] += warnings
+    return record
+
+
+def find_orphan_labels(image_paths, split_label_dirs):
+    """Label files that belong to no image of the split"""
+
+    expected = {os.path.abspath(label_path_for(path)) for path in image_paths}
+    orphans = []
+    for label_dir in split_label_dirs:
+        for label_path in glob.glob(os.path.join(label_dir, '**', '*.txt'), recursive=True):
+            if os.path.abspath(label_path) not in expected:
+                orphans.append(label_path)
+    return sorted(orphans)
+
+
+def manifest_path_for(root):
+    return os.path.join(root, '.integrity_manifest.json')
+
+
+def load_manifest(path, nc):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        # Class ids were checked against nc, so a different nc invalidates everything
+        if manifest.get('version') == MANIFEST_VERSION and manifest.get('nc') == nc:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'nc': nc, 'files': {}}
+
+
+def check_dataset(data='data.yaml', splits=('train', 'val'), workers=None, use_manifest=True,
+                  chunksize=64):
+    """Check every image/label pair of the dataset; returns a report dict"""
+
+    config = load_dataset_config(data)
+    nc = int(config.get('nc') or len(config['names']))
+    manifest_path = manifest_path_for(config['root'])
+    manifest = load_manifest(manifest_path, nc) if use_manifest else \
+        {'version': MANIFEST_VERSION, 'nc': nc, 'files': {}}
+    verified = manifest['files']
+
+    report = {'data': data, 'nc': nc, 'splits': {}, 'errors': {}, 'warnings': {}}
+    for split in splits:
+        if not config.get(split):
+            continue
+        image_paths = [os.path.abspath(path) for path in list_split_images(config, split)]
+        label_paths = [label_path_for(path) for path in image_paths]
+        label_dirs = sorted({os.path.dirname(path) for path in label_paths})
+
+        stale = []
+        for image_path, label_path in zip(image_paths, label_paths):
+            entry = verified.get(image_path)
+            if not (entry and entry['image_sig'] == _file_signature(image_path)
+                    and entry['label_sig'] == _file_signature(label_path)):
+                stale.append((image_path, label_path, entry))
+
+        split_report = {'images': len(image_paths), 'checked': len(stale),
+                        'backgrounds': 0, 'errors': 0, 'warnings': 0}
+        if stale:
+            print(f"🔍 {split}: checking {len(stale)} new or changed pairs "
+                  f"({len(image_paths) - len(stale)} already verified)")
+            args = list(zip(*stale))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                records = pool.map(check_pair, args[0], args[1], [nc] * len(stale), args[2],
+                                   chunksize=chunksize)
+                for record in records:
+                    verified.pop(record['image'], None)
+                    if record['errors']:
+                        report['errors'][record['image']] = record['errors']
+                    else:
+                        verified[record['image']] = {key: record[key] for key in
+                                                     ('image_sig', 'label_sig', 'hash',
+                                                      'warnings')}
+                    if record['warnings']:
+                        report['warnings'][record['image']] = record['warnings']
+        else:
+            print(f"✅ {split}: all {len(image_paths)} pairs already verified")
+
+        for image_path in image_paths:
+            warnings = verified.get(image_path, {}).get('warnings', [])
+            if warnings:
+                report['warnings'].setdefault(image_path, warnings)
+            if any('background' in warning for warning in warnings):
+                split_report['backgrounds'] += 1
+
+        orphans = find_orphan_labels(image_paths, label_dirs)
+        for orphan in orphans:
+            report['warnings'][orphan] = ["label file without an image"]
+        split_report['orphan_labels'] = len(orphans)
+        split_report['errors'] = sum(path in report['errors'] for path in image_paths)
+        split_report['warnings'] = sum(path in report['warnings'] for path in image_paths)
+        report['splits'][split] = split_report
+
+    if use_manifest:
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+    return report
+
+
+def print_check_report(report, max_items=20):
+    print(f"\n{'Split':<8} | {'Images':>7} | {'Checked':>7} | {'Errors':>6} | {'Warnings':>8} | "
+          f"{'Backgrounds':>11} | {'Orphans':>7}")
+    print("-" * 72)
+    for split, row in report['splits'].items():
+        print(f"{split:<8} | {row['images']:>7} | {row['checked']:>7} | {row['errors']:>6} | "
+              f"{row['warnings']:>8} | {row['backgrounds']:>11} | {row['orphan_labels']:>7}")
+
+    for title, icon, items in (("Errors", "❌", report['errors']),
+                               ("Warnings", "⚠️ ", report['warnings'])):
+        if not items:
+            continue
+        print(f"\n{icon} {title} ({len(items)} files):")
+        for path, messages in list(items.items())[:max_items]:
+            print(f"   {path}: {'; '.join(messages)}")
+        if len(items) > max_items:
+            print(f"   ... and {len(items) - max_items} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check dataset images and labels')
+    parser.add_argument('--data', default='data.yaml')
+    parser.add_argument('--splits', default='train,val')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--no-manifest', action='store_true', help='re-check every file')
+    parser.add_argument('--report', help='also save the full report as JSON')
+    args = parser.parse_args()
+
+    report = check_dataset(args.data, args.splits.split(','), args.workers,
+                           use_manifest=not args.no_manifest)
+    print_check_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Report saved as: {args.report}")
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Near-Duplicate Image Detection
+
+Burst shots and video frames put many near-identical images into
+datasets/custom. They make epochs longer without adding information, and
+when they land in both train and val they leak. This script:
+
+1. computes 64-bit perceptual hashes (pHash, and dHash as an alternative)
+   across a process pool, using JPEG reduced decoding; hashes are cached in
+   <dataset root>/.image_hashes.npz and only recomputed for changed files
+2. finds all pairs within a Hamming radius with multi-index hashing: each
+   hash is cut into 16-bit chunks, and by the pigeonhole principle two hashes
+   within radius r share at least one chunk within radius r // chunks. Only
+   those candidates are compared, so there is no all-pairs comparison
+3. groups pairs into duplicate clusters (union-find), reports clusters within
+   a split and across splits (train/val leaks), and optionally writes
+   deduplicated image lists that data.yaml can point at
+
+Usage:
+    python dedup_images.py [--data data.yaml] [--radius 6] [--write-lists]
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import cv2
+import numpy as np
+
+from shard_dataset import list_split_images, load_dataset_config
+
+HASH_CACHE_VERSION = 1
+CHUNK_BITS = 16
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(values):
+    """Number of set bits of every uint64 value"""
+
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _bits_to_uint64(bits):
+    return np.packbits(bits.astype(np.uint8).ravel()).view('>u8')[0].astype(np.uint64)
+
+
+def image_hashes(path):
+    """Pool worker: (phash, dhash) of one image, or None if it can't be read"""
+
+    # Reduced decode lets libjpeg skip most of the work for the tiny hash inputs
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return None
+
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    phash = _bits_to_uint64(low > np.median(low[1:]))
+
+    tiny = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    dhash = _bits_to_uint64(tiny[:, 1:] > tiny[:, :-1])
+    return int(phash), int(dhash)
+
+
+def hash_cache_path(root):
+    return os.path.join(root, '.image_hashes.npz')
+
+
+def compute_hashes(image_paths, cache_path=None, workers=None, chunksize=64):
+    """Hashes of image_paths, cached by file size and mtime
+
+    Returns (paths, phashes, dhashes) for the images that could be read.
+    """
+
+    cached = {}
+    if cache_path and os.path.exists(cache_path):
+        data = np.load(cache_path, allow_pickle=False)
+        if int(data['version']) == HASH_CACHE_VERSION:
+            for path, size, mtime, phash, dhash in zip(data['paths'], data['sizes'],
+                                                       data['mtimes'], data['phashes'],
+                                                       data['dhashes']):
+                cached[str(path)] = (int(size), int(mtime), phash, dhash)
+
+    stats = {path: os.stat(path) for path in image_paths}
+    stale = [path for path in image_paths
+             if path not in cached or cached[path][:2] != (stats[path].st_size,
+                                                             stats[path].st_mtime_ns)]
+    if stale:
+        print(f"🔢 Hashing {len(stale)} images ({len(image_paths) - len(stale)} cached)")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, hashes in zip(stale, pool.map(image_hashes, stale, chunksize=chunksize)):
+                if hashes is None:
+                    print(f"⚠️  Could not read {path}, skipping")
+                    cached.pop(path, None)
+                    continue
+                cached[path] = (stats[path].st_size, stats[path].st_mtime_ns, *hashes)
+
+    paths = [path for path in image_paths if path in cached]
+    phashes = np.array([cached[path][2] for path in paths], dtype=np.uint64)
+    dhashes = np.array([cached[path][3] for path in paths], dtype=np.uint64)
+
+    # Keep entries for images outside this run (other folders sharing the
+    # cache); only drop files that no longer exist
+    requested = set(image_paths)
+    deleted = [path for path in cached if path not in requested and not os.path.exists(path)]
+    for path in deleted:
+        del cached[path]
+
+    if cache_path and (stale or deleted):
+        kept = list(cached)
+        np.savez(cache_path, version=HASH_CACHE_VERSION, paths=np.array(kept),
+                 sizes=np.array([cached[p][0] for p in kept], dtype=np.int64),
+                 mtimes=np.array([cached[p][1] for p in kept], dtype=np.int64),
+                 phashes=np.array([cached[p][2] for p in kept], dtype=np.uint64),
+                 dhashes=np.array([cached[p][3] for p in kept], dtype=np.uint64))
+    return paths, phashes, dhashes
+
+
+def _flip_masks(radius, bits=CHUNK_BITS):
+    """Every chunk-sized mask with at most radius bits set"""
+
+    masks = [0]
+    for count in range(1, radius + 1):
+        masks += [sum(1 << b for b in flipped) for flipped in combinations(range(bits), count)]
+    return np.array(masks, dtype=np.uint64)
+
+
+def near_duplicate_pairs(hashes, radius=6):
+    """(K, 2) array of image index pairs whose hashes are within Hamming distance radius
+
+    Multi-index hashing over four 16-bit chunks: candidates share a chunk up
+    to radius // 4 bit flips, and are verified with a full popcount.
+    Identical hashes are collapsed first, so large groups of exact duplicates
+    don't blow up the candidate count.
+    """
+
+    unique, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    chunks = 64 // CHUNK_BITS
+    masks = [int(mask) for mask in _flip_masks(radius // chunks)]
+
+    found = []
+    for c in range(chunks):
+        values = ((unique >> np.uint64(c * CHUNK_BITS)) & np.uint64((1 << CHUNK_BITS) - 1)) \
+            .astype(np.int64)
+        # Bucket the hashes by chunk value: bucket k is order[starts[k]:starts[k] + sizes[k]]
+        order = np.argsort(values, kind='stable')
+        sizes = np.bincount(values, minlength=1 << CHUNK_BITS)
+        starts = np.cumsum(sizes) - sizes
+        for mask in masks:
+            targets = values ^ mask
+            counts = sizes[targets]
+            a = np.repeat(np.arange(len(unique)), counts)
+            # Position of every match inside its bucket, without a Python loop
+            offsets = np.arange(len(a)) - np.repeat(np.cumsum(counts) - counts, counts)
+            b = order[np.repeat(starts[targets], counts) + offsets]
+            keep = a < b
+            a, b = a[keep], b[keep]
+            close = popcount64(unique[a] ^ unique[b]) <= radius
+            found.append(np.stack([a[close], b[close]], axis=1))
+
+    unique_pairs = np.unique(np.concatenate(found), axis=0)
+
+    # Back from unique hashes to images: the first image of each hash stands for
+    # it, and every other image with an identical hash is paired with it
+    inverse = inverse.ravel()
+    others = np.flatnonzero(np.arange(len(hashes)) != first[inverse])
+    identical = np.stack([first[inverse[others]], others], axis=1)
+    return np.concatenate([identical, first[unique_pairs]]).astype(np.int64)
+
+
+def cluster_pairs(count, pairs):
+    """Union-find over pairs; returns clusters (lists of indices) of size >= 2"""
+
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = defaultdict(list)
+    for i in range(count):
+        groups[find(i)].append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def find_duplicates(data='data.yaml', splits=('train', 'val'), radius=6, hash_type='phash',
+                    workers=None):
+    """Duplicate clusters of the dataset with the split of every member"""
+
+    config = load_dataset_config(data)
+    paths, splits_of = [], []
+    for split in splits:
+        split_paths = [os.path.abspath(path) for path in list_split_images(config, split)]
+        paths += split_paths
+        splits_of += [split] * len(split_paths)
+
+    hashed_paths, phashes, dhashes = compute_hashes(paths, hash_cache_path(config['root']),
+                                                    workers)
+    split_by_path = dict(zip(paths, splits_of))
+    hashes = phashes if hash_type == 'phash' else dhashes
+    pairs = near_duplicate_pairs(hashes, radius)
+
+    clusters = []
+    for members in cluster_pairs(len(hashed_paths), pairs):
+        images = [{'path': hashed_paths[i], 'split': split_by_path[hashed_paths[i]]}
+                  for i in members]
+        member_splits = sorted({image['split'] for image in images})
+        clusters.append({'images': images, 'splits': member_splits,
+                         'cross_split': len(member_splits) > 1})
+    clusters.sort(key=lambda cluster: -len(cluster['images']))
+    return {'root': config['root'], 'images': len(hashed_paths), 'radius': radius,
+            'hash': hash_type, 'clusters': clusters,
+            'paths_by_split': {split: [p for p in hashed_paths if split_by_path[p] == split]
+                               for split in splits}}
+
+
+def deduplicated_lists(report, eval_split='val'):
+    """Images to keep per split
+
+    Within a split one image per cluster is kept (the largest file, usually
+    the sharpest); images of other splits that duplicate an eval_split image
+    are dropped entirely so nothing leaks into evaluation.
+    """
+
+    drop = set()
+    for cluster in report['clusters']:
+        by_split = defaultdict(list)
+        for image in cluster['images']:
+            by_split[image['split']].append(image['path'])
+        for split, split_paths in by_split.items():
+            if eval_split in by_split and split != eval_split:
+                drop.update(split_paths)
+                continue
+            keep = max(split_paths, key=os.path.getsize)
+            drop.update(path for path in split_paths if path != keep)
+
+    return {split: [path for path in split_paths if path not in drop]
+            for split, split_paths in report['paths_by_split'].items()}
+
+
+def write_lists(report, lists):
+    """<root>/<split>_dedup.txt in ultralytics' image-list format ('./' = root)"""
+
+    written = {}
+    for split, paths in lists.items():
+        list_path = os.path.join(report['root'], f'{split}_dedup.txt')
+        with open(list_path, 'w') as f:
+            for path in paths:
+                f.write('./' + os.path.relpath(path, report['root']) + '\n')
+        written[split] = list_path
+    return written
+
+
+def print_duplicate_report(report, max_clusters=10):
+    clusters = report['clusters']
+    duplicates = sum(len(cluster['images']) - 1 for cluster in clusters)
+    cross = [cluster for cluster in clusters if cluster['cross_split']]
+    print(f"\n📊 Near-duplicates ({report['hash']}, radius {report['radius']}) "
+          f"in {report['images']} images:")
+    print(f"   {len(clusters)} clusters, {duplicates} redundant images "
+          f"({duplicates / max(report['images'], 1) * 100:.1f}%)")
+    print(f"   {len(cross)} clusters span several splits (possible train/val leak)")
+
+    for cluster in clusters[:max_clusters]:
+        label = '⚠️  cross-split' if cluster['cross_split'] else cluster['splits'][0]
+        print(f"\n   {len(cluster['images'])} images, {label}:")
+        for image in cluster['images'][:5]:
+            print(f"      [{image['split']}] {os.path.relpath(image['path'], report['root'])}")
+        if len(cluster['images']) > 5:
+            print(f"      ... and {len(cluster['images']) - 5} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find near-duplicate images in a dataset')
+    parser.add_argument('--data', default='data.yaml')
+    parser.add_argument('--splits', default='train,val')
+    parser.add_argument('--radius', type=int, default=6,
+                        help='max Hamming distance of 64-bit hashes (default: 6)')
+    parser.add_argument('--hash', choices=('phash', 'dhash'), default='phash')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--report', help='save all clusters as JSON')
+    parser.add_argument('--write-lists', action='store_true',
+                        help='write <split>_dedup.txt image lists into the dataset root')
+    args = parser.parse_args()
+
+    report = find_duplicates(args.data, args.splits.split(','), args.radius, args.hash,
+                             args.workers)
+    print_duplicate_report(report)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({key: value for key, value in report.items() if key != 'paths_by_split'},
+                      f, indent=2)
+        print(f"\n✅ Report saved as: {args.report}")
+
+    if args.write_lists:
+        lists = deduplicated_lists(report)
+        written = write_lists(report, lists)
+        print("\n✅ Deduplicated image lists:")
+        for split, list_path in written.items():
+            print(f"   {split}: {len(lists[split])} of {len(report['paths_by_split'][split])} "
+                  f"images -> {list_path}")
+        print("\n💡 To train on them, set in data.yaml:")
+        for split, list_path in written.items():
+            print(f"   {split}: {os.path.basename(list_path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Deploy Artifact for Fast Cold Start
+
+Loading best.pt unpickles a full training checkpoint (model class tree, EMA,
+train args), imports all of ultralytics and fuses Conv+BN on first predict.
+For short-lived jobs that is most of their runtime. The deploy artifact is
+built once per run:
+
+    best_deploy.torchscript      traced, Conv+BN fused, inference-only graph
+                                 with FP16-stored weights (computed in FP32)
+                                 and the class names / imgsz embedded
+
+DeployModel loads it with torch.jit.load only: ultralytics is never
+imported, cv2 is imported on first predict, and NMS runs in plain torch
+(torchvision alone takes longer to import than the model takes to load).
+The input size is fixed at export time (square letterbox to imgsz).
+
+ultralytics can load the artifact as well, so CUSTOM_MODEL_BACKEND=deploy
+works for every path in test_custom_model.py; the single image path uses
+DeployModel directly.
+
+Usage:
+    python deploy_artifact.py [--weights runs/custom/indoor_night2/weights/best.pt] [--image bus.jpg]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+from inference_metrics import get_metrics
+from model_registry import CUSTOM_MODEL_PATH, file_hash
+
+# Offset that separates classes for class-aware NMS (same as ultralytics)
+MAX_WH = 7680
+
+metrics = get_metrics()
+
+_PT_STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+from ultralytics import YOLO
+imported = time.perf_counter()
+model = YOLO(sys.argv[1])
+loaded = time.perf_counter()
+model(sys.argv[2], imgsz=int(sys.argv[3]), verbose=False)
+print(json.dumps({'import_s': imported - start, 'load_s': loaded - imported,
+                  'first_inference_s': time.perf_counter() - loaded}))
+"""
+
+_DEPLOY_STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+from deploy_artifact import load_artifact
+imported = time.perf_counter()
+model = load_artifact(sys.argv[1])
+loaded = time.perf_counter()
+model.predict(sys.argv[2])
+print(json.dumps({'import_s': imported - start, 'load_s': loaded - imported,
+                  'first_inference_s': time.perf_counter() - loaded}))
+"""
+
+
+def artifact_path(weights=CUSTOM_MODEL_PATH):
+    return f'{os.path.splitext(weights)[0]}_deploy.torchscript'
+
+
+def build_artifact(weights=CUSTOM_MODEL_PATH, imgsz=640, output=None):
+    """Trace the fused model and save it as a deploy artifact; returns its path"""
+
+    import torch
+    from ultralytics import YOLO
+
+    output = output or artifact_path(weights)
+    # ultralytics' TorchScript export fuses and traces the model; keep its file
+    # only if it was there before
+    exported_path = f'{os.path.splitext(weights)[0]}.torchscript'
+    existed = os.path.exists(exported_path)
+    exported = YOLO(weights).export(format='torchscript', imgsz=imgsz, verbose=False)
+
+    extra_files = {'config.txt': ''}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        module = torch.jit.load(exported, map_location='cpu', _extra_files=extra_files)
+    metadata = json.loads(extra_files['config.txt'])
+    metadata['source'] = os.path.basename(weights)
+    metadata['source_sha256'] = file_hash(weights)
+    # Checkpoints store FP16 weights too, so this loses nothing against best.pt
+    module.half()
+    torch.jit.save(module, output, _extra_files={'config.txt': json.dumps(metadata)})
+    if not existed and os.path.abspath(exported) != os.path.abspath(output):
+        os.remove(exported)
+    return output
+
+
+def read_metadata(path):
+    """Metadata embedded in a deploy artifact, without loading the model"""
+
+    import zipfile
+
+    with zipfile.ZipFile(path) as archive:
+        name = next(name for name in archive.namelist() if name.endswith('extra/config.txt'))
+        return json.loads(archive.read(name))
+
+
+def is_stale(path, weights):
+    """True if the artifact was not built from the current weights"""
+
+    return read_metadata(path).get('source_sha256') != file_hash(weights)
+
+
+def _nms(boxes, scores, iou, max_det=300):
+    """Greedy NMS in plain torch; returns up to max_det kept indices, best first
+
+    Only kept boxes are compared against the rest, so memory stays linear in
+    the number of candidates.
+    """
+
+    import torch
+
+    order = scores.argsort(descending=True)
+    boxes = boxes[order]
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    suppressed = torch.zeros(len(order), dtype=torch.bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        if len(keep) == max_det:
+            break
+        top_left = torch.max(boxes[i, :2], boxes[i + 1:, :2])
+        bottom_right = torch.min(boxes[i, 2:], boxes[i + 1:, 2:])
+        inter = (bottom_right - top_left).clamp(min=0).prod(1)
+        suppressed[i + 1:] |= inter / (area[i] + area[i + 1:] - inter + 1e-9) > iou
+    return order[keep]
+
+
+class DeployModel:
+    """Inference-only detector loaded from a deploy artifact"""
+
+    def __init__(self, path, device='cpu'):
+        import torch
+
+        extra_files = {'config.txt': ''}
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)
+            self.module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        self.module.float().eval()
+        self.metadata = json.loads(extra_files['config.txt'])
+        self.names = {int(k): v for k, v in self.metadata['names'].items()}
+        self.imgsz = self.metadata['imgsz'][0]
+        self.device = device
+        self.path = path
+
+    def predict(self, image, conf=0.25, iou=0.7, max_det=300):
+        """Detect objects in an image path or BGR array
+
+        Returns (Detections in original image coordinates, original image),
+        or None if the image cannot be read.
+        """
+
+        import cv2
+        import torch
+
+        from detections import Detections
+        from preprocess import prepare_image, scale_boxes_to_original
+
+        path = image if isinstance(image, str) else ''
+        with metrics.stage('decode'):
+            original = cv2.imread(image) if isinstance(image, str) else image
+        if original is None:
+            return None
+        with metrics.stage('preprocess'):
+            model_input, ratio_pad = prepare_image(original, self.imgsz)
+        with metrics.stage('forward'), torch.inference_mode():
+            output = self.module(torch.from_numpy(model_input)[None].to(self.device))
+        with metrics.stage('nms'):
+            boxes = self._postprocess(output[0].float().cpu(), conf, iou, max_det)
+        with metrics.stage('postprocess'):
+            boxes = scale_boxes_to_original(boxes.numpy(), ratio_pad, original.shape)
+            detections = Detections.from_array(boxes, self.names, [path])
+        return detections, original
+
+    def _postprocess(self, prediction, conf, iou, max_det):
+        """(N, 6) xyxy, conf, class rows from the raw output of one image"""
+
+        import torch
+
+        if self.metadata.get('end2end'):
+            # (max_det, 6) rows of xyxy, conf, class with NMS already applied
+            boxes = prediction[prediction[:, 4] > conf][:max_det]
+        else:
+            # (4 + classes, anchors): xywh boxes followed by class scores
+            prediction = prediction.T
+            scores, classes = prediction[:, 4:].max(1)
+            candidates = scores > conf
+            xywh, scores, classes = prediction[candidates, :4], scores[candidates], classes[candidates]
+            xyxy = torch.cat([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], 1)
+            keep = _nms(xyxy + classes[:, None].float() * MAX_WH, scores, iou, max_det)
+            boxes = torch.cat([xyxy[keep], scores[keep, None], classes[keep, None].float()], 1)
+        return boxes
+
+    __call__ = predict
+
+
+def load_artifact(path, device='cpu'):
+    return DeployModel(path, device)
+
+
+_artifacts = {}
+
+
+def get_artifact(path, device='cpu'):
+    """Shared DeployModel per artifact file and device, reloaded when the file changes"""
+
+    key = (os.path.abspath(path), os.stat(path).st_mtime_ns, str(device))
+    if key not in _artifacts:
+        _artifacts[key] = load_artifact(path, device)
+    return _artifacts[key]
+
+
+def draw_detections(image, detections):
+    """Draw boxes and labels onto a copy of a BGR image"""
+
+    import cv2
+
+    image = image.copy()
+    for (x1, y1, x2, y2), name, conf in zip(detections.xyxy.astype(int).tolist(),
+                                             detections.class_names, detections.conf.tolist()):
+        cv2.rectangle(image, (x1, y1), (x2, y2), (56, 56, 255), 2)
+        label = f'{name} {conf:.2f}'
+        (text_w, text_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        top = max(y1 - text_h - 4, 0)
+        cv2.rectangle(image, (x1, top), (x1 + text_w + 2, top + text_h + 4), (56, 56, 255), -1)
+        cv2.putText(image, label, (x1 + 1, top + text_h + 1), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+    return image
+
+
+def measure_startup(weights, artifact, image, imgsz=640, runs=3):
+    """Cold-start time of the .pt path and the deploy artifact, in fresh processes
+
+    Each run spawns a new interpreter that imports, loads the model and runs
+    one image; the median of every stage is reported.
+    """
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [here, os.environ.get('PYTHONPATH')])))
+    report = {}
+    for name, script, model_path in (('pt', _PT_STARTUP, weights),
+                                     ('deploy', _DEPLOY_STARTUP, artifact)):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', script, model_path, image, str(imgsz)],
+                                    capture_output=True, text=True, check=True, env=env)
+            sample = json.loads(output.stdout.strip().splitlines()[-1])
+            sample['total_s'] = time.perf_counter() - start
+            samples.append(sample)
+        report[name] = {key: statistics.median(sample[key] for sample in samples)
+                        for key in samples[0]}
+        report[name]['file_mb'] = os.path.getsize(model_path) / 1e6
+    report['speedup'] = report['pt']['total_s'] / report['deploy']['total_s']
+    return report
+
+
+def print_startup_report(report):
+    print(f"\n{'Path':<8} | {'File MB':>7} | {'Import':>7} | {'Load':>7} | {'1st image':>9} | "
+          f"{'Total':>7}")
+    print("-" * 62)
+    for name in ('pt', 'deploy'):
+        row = report[name]
+        print(f"{name:<8} | {row['file_mb']:7.1f} | {row['import_s']:6.2f}s | "
+              f"{row['load_s']:6.2f}s | {row['first_inference_s']:8.2f}s | {row['total_s']:6.2f}s")
+    print(f"\n⚡ Deploy artifact starts {report['speedup']:.1f}x faster")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a fast-loading deploy artifact')
+    parser.add_argument('--weights', default=CUSTOM_MODEL_PATH)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--output', help='default: <weights stem>_deploy.torchscript')
+    parser.add_argument('--image', default='bus.jpg', help='image for the startup benchmark')
+    parser.add_argument('--runs', type=int, default=3, help='cold starts per path')
+    parser.add_argument('--skip-bench', action='store_true')
+    parser.add_argument('--report', help='save the startup report as JSON')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        print(f"❌ Model {args.weights} not found!")
+        print("   Train your model first using: python train_custom.py")
+        return
+
+    print(f"📦 Building deploy artifact from {args.weights}...")
+    path = build_artifact(args.weights, args.imgsz, args.output)
+    print(f"✅ Deploy artifact: {path} ({os.path.getsize(path) / 1e6:.1f} MB, "
+          f".pt {os.path.getsize(args.weights) / 1e6:.1f} MB)")
+
+    if args.skip_bench:
+        return
+    if not os.path.exists(args.image):
+        print(f"❌ Image {args.image} not found!")
+        return
+
+    print(f"⏱️  Measuring cold start ({args.runs} runs per path)...")
+    report = measure_startup(args.weights, path, args.image, args.imgsz, args.runs)
+    print_startup_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report saved as: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Warm Detection Server
+
+Long-running detection daemon that keeps the custom and pre-trained models
+loaded, so requests don't pay for importing torch/ultralytics and loading
+weights.
+
+Requests arriving at the same time are batched dynamically: the first request
+opens a batch window of at most --max-wait-ms, and the batch runs as soon as
+it is full (--max-batch-size) or the window closes.
+
+Endpoints (localhost HTTP, or HTTP over a Unix socket with --unix-socket):
+    GET  /health                  -> loaded models and batching settings
+    GET  /metrics                 -> per-stage timings, Prometheus text format
+    GET  /metrics.json            -> the same as JSON (see inference_metrics.py)
+    POST /detect/<custom|pretrained>
+         body: raw image bytes, or JSON {"path": "image.jpg"}
+         -> {"model": ..., "detections": [...], "latency_ms": ...}
+
+Usage:
+    python detection_server.py --port 8000
+    curl --data-binary @tests/bus.jpg localhost:8000/detect/custom
+"""
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from detections import Detections
+from inference_metrics import get_metrics
+from model_registry import CUSTOM_MODEL_PATH, PRETRAINED_MODEL_PATH, get_model
+from preprocess import decode_image_bytes, prepare_image, scale_boxes_to_original
+
+metrics = get_metrics()
+
+MODEL_PATHS = {
+    'custom': CUSTOM_MODEL_PATH,
+    'pretrained': PRETRAINED_MODEL_PATH,
+}
+
+# Largest request body read into memory (an encoded image or a JSON path)
+MAX_BODY_BYTES = 50 * 1024 * 1024
+
+
+def detections_to_json(detections):
+    """Convert Detections into JSON-ready dicts"""
+
+    return [{
+        'class_id': row['class_id'],
+        'class_name': row['class_name'],
+        'confidence': round(row['conf'], 4),
+        'box': [round(row['x1'], 1), round(row['y1'], 1), round(row['x2'], 1), round(row['y2'], 1)],
+    } for row in detections.to_rows()]
+
+
+class DynamicBatcher:
+    """Collects concurrent requests for one model into batches"""
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=5, imgsz=640, conf=0.25):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.imgsz = imgsz
+        self.conf = conf
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, image):
+        """Queue a decoded BGR image; the returned future resolves to detections"""
+
+        future = Future()
+        # Letterboxing happens on the request thread, outside the batch loop
+        with metrics.stage('preprocess'):
+            prepared = prepare_image(image, self.imgsz)
+        self._requests.put((image, *prepared, future))
+        return future
+
+    def _collect(self):
+        batch = [self._requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                inputs = torch.from_numpy(np.stack([item[1] for item in batch]))
+                predictions = self.model(inputs, imgsz=self.imgsz, conf=self.conf, verbose=False)
+                metrics.record_speed(predictions, preprocess=False)
+            except Exception as e:
+                for item in batch:
+                    item[3].set_exception(e)
+                continue
+
+            for (original, _, ratio_pad, future), prediction in zip(batch, predictions):
+                # One bad item must not take down the only batcher thread
+                try:
+                    with metrics.stage('postprocess'):
+                        boxes = scale_boxes_to_original(prediction.boxes.data, ratio_pad,
+                                                        original.shape)
+                        result = Results(original, path='', names=self.model.names, boxes=boxes)
+                        response = detections_to_json(Detections.from_result(result))
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(response)
+
+
+class DetectionHandler(BaseHTTPRequestHandler):
+    """HTTP front end; self.server.batchers maps model name -> DynamicBatcher"""
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/health':
+            self._send_json(200, {
+                'status': 'ok',
+                'models': sorted(self.server.batchers),
+                'max_batch_size': self.server.max_batch_size,
+                'max_wait_ms': self.server.max_wait_ms,
+            })
+        elif self.path == '/metrics':
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/metrics.json':
+            self._send_json(200, metrics.snapshot())
+        else:
+            self._send_json(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'detect' or parts[1] not in self.server.batchers:
+            self._send_json(404, {'error': f'use /detect/<{"|".join(sorted(self.server.batchers))}>'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {'error': 'invalid Content-Length header'})
+            return
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {'error': f'body larger than {MAX_BODY_BYTES} bytes'})
+            return
+        body = self.rfile.read(length)
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                image_path = str(json.loads(body or b'{}').get('path', ''))
+            except (ValueError, AttributeError):
+                self._send_json(400, {'error': 'body must be a JSON object like {"path": ...}'})
+                return
+            if not os.path.exists(image_path):
+                self._send_json(400, {'error': f'image {image_path} not found'})
+                return
+            with open(image_path, 'rb') as f:
+                body = f.read()
+
+        image = decode_image_bytes(body)
+        if image is None:
+            self._send_json(400, {'error': 'could not decode image'})
+            return
+
+        try:
+            detections = self.server.batchers[parts[1]].submit(image).result(
+                timeout=self.server.request_timeout)
+        except TimeoutError:
+            metrics.count('errors')
+            self._send_json(504, {'error': f'no result within {self.server.request_timeout}s'})
+            return
+        except Exception as e:
+            metrics.count('errors')
+            self._send_json(500, {'error': str(e)})
+            return
+        metrics.observe_request(parts[1], time.perf_counter() - start)
+
+        self._send_json(200, {
+            'model': parts[1],
+            'detections': detections,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 2),
+        })
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def build_server(models, host='127.0.0.1', port=8000, unix_socket=None,
+                 max_batch_size=8, max_wait_ms=5, imgsz=640, conf=0.25, verbose=False,
+                 request_timeout=30.0):
+    """Load and warm up the models, then bind the HTTP server"""
+
+    batchers = {}
+    for name in models:
+        if name not in MODEL_PATHS:
+            print(f"⚠️  Unknown model '{name}', skipping")
+            continue
+        if name == 'custom' and not os.path.exists(CUSTOM_MODEL_PATH):
+            print(f"⚠️  Custom model not found at {CUSTOM_MODEL_PATH}, skipping")
+            continue
+        batchers[name] = DynamicBatcher(get_model(MODEL_PATHS[name]), max_batch_size,
+                                        max_wait_ms, imgsz, conf)
+
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, DetectionHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), DetectionHandler)
+
+    server.batchers = batchers
+    server.max_batch_size = max_batch_size
+    server.max_wait_ms = max_wait_ms
+    server.verbose = verbose
+    server.request_timeout = request_timeout
+    return server
+
+
+def main():
+    """Start the detection server"""
+
+    parser = argparse.ArgumentParser(description='Warm YOLO detection server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix-socket', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--models', default='custom,pretrained',
+                        help='comma-separated subset of: ' + ','.join(MODEL_PATHS))
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='seconds a request waits for its batch before failing')
+    args = parser.parse_args()
+
+    print("🚀 Starting detection server...")
+    server = build_server(args.models.split(','), args.host, args.port, args.unix_socket,
+                          args.max_batch_size, args.max_wait_ms, args.imgsz, args.conf,
+                          args.verbose, args.timeout)
+    if not server.batchers:
+        print("❌ No models loaded!")
+        return
+
+    address = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"✅ Serving {', '.join(sorted(server.batchers))} on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
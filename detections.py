@@ -0,0 +1,148 @@
+"""
+Vectorized Detections
+
+Compact container for model detections, backed by one contiguous NumPy
+structured array per image or batch. It is built with a single device-to-host
+transfer instead of int(box.cls[0]) / float(box.conf[0]) per box, which slices
+a tensor and syncs once for every box.
+
+    detections = Detections.from_results(results)
+    confident = detections.filter(min_conf=0.5, classes=['Bed', 'Lamp'])
+    for name, conf in zip(confident.class_names, confident.conf):
+        ...
+    print(confident.counts())
+"""
+
+import numpy as np
+import torch
+
+DETECTION_DTYPE = np.dtype([
+    ('x1', np.float32),
+    ('y1', np.float32),
+    ('x2', np.float32),
+    ('y2', np.float32),
+    ('conf', np.float32),
+    ('class_id', np.int32),
+    ('image_idx', np.int32),
+])
+
+_names_cache = {}
+
+
+def names_array(names):
+    """Class names as an array indexed by class id (built once per names dict)"""
+
+    cached = _names_cache.get(id(names))
+    if cached is None or cached[0] is not names:
+        if isinstance(names, dict):
+            size = max(names) + 1 if names else 0
+            array = np.array([str(names.get(i, i)) for i in range(size)], dtype=object)
+        else:
+            array = np.array([str(name) for name in names], dtype=object)
+        cached = _names_cache[id(names)] = (names, array)
+    return cached[1]
+
+
+class Detections:
+    """Detections of one image or a batch of images"""
+
+    def __init__(self, data, names, paths=()):
+        self.data = data
+        self.names = names
+        self.paths = list(paths)
+        self._names = names_array(names)
+
+    @classmethod
+    def from_results(cls, results):
+        """Build from a list of ultralytics Results in one transfer"""
+
+        results = list(results)
+        names = results[0].names if results else {}
+        chunks = []
+        for image_idx, result in enumerate(results):
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            boxes = result.boxes.data[:, :6]
+            index = torch.full((len(boxes), 1), image_idx, dtype=boxes.dtype, device=boxes.device)
+            chunks.append(torch.cat([boxes, index], dim=1))
+
+        data = np.zeros(0, dtype=DETECTION_DTYPE)
+        if chunks:
+            raw = torch.cat(chunks).float().cpu().numpy()
+            data = np.empty(len(raw), dtype=DETECTION_DTYPE)
+            for column, field in enumerate(DETECTION_DTYPE.names):
+                data[field] = raw[:, column]
+        return cls(data, names, [result.path for result in results])
+
+    @classmethod
+    def from_array(cls, boxes, names, paths=()):
+        """Build from an (N, 6) xyxy, conf, class array of one image"""
+
+        data = np.zeros(len(boxes), dtype=DETECTION_DTYPE)
+        for column, field in enumerate(DETECTION_DTYPE.names[:6]):
+            data[field] = boxes[:, column]
+        return cls(data, names, paths)
+
+    @classmethod
+    def from_result(cls, result):
+        return cls.from_results([result])
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def xyxy(self):
+        return np.stack([self.data['x1'], self.data['y1'], self.data['x2'], self.data['y2']], axis=1)
+
+    @property
+    def conf(self):
+        return self.data['conf']
+
+    @property
+    def class_ids(self):
+        return self.data['class_id']
+
+    @property
+    def class_names(self):
+        return self._names[self.data['class_id']]
+
+    def _subset(self, mask):
+        return Detections(self.data[mask], self.names, self.paths)
+
+    def filter(self, min_conf=None, classes=None):
+        """Keep detections above min_conf and/or in classes (ids or names)"""
+
+        mask = np.ones(len(self.data), dtype=bool)
+        if min_conf is not None:
+            mask &= self.data['conf'] >= min_conf
+        if classes is not None:
+            class_ids = [int(np.flatnonzero(self._names == c)[0]) if isinstance(c, str) else int(c)
+                         for c in classes if not isinstance(c, str) or c in self._names]
+            mask &= np.isin(self.data['class_id'], class_ids)
+        return self._subset(mask)
+
+    def for_image(self, image_idx):
+        return self._subset(self.data['image_idx'] == image_idx)
+
+    def counts(self):
+        """Number of detections per class name, most frequent first"""
+
+        counts = np.bincount(self.data['class_id'], minlength=len(self._names))
+        order = np.argsort(-counts, kind='stable')
+        return {self._names[i]: int(counts[i]) for i in order if counts[i]}
+
+    def to_rows(self):
+        """Row dicts (image, class_id, class_name, conf, x1, y1, x2, y2)"""
+
+        paths = np.array(self.paths, dtype=object)
+        columns = {
+            'image': paths[self.data['image_idx']].tolist() if len(paths) else [None] * len(self),
+            'class_id': self.data['class_id'].tolist(),
+            'class_name': self.class_names.tolist(),
+            'conf': self.data['conf'].tolist(),
+            'x1': self.data['x1'].tolist(),
+            'y1': self.data['y1'].tolist(),
+            'x2': self.data['x2'].tolist(),
+            'y2': self.data['y2'].tolist(),
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
@@ -0,0 +1,267 @@
+"""
+CPU Inference Backends: ONNX Runtime / OpenVINO with INT8 Calibration
+
+Exports the trained indoor_night weights for faster CPU inference:
+
+    best.onnx                    FP32 ONNX (ultralytics export)
+    best_int8.onnx               static INT8 ONNX, calibrated with ONNX Runtime
+                                 on the validation images
+    best_int8_openvino_model/    INT8 OpenVINO IR (ultralytics export + NNCF),
+                                 only when openvino is installed
+
+Every exported model is then checked against the .pt model: mAP from
+model.val() and CPU latency/throughput over the validation images.
+
+Run the exported model from test_custom_model.py with
+CUSTOM_MODEL_BACKEND=onnx | onnx-int8 | openvino-int8.
+
+Usage:
+    python export_backend.py [--weights runs/custom/indoor_night2/weights/best.pt]
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+import yaml
+
+from model_registry import CUSTOM_MODEL_PATH
+from preprocess import IMAGE_EXTENSIONS, load_and_letterbox
+
+BACKENDS = ('pt', 'onnx', 'onnx-int8', 'openvino-int8', 'deploy')
+
+
+def backend_paths(weights=CUSTOM_MODEL_PATH):
+    """Where each backend's exported model lives for a given .pt file"""
+
+    stem = os.path.splitext(weights)[0]
+    return {
+        'pt': weights,
+        'onnx': f'{stem}.onnx',
+        'onnx-int8': f'{stem}_int8.onnx',
+        'openvino-int8': f'{stem}_int8_openvino_model',
+        'deploy': f'{stem}_deploy.torchscript',
+    }
+
+
+def custom_model_path(backend='pt', weights=CUSTOM_MODEL_PATH):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', choose from {', '.join(BACKENDS)}")
+    return backend_paths(weights)[backend]
+
+
+def val_image_dir(data='data.yaml'):
+    """Validation image directory from a dataset yaml"""
+
+    with open(data) as f:
+        config = yaml.safe_load(f)
+    return os.path.join(config.get('path', ''), config['val'])
+
+
+def list_images(image_dir, limit=None):
+    images = sorted(path for path in glob.glob(os.path.join(image_dir, '*'))
+                    if path.lower().endswith(IMAGE_EXTENSIONS))
+    return images[:limit] if limit else images
+
+
+def export_onnx(weights, imgsz=640):
+    """Static-shape FP32 ONNX export (static shapes are needed for calibration)"""
+
+    from ultralytics import YOLO
+
+    return YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True)
+
+
+class LetterboxCalibrationReader:
+    """Feeds letterboxed validation images to ONNX Runtime's calibrator"""
+
+    def __init__(self, input_name, image_paths, imgsz):
+        self.input_name = input_name
+        self.image_paths = iter(image_paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for image_path in self.image_paths:
+            loaded = load_and_letterbox(image_path, self.imgsz)
+            if loaded is not None:
+                return {self.input_name: loaded[1][None]}
+        return None
+
+    def rewind(self):
+        pass
+
+
+def _head_node_prefix(onnx_model):
+    """Node name prefix of the Detect head (the highest /model.N/ block)"""
+
+    indices = [int(m.group(1)) for node in onnx_model.graph.node
+               for m in [re.match(r'/model\.(\d+)/', node.name)] if m]
+    return f'/model.{max(indices)}/' if indices else None
+
+
+def quantize_onnx_int8(onnx_path, calibration_images, imgsz=640):
+    """Static INT8 post-training quantization of an exported ONNX model
+
+    The Detect head (box decoding, DFL, concat) stays in FP32; quantizing it
+    costs most of the accuracy and little of the time.
+    """
+
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod,
+                                          QuantFormat, QuantType, quantize_static)
+
+    class Reader(LetterboxCalibrationReader, CalibrationDataReader):
+        pass
+
+    output_path = onnx_path.replace('.onnx', '_int8.onnx')
+    fp32_model = onnx.load(onnx_path)
+    input_name = onnxruntime.InferenceSession(
+        onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    head_prefix = _head_node_prefix(fp32_model)
+    nodes_to_exclude = [node.name for node in fp32_model.graph.node
+                        if head_prefix and node.name.startswith(head_prefix)]
+
+    quantize_static(
+        onnx_path,
+        output_path,
+        Reader(input_name, calibration_images, imgsz),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        nodes_to_exclude=nodes_to_exclude,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+
+    # Keep the ultralytics metadata (names, stride, imgsz) so YOLO() can load it
+    int8_model = onnx.load(output_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, output_path)
+    return output_path
+
+
+def export_openvino_int8(weights, data='data.yaml', imgsz=640):
+    """INT8 OpenVINO IR via ultralytics (NNCF calibration on the val split)"""
+
+    try:
+        import openvino  # noqa: F401
+    except ImportError:
+        print("⚠️  openvino not installed, skipping OpenVINO export (pip install openvino nncf)")
+        return None
+
+    from ultralytics import YOLO
+
+    return YOLO(weights).export(format='openvino', imgsz=imgsz, int8=True, data=data)
+
+
+def measure_speed(weights, image_paths, imgsz=640, warmup=3):
+    """Median single-image latency and throughput on CPU"""
+
+    from ultralytics import YOLO
+
+    model = YOLO(weights, task='detect')
+    for image_path in image_paths[:warmup]:
+        model(image_path, imgsz=imgsz, device='cpu', verbose=False)
+
+    latencies = []
+    for image_path in image_paths:
+        start = time.perf_counter()
+        model(image_path, imgsz=imgsz, device='cpu', verbose=False)
+        latencies.append(time.perf_counter() - start)
+    return {
+        'latency_ms': float(np.median(latencies) * 1000),
+        'throughput_ips': len(latencies) / float(sum(latencies)),
+    }
+
+
+def measure_accuracy(weights, data='data.yaml', imgsz=640):
+    from ultralytics import YOLO
+
+    # Exported static models only accept batch=1
+    metrics = YOLO(weights, task='detect').val(data=data, imgsz=imgsz, batch=1, device='cpu',
+                                               plots=False, verbose=False)
+    return {'map50': float(metrics.box.map50), 'map50_95': float(metrics.box.map)}
+
+
+def evaluate_backends(paths, data='data.yaml', imgsz=640, speed_images=50):
+    """Accuracy and speed for every available backend, relative to .pt"""
+
+    image_paths = list_images(val_image_dir(data), limit=speed_images)
+    report = {}
+    for backend, path in paths.items():
+        if not path or not os.path.exists(path):
+            continue
+        print(f"\n📏 Evaluating {backend}: {path}")
+        report[backend] = {'path': path, **measure_accuracy(path, data, imgsz),
+                           **measure_speed(path, image_paths, imgsz)}
+
+    reference = report.get('pt')
+    if reference:
+        for backend, row in report.items():
+            row['map50_95_delta'] = row['map50_95'] - reference['map50_95']
+            row['speedup'] = row['throughput_ips'] / reference['throughput_ips']
+    return report
+
+
+def print_backend_report(report):
+    print(f"\n{'Backend':<15} | {'mAP50-95':>8} | {'Delta':>7} | {'Latency':>9} | {'Speedup':>7}")
+    print("-" * 60)
+    for backend, row in report.items():
+        print(f"{backend:<15} | {row['map50_95']:8.4f} | {row.get('map50_95_delta', 0):+7.4f} | "
+              f"{row['latency_ms']:6.1f} ms | {row.get('speedup', 1):6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the custom model for fast CPU inference')
+    parser.add_argument('--weights', default=CUSTOM_MODEL_PATH)
+    parser.add_argument('--data', default='data.yaml')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--calibration-images', type=int, default=300,
+                        help='number of val images used for INT8 calibration')
+    parser.add_argument('--skip-openvino', action='store_true')
+    parser.add_argument('--skip-eval', action='store_true')
+    parser.add_argument('--report', default='backend_report.json')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        print(f"❌ Model {args.weights} not found!")
+        print("   Train your model first using: python train_custom.py")
+        return
+
+    calibration_images = list_images(val_image_dir(args.data), limit=args.calibration_images)
+    if not calibration_images:
+        print(f"❌ No validation images found for calibration ({val_image_dir(args.data)})")
+        return
+
+    print("📦 Exporting ONNX model...")
+    paths = {'pt': args.weights, 'onnx': export_onnx(args.weights, args.imgsz)}
+
+    print(f"🔢 Quantizing ONNX model to INT8 with {len(calibration_images)} calibration images...")
+    paths['onnx-int8'] = quantize_onnx_int8(paths['onnx'], calibration_images, args.imgsz)
+
+    if not args.skip_openvino:
+        print("📦 Exporting INT8 OpenVINO model...")
+        paths['openvino-int8'] = export_openvino_int8(args.weights, args.data, args.imgsz)
+
+    for backend, path in paths.items():
+        if path:
+            print(f"✅ {backend}: {path}")
+
+    if args.skip_eval:
+        return
+
+    report = evaluate_backends(paths, args.data, args.imgsz)
+    print_backend_report(report)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report saved as: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Shared Preprocessed Image Cache for Training
+
+CPU training here is dominated by JPEG decode: with cache=False every epoch of
+every experiment decodes every image again. This cache stores each image once,
+decoded and resized the way ultralytics does it (long side = imgsz), in a
+memory-mapped uint8 file that all experiments and dataloader workers share.
+
+Layout (default: datasets/.image_cache/imgsz640/):
+    images.u8        raw uint8 slots of shape (imgsz, imgsz, 3); an image
+                     occupies the top-left (h, w) corner of its slot
+    manifest.json    content hash -> slot, slot shapes, stat memo, and the
+                     content hashes that failed to decode
+
+Slots are addressed by image content hash, so an edited image gets a new slot
+on the next run and unchanged images are never decoded again. Images are
+hashed only when their size or mtime changes, and unreadable images are
+remembered so they don't take a slot on every run.
+
+Slots of edited or deleted images stay in images.u8 until the cache is
+compacted, which rewrites it with only the images still on disk. Run it while
+no training is using the cache:
+    python image_cache.py --compact
+
+Usage from a training script:
+    model.train(data='data.yaml', trainer=CachedDetectionTrainer, ...)
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+
+DEFAULT_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', 'datasets/.image_cache')
+
+
+def content_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resize_long_side(image, imgsz):
+    """Same resize as ultralytics' BaseDataset.load_image in rect mode"""
+
+    h0, w0 = image.shape[:2]
+    ratio = imgsz / max(h0, w0)
+    if ratio != 1:
+        w, h = min(math.ceil(w0 * ratio), imgsz), min(math.ceil(h0 * ratio), imgsz)
+        image = cv2.resize(image, (w, h), interpolation=cv2.INTER_LINEAR)
+    return image
+
+
+class CachedImages:
+    """Read-only view of one dataset in the cache; safe to pass to workers"""
+
+    def __init__(self, data_path, slots, shapes, imgsz):
+        self.data_path = data_path
+        self.slots = slots
+        self.shapes = shapes  # per slot: h, w, h0, w0
+        self.imgsz = imgsz
+        self._images = None
+
+    def __getstate__(self):
+        # Don't pickle the memory map itself, workers re-open it
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def _open(self):
+        if self._images is None:
+            slot_bytes = self.imgsz * self.imgsz * 3
+            count = os.path.getsize(self.data_path) // slot_bytes
+            self._images = np.memmap(self.data_path, dtype=np.uint8, mode='r',
+                                     shape=(count, self.imgsz, self.imgsz, 3))
+        return self._images
+
+    def __len__(self):
+        return len(self.slots)
+
+    def get(self, index):
+        """Image index i of the dataset -> (image, (h0, w0), (h, w))"""
+
+        slot = self.slots[index]
+        h, w, h0, w0 = self.shapes[slot]
+        # Copy out of the read-only map, augmentations modify images in place
+        image = np.array(self._open()[slot, :h, :w])
+        return image, (int(h0), int(w0)), (int(h), int(w))
+
+
+class ImageCache:
+    """Content-addressed store of resized images for one imgsz"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, imgsz=640):
+        self.imgsz = imgsz
+        self.root = os.path.join(cache_dir, f'imgsz{imgsz}')
+        self.data_path = os.path.join(self.root, 'images.u8')
+        self.manifest_path = os.path.join(self.root, 'manifest.json')
+        self.slot_bytes = imgsz * imgsz * 3
+        os.makedirs(self.root, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock so concurrent experiments don't corrupt the cache"""
+
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            manifest.setdefault('failed', [])
+            return manifest
+        return {'slots': {}, 'shapes': [], 'stat_memo': {}, 'failed': []}
+
+    def _save_manifest(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _hash_images(self, image_files, stat_memo, workers):
+        """Content hash of every image, re-hashing only files whose stat changed"""
+
+        def hash_one(path):
+            stat = os.stat(path)
+            memo = stat_memo.get(path)
+            if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+                return path, memo
+            return path, [stat.st_size, stat.st_mtime_ns, content_hash(path)]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, memo in pool.map(hash_one, image_files):
+                stat_memo[path] = memo
+        return [stat_memo[path][2] for path in image_files]
+
+    def _decode(self, path):
+        image = cv2.imread(path)
+        if image is None:
+            return None
+        h0, w0 = image.shape[:2]
+        return resize_long_side(image, self.imgsz), h0, w0
+
+    def prepare(self, image_files, workers=8):
+        """Make sure every image is cached and return a CachedImages view"""
+
+        image_files = [os.path.abspath(path) for path in image_files]
+        with self._locked():
+            manifest = self._load_manifest()
+            hashes = self._hash_images(image_files, manifest['stat_memo'], workers)
+
+            failed = set(manifest['failed'])
+            missing = {}
+            for path, digest in zip(image_files, hashes):
+                if digest not in manifest['slots'] and digest not in failed:
+                    missing.setdefault(digest, path)
+
+            if missing:
+                print(f"🗃️  Caching {len(missing)} new images at imgsz={self.imgsz} "
+                      f"({len(set(hashes)) - len(missing)} already cached)")
+                first_slot = len(manifest['shapes'])
+                total_slots = first_slot + len(missing)
+                with open(self.data_path, 'ab') as f:
+                    f.truncate(total_slots * self.slot_bytes)
+                images = np.memmap(self.data_path, dtype=np.uint8, mode='r+',
+                                   shape=(total_slots, self.imgsz, self.imgsz, 3))
+
+                # Slots are handed out only to images that decoded
+                slot = first_slot
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for digest, decoded in zip(missing, pool.map(self._decode, missing.values())):
+                        if decoded is None:
+                            print(f"⚠️  Could not read {missing[digest]}, not caching it")
+                            manifest['failed'].append(digest)
+                            continue
+                        image, h0, w0 = decoded
+                        h, w = image.shape[:2]
+                        images[slot, :h, :w] = image
+                        manifest['shapes'].append([h, w, h0, w0])
+                        manifest['slots'][digest] = slot
+                        slot += 1
+                images.flush()
+                del images
+                if slot < total_slots:
+                    with open(self.data_path, 'r+b') as f:
+                        f.truncate(slot * self.slot_bytes)
+            self._save_manifest(manifest)
+
+            slots = np.array([manifest['slots'].get(digest, -1) for digest in hashes],
+                             dtype=np.int64)
+            shapes = np.array(manifest['shapes'], dtype=np.int64).reshape(-1, 4)
+
+        return CachedImages(self.data_path, slots, shapes, self.imgsz)
+
+    def compact(self):
+        """Rewrite images.u8 with only the images still on disk unchanged
+
+        Drops slots of edited and deleted images. Readers that already mapped
+        the old file keep working, but slot numbers change, so don't run this
+        while training from the cache. Returns (slots kept, slots dropped).
+        """
+
+        with self._locked():
+            manifest = self._load_manifest()
+            live = set()
+            for path, (size, mtime_ns, digest) in list(manifest['stat_memo'].items()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    stat = None
+                if stat is None or (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                    del manifest['stat_memo'][path]
+                    continue
+                live.add(digest)
+
+            keep = sorted((slot, digest) for digest, slot in manifest['slots'].items()
+                          if digest in live)
+            dropped = len(manifest['shapes']) - len(keep)
+            if dropped:
+                old = np.memmap(self.data_path, dtype=np.uint8, mode='r',
+                                shape=(len(manifest['shapes']), self.imgsz, self.imgsz, 3))
+                tmp_path = self.data_path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    for slot, _ in keep:
+                        f.write(old[slot].tobytes())
+                del old
+                os.replace(tmp_path, self.data_path)
+
+            manifest['shapes'] = [manifest['shapes'][slot] for slot, _ in keep]
+            manifest['slots'] = {digest: new for new, (_, digest) in enumerate(keep)}
+            manifest['failed'] = [digest for digest in manifest['failed'] if digest in live]
+            self._save_manifest(manifest)
+        return len(keep), dropped
+
+
+class CachedYOLODataset(YOLODataset):
+    """YOLODataset that reads images from the shared cache when it can"""
+
+    cached_images = None
+
+    def load_image(self, i, rect_mode=True, resize_short=False):
+        cached = self.cached_images
+        if (cached is None or not rect_mode or resize_short or cached.slots[i] < 0
+                or self.ims[i] is not None):
+            return super().load_image(i, rect_mode, resize_short)
+
+        im, hw0, hw = cached.get(i)
+        # Same buffer bookkeeping as BaseDataset.load_image, mosaic samples from it
+        if self.augment and self.cache != 'ram':
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, hw0, hw
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, hw0, hw
+
+
+class CachedDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer whose datasets read images from the shared ImageCache"""
+
+    cache_dir = DEFAULT_CACHE_DIR
+
+    def build_dataset(self, img_path, mode='train', batch=None):
+        dataset = super().build_dataset(img_path, mode, batch)
+        if type(dataset) is not YOLODataset:
+            print(f"⚠️  Image cache not supported for {type(dataset).__name__}, decoding from disk")
+            return dataset
+
+        cache = ImageCache(self.cache_dir, dataset.imgsz)
+        dataset.__class__ = CachedYOLODataset
+        dataset.cached_images = cache.prepare(dataset.im_files)
+        return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the shared preprocessed image cache')
+    parser.add_argument('--compact', action='store_true',
+                        help='drop slots of edited or deleted images')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--imgsz', type=int, nargs='*',
+                        help='image sizes to compact (default: every imgsz in the cache)')
+    args = parser.parse_args()
+
+    if not args.compact:
+        parser.print_help()
+        return
+    names = os.listdir(args.cache_dir) if os.path.isdir(args.cache_dir) else []
+    sizes = args.imgsz or sorted(int(name[5:]) for name in names
+                                 if name.startswith('imgsz') and name[5:].isdigit())
+    if not sizes:
+        print(f"❌ No image cache found in {args.cache_dir}")
+        return
+    for imgsz in sizes:
+        kept, dropped = ImageCache(args.cache_dir, imgsz).compact()
+        print(f"🗃️  imgsz={imgsz}: kept {kept} images, dropped {dropped} stale slots")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+Object-Size-Driven imgsz Advisor
+
+Compute grows with imgsz^2, so 320 costs about a quarter of 640. Whether that
+is safe depends on how many pixels the objects still get. This script:
+
+1. measures every labelled box in pixels (normalized YOLO boxes from the
+   annotation index x image dimensions from the image headers) and prints
+   per-class size distributions, plus the share of boxes whose short side
+   would drop below min_object_px at every candidate imgsz
+2. evaluates the model on the val split at every candidate imgsz (cached
+   through incremental_validation.py, so re-running is cheap) and computes
+   per-class recall at the deployment conf threshold
+3. recommends the smallest imgsz whose recall stays within tolerance of the
+   largest candidate for every class with enough instances, and whether
+   rect (minimal padding instead of a square canvas) would save further
+   compute for the dataset's aspect ratios
+
+Usage:
+    python imgsz_advisor.py [--weights best.pt] [--candidates 320,416,512,640]
+    python imgsz_advisor.py --sizes-only    # box size statistics, no model
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from annotation_index import build_index
+from incremental_validation import (DEFAULT_CACHE_DIR, PredictionCache, evaluate,
+                                    filter_predictions, load_ground_truth, match_predictions)
+from model_registry import CUSTOM_MODEL_PATH
+from shard_dataset import label_path_for, list_split_images, load_dataset_config
+
+DEFAULT_CANDIDATES = (320, 416, 512, 640)
+MIN_OBJECT_PX = 10  # short side at model input below which objects are rarely found
+STRIDE = 32
+
+
+def _image_size(path):
+    """(width, height) after EXIF rotation, from the image header only"""
+
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            if image.getexif().get(0x0112) in (5, 6, 7, 8):  # rotated by 90 degrees
+                width, height = height, width
+            return width, height
+    except Exception:
+        return None
+
+
+def read_image_sizes(image_paths, cache_path=None, workers=16):
+    """path -> (width, height), cached by file size and mtime"""
+
+    cached = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cached = json.load(f)
+
+    sizes, stale = {}, []
+    for path in image_paths:
+        stat = os.stat(path)
+        entry = cached.get(path)
+        if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            sizes[path] = tuple(entry[2:])
+        else:
+            stale.append((path, stat))
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for (path, stat), size in zip(stale, pool.map(_image_size,
+                                                           [path for path, _ in stale])):
+                if size is None:
+                    print(f"⚠️  Could not read {path}, skipping")
+                    continue
+                sizes[path] = size
+                cached[path] = [stat.st_size, stat.st_mtime_ns, *size]
+        if cache_path:
+            with open(cache_path + '.tmp', 'w') as f:
+                json.dump(cached, f)
+            os.replace(cache_path + '.tmp', cache_path)
+    return sizes
+
+
+def box_pixel_sizes(data='data.yaml', splits=('train', 'val')):
+    """Every labelled box in pixels: dict of class_id, width, height, long side of its image"""
+
+    config = load_dataset_config(data)
+    index = build_index(config['root'], splits=splits)
+    image_paths = [path for split in splits for path in list_split_images(config, split)]
+    sizes = read_image_sizes(image_paths, os.path.join(index.index_dir, 'image_sizes.json'))
+
+    # Image width/height for every row of the index (nan if the image is missing)
+    widths = np.full(len(index), np.nan, dtype=np.float32)
+    heights = np.full(len(index), np.nan, dtype=np.float32)
+    for path, (width, height) in sizes.items():
+        image_idx = index.image_idx(label_path_for(path))
+        if image_idx is not None:
+            widths[image_idx], heights[image_idx] = width, height
+
+    boxes = index.boxes
+    image_w, image_h = widths[boxes['image_idx']], heights[boxes['image_idx']]
+    known = ~np.isnan(image_w)
+    image_w, image_h = image_w[known], image_h[known]
+    return {
+        'names': config['names'],
+        'class_id': np.asarray(boxes['class_id'][known]),
+        'width': np.asarray(boxes['w'][known]) * image_w,
+        'height': np.asarray(boxes['h'][known]) * image_h,
+        'image_long_side': np.maximum(image_w, image_h),
+        'aspect': np.minimum(widths, heights)[~np.isnan(widths)] /
+                  np.maximum(widths, heights)[~np.isnan(widths)],
+    }
+
+
+def size_report(sizes, candidates=DEFAULT_CANDIDATES, min_object_px=MIN_OBJECT_PX):
+    """Per-class box size percentiles and the share of too-small boxes per imgsz"""
+
+    names = sizes['names']
+    short_side = np.minimum(sizes['width'], sizes['height'])
+    report = {}
+    for class_id in np.unique(sizes['class_id']):
+        mask = sizes['class_id'] == class_id
+        area_side = np.sqrt(sizes['width'][mask] * sizes['height'][mask])
+        p5, p50, p95 = np.percentile(area_side, [5, 50, 95])
+        report[names.get(int(class_id), str(class_id))] = {
+            'instances': int(mask.sum()),
+            'size_p5': float(p5), 'size_p50': float(p50), 'size_p95': float(p95),
+            # Share of boxes whose short side shrinks below min_object_px at imgsz
+            'too_small': {int(imgsz): float(np.mean(
+                short_side[mask] * imgsz / sizes['image_long_side'][mask] < min_object_px))
+                for imgsz in candidates},
+        }
+    return report
+
+
+def rect_compute(aspects, imgsz):
+    """Mean input area with rect padding relative to a square imgsz canvas"""
+
+    if not len(aspects):
+        return 1.0
+    short = np.ceil(aspects * imgsz / STRIDE) * STRIDE
+    return float(np.mean(np.minimum(short, imgsz) / imgsz))
+
+
+def recall_per_class(predictions, ground_truth, conf=0.25, nms_iou=0.7, iou_threshold=0.5):
+    """(true positives, instances) per class id at the deployment conf threshold"""
+
+    tp, instances = {}, {}
+    for path, entry in predictions.items():
+        boxes = filter_predictions(entry['boxes'], conf, nms_iou)
+        labels = ground_truth[path]
+        correct = match_predictions(boxes, labels, np.array([iou_threshold]))[:, 0]
+        for class_id in boxes[correct, 5].astype(int):
+            tp[class_id] = tp.get(class_id, 0) + 1
+        for class_id in labels[:, 0].astype(int):
+            instances[class_id] = instances.get(class_id, 0) + 1
+    return tp, instances
+
+
+def advise(weights=CUSTOM_MODEL_PATH, data='data.yaml', candidates=DEFAULT_CANDIDATES,
+           tolerance=0.02, conf=0.25, min_instances=10, min_object_px=MIN_OBJECT_PX,
+           cache_dir=DEFAULT_CACHE_DIR, measure=True):
+    """Evaluate every candidate imgsz and pick the smallest safe one"""
+
+    candidates = sorted(set(candidates))
+    config = load_dataset_config(data)
+    names = config['names']
+    sizes = box_pixel_sizes(data)
+    image_paths = [os.path.abspath(path) for path in list_split_images(config, 'val')]
+    if not image_paths:
+        raise FileNotFoundError(f"No images in the 'val' split of {data}")
+
+    rows = []
+    for imgsz in candidates:
+        print(f"\n🔍 imgsz={imgsz}")
+        predictions = PredictionCache(weights, cache_dir, imgsz).predict(image_paths)
+        ground_truth = load_ground_truth(predictions)
+        metrics = evaluate(predictions, ground_truth, names)
+        tp, instances = recall_per_class(predictions, ground_truth, conf)
+        row = {
+            'imgsz': imgsz,
+            'relative_compute': (imgsz / candidates[-1]) ** 2,
+            'rect_compute': rect_compute(sizes['aspect'], imgsz),
+            'map50': metrics['map50'], 'map50_95': metrics['map50_95'],
+            'recall': sum(tp.values()) / max(sum(instances.values()), 1),
+            'classes': {names.get(class_id, str(class_id)): {
+                'instances': count, 'recall': tp.get(class_id, 0) / count}
+                for class_id, count in sorted(instances.items())},
+        }
+        if measure:
+            from cascade import measure_latency
+            row['latency_ms'] = measure_latency(weights, image_paths, imgsz, runs=8) * 1000
+        rows.append(row)
+
+    # A candidate is safe if no class with enough instances loses more than tolerance
+    baseline = rows[-1]['classes']
+    checked = {name: row for name, row in baseline.items() if row['instances'] >= min_instances}
+    for row in rows:
+        row['worst_drop'] = max((baseline[name]['recall'] - row['classes'].get(
+            name, {'recall': 0.0})['recall'] for name in checked), default=0.0)
+        row['safe'] = row['worst_drop'] <= tolerance
+    recommended = next(row for row in rows if row['safe'])
+
+    # Smallest safe imgsz per class, to see which classes hold the resolution up
+    per_class = {}
+    for name in checked:
+        per_class[name] = next(
+            row['imgsz'] for row in rows
+            if baseline[name]['recall'] - row['classes'].get(name, {'recall': 0.0})['recall']
+            <= tolerance)
+
+    # Rect doesn't change the object scale, only the padding, so recall carries over
+    rect_saving = 1 - recommended['rect_compute']
+    return {
+        'weights': weights, 'data': data, 'conf': conf, 'tolerance': tolerance,
+        'min_instances': min_instances, 'candidates': rows,
+        'sizes': size_report(sizes, candidates, min_object_px),
+        'min_object_px': min_object_px, 'per_class_min_imgsz': per_class,
+        'recommended': {'imgsz': recommended['imgsz'], 'rect': rect_saving >= 0.1,
+                        'compute': recommended['relative_compute'] *
+                                   (recommended['rect_compute'] if rect_saving >= 0.1 else 1.0)},
+    }
+
+
+def print_size_report(report, min_object_px=MIN_OBJECT_PX):
+    candidates = list(next(iter(report.values()))['too_small']) if report else []
+    print(f"\n📐 Box sizes in pixels (sqrt(w*h) of the original image), and share of boxes "
+          f"with a short side < {min_object_px}px at imgsz:")
+    print(f"{'Class':<20} | {'Boxes':>6} | {'p5':>5} | {'p50':>5} | {'p95':>5} | " +
+          " | ".join(f"{imgsz:>5}" for imgsz in candidates))
+    print("-" * (50 + 8 * len(candidates)))
+    for name, row in sorted(report.items(), key=lambda item: item[1]['size_p50']):
+        print(f"{name:<20} | {row['instances']:>6} | {row['size_p5']:5.0f} | "
+              f"{row['size_p50']:5.0f} | {row['size_p95']:5.0f} | " +
+              " | ".join(f"{row['too_small'][imgsz] * 100:4.0f}%" for imgsz in candidates))
+
+
+def print_advice(report):
+    print_size_report(report['sizes'], report['min_object_px'])
+
+    rows = report['candidates']
+    print(f"\n📊 Val recall at conf={report['conf']} per imgsz:")
+    print(f"{'imgsz':>5} | {'Compute':>7} | {'Rect':>5} | {'ms/img':>6} | {'mAP50-95':>8} | "
+          f"{'Recall':>6} | {'Worst class drop':>16}")
+    print("-" * 75)
+    for row in rows:
+        latency = f"{row['latency_ms']:6.1f}" if 'latency_ms' in row else f"{'-':>6}"
+        print(f"{row['imgsz']:>5} | {row['relative_compute'] * 100:6.0f}% | "
+              f"{row['rect_compute'] * 100:4.0f}% | {latency} | {row['map50_95']:8.3f} | "
+              f"{row['recall']:6.3f} | {row['worst_drop']:+16.3f}"
+              f"{'  ✅' if row['safe'] else ''}")
+
+    print(f"\n📋 Smallest imgsz keeping recall within {report['tolerance']} "
+          f"(classes with >= {report['min_instances']} val instances):")
+    for name, imgsz in sorted(report['per_class_min_imgsz'].items(), key=lambda item: item[1]):
+        print(f"   {name:<20} {imgsz}")
+
+    recommended = report['recommended']
+    print(f"\n💡 Recommended: imgsz={recommended['imgsz']}"
+          f"{', rect=True' if recommended['rect'] else ''} "
+          f"(~{recommended['compute'] * 100:.0f}% of the compute at {rows[-1]['imgsz']})")
+    if recommended['imgsz'] == rows[-1]['imgsz']:
+        print("   No smaller candidate keeps every class within tolerance")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pick the smallest safe imgsz from object sizes')
+    parser.add_argument('--weights', default=CUSTOM_MODEL_PATH)
+    parser.add_argument('--data', default='data.yaml')
+    parser.add_argument('--candidates', default=','.join(map(str, DEFAULT_CANDIDATES)))
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help='allowed per-class recall drop against the largest candidate')
+    parser.add_argument('--conf', type=float, default=0.25, help='deployment conf threshold')
+    parser.add_argument('--min-instances', type=int, default=10,
+                        help='ignore classes with fewer val instances')
+    parser.add_argument('--min-object-px', type=int, default=MIN_OBJECT_PX)
+    parser.add_argument('--sizes-only', action='store_true', help='only box size statistics')
+    parser.add_argument('--report', default='imgsz_report.json')
+    args = parser.parse_args()
+
+    candidates = [int(imgsz) for imgsz in args.candidates.split(',')]
+    if any(imgsz % STRIDE for imgsz in candidates):
+        print(f"⚠️  imgsz values should be multiples of {STRIDE}; ultralytics rounds them up")
+
+    if args.sizes_only:
+        report = size_report(box_pixel_sizes(args.data), candidates, args.min_object_px)
+        print_size_report(report, args.min_object_px)
+        return
+
+    if not os.path.exists(args.weights):
+        print(f"❌ Model {args.weights} not found!")
+        return
+    report = advise(args.weights, args.data, candidates, args.tolerance, args.conf,
+                    args.min_instances, args.min_object_px)
+    print_advice(report)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report saved as: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
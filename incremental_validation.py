@@ -0,0 +1,287 @@
+"""
+Incremental Validation with a Prediction Cache
+
+model.val() re-runs inference over the whole val split on every call. This
+evaluates from cached per-image predictions instead:
+
+- predictions are cached per (weights hash, image content hash, inference
+  params) in runs/val_cache/<weights hash>.preds.npy; only new or changed
+  images go through the model
+- predictions are stored with a very low confidence floor and almost no NMS
+  (conf=0.001, iou=0.95), so any higher conf can be applied afterwards
+  without running inference again; re-running NMS at an IoU below 0.95
+  approximates (but is not exactly) NMS at that IoU
+- entries of deleted, edited or re-exported images are pruned on save, so
+  the cache stays the size of the current val split
+- labels are always read fresh, so relabeled images are scored correctly
+- matching is vectorized over the 10 IoU thresholds (COCO-style greedy by
+  confidence, as in ultralytics) and mAP / PR curves come from ultralytics'
+  ap_per_class
+
+Images are letterboxed square (as in batch_inference.py) rather than in
+model.val()'s rectangular batches, so numbers can differ slightly from val.
+
+Usage:
+    python incremental_validation.py --weights runs/custom/indoor_night2/weights/best.pt
+    python incremental_validation.py --conf 0.25 --iou 0.5     # re-score, no inference
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from image_cache import content_hash
+from label_scanner import parse_label_file
+from model_comparison import box_iou
+from model_registry import CUSTOM_MODEL_PATH, file_hash
+from shard_dataset import label_path_for, list_split_images, load_dataset_config
+from tiled_inference import class_aware_nms
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = 'runs/val_cache'
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+# Cached predictions keep everything these settings let through
+CACHE_CONF = 0.001
+CACHE_NMS_IOU = 0.95
+CACHE_MAX_DET = 1000
+
+
+class PredictionCache:
+    """Per-image predictions of one weights file, in original image pixels"""
+
+    def __init__(self, weights, cache_dir=DEFAULT_CACHE_DIR, imgsz=640):
+        self.weights = weights
+        self.imgsz = imgsz
+        self.weights_hash = file_hash(weights)
+        self.params_key = f'imgsz={imgsz}:conf={CACHE_CONF}:iou={CACHE_NMS_IOU}:max_det={CACHE_MAX_DET}'
+        self.path = os.path.join(cache_dir, f'{self.weights_hash[:16]}.preds.npy')
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            state = np.load(self.path, allow_pickle=True).item()
+            if state.get('version') == CACHE_VERSION and state.get('weights_hash') == self.weights_hash:
+                return state
+        except (OSError, ValueError, EOFError):
+            pass
+        return {'version': CACHE_VERSION, 'weights_hash': self.weights_hash,
+                'stat_memo': {}, 'entries': {}}
+
+    def _prune(self):
+        """Drop memo rows of deleted or changed files and entries no current image uses"""
+
+        memo = self.state['stat_memo']
+        for path, (size, mtime_ns, _) in list(memo.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None or (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                del memo[path]
+
+        # Keys are '<params>:<content hash>'; entries for other params of a live image stay
+        live = {digest for _, _, digest in memo.values()}
+        entries = self.state['entries']
+        for key in [key for key in entries if key.rsplit(':', 1)[1] not in live]:
+            del entries[key]
+
+    def save(self):
+        self._prune()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp.npy'
+        np.save(tmp_path, self.state, allow_pickle=True)
+        os.replace(tmp_path, self.path)
+
+    def image_hash(self, path):
+        """Content hash, recomputed only when size or mtime changed"""
+
+        stat = os.stat(path)
+        memo = self.state['stat_memo'].get(path)
+        if memo is None or memo[0] != stat.st_size or memo[1] != stat.st_mtime_ns:
+            memo = self.state['stat_memo'][path] = (stat.st_size, stat.st_mtime_ns,
+                                                     content_hash(path))
+        return memo[2]
+
+    def predict(self, image_paths, batch_size=8, workers=4, device='cpu'):
+        """Predictions for every image: path -> {'boxes': (N, 6) xyxy conf cls, 'shape'}"""
+
+        image_paths = [os.path.abspath(path) for path in image_paths]
+        keys = {path: f'{self.params_key}:{self.image_hash(path)}' for path in image_paths}
+        entries = self.state['entries']
+        missing = [path for path in image_paths if keys[path] not in entries]
+
+        if missing:
+            print(f"🔄 Running inference on {len(missing)} new or changed images "
+                  f"({len(image_paths) - len(missing)} cached)")
+            self._run_inference(missing, keys, batch_size, workers, device)
+            self.save()
+        else:
+            print(f"✅ All {len(image_paths)} predictions cached, no inference needed")
+        return {path: entries[keys[path]] for path in image_paths if keys[path] in entries}
+
+    def _run_inference(self, image_paths, keys, batch_size, workers, device):
+        import torch
+
+        from batch_inference import iter_prepared_batches
+        from model_registry import get_model
+        from preprocess import scale_boxes_to_original
+
+        model = get_model(self.weights, device=device)
+        start = time.time()
+        for batch in iter_prepared_batches(image_paths, batch_size, self.imgsz, workers):
+            inputs = torch.from_numpy(np.stack([model_input for _, _, model_input, _ in batch]))
+            results = model(inputs, imgsz=self.imgsz, conf=CACHE_CONF, iou=CACHE_NMS_IOU,
+                            max_det=CACHE_MAX_DET, device=device, verbose=False)
+            for (path, original, _, ratio_pad), result in zip(batch, results):
+                boxes = scale_boxes_to_original(result.boxes.data.cpu().numpy(), ratio_pad,
+                                                original.shape)
+                self.state['entries'][keys[path]] = {'boxes': boxes.astype(np.float32),
+                                                     'shape': original.shape[:2]}
+        print(f"   {len(image_paths)} images in {time.time() - start:.1f}s")
+
+
+def load_ground_truth(predictions):
+    """Current labels of every predicted image: path -> (M, 5) class, xyxy pixels"""
+
+    ground_truth = {}
+    for path, entry in predictions.items():
+        label_path = label_path_for(path)
+        labels = parse_label_file(label_path)[0] if os.path.exists(label_path) \
+            else np.zeros((0, 5), dtype=np.float32)
+        height, width = entry['shape']
+        x, y, w, h = labels[:, 1] * width, labels[:, 2] * height, labels[:, 3] * width, \
+            labels[:, 4] * height
+        ground_truth[path] = np.stack([labels[:, 0], x - w / 2, y - h / 2, x + w / 2, y + h / 2],
+                                      axis=1)
+    return ground_truth
+
+
+def filter_predictions(boxes, conf=0.001, iou=0.7, max_det=300):
+    """Apply a conf threshold, class-aware NMS and max_det to cached predictions"""
+
+    boxes = boxes[boxes[:, 4] >= conf]
+    if len(boxes) and iou < CACHE_NMS_IOU:
+        boxes = boxes[class_aware_nms(boxes, iou)]
+    return boxes[np.argsort(-boxes[:, 4], kind='stable')][:max_det]
+
+
+def match_predictions(boxes, labels, iou_thresholds=IOU_THRESHOLDS):
+    """(N, 10) true-positive matrix; greedy by confidence, all thresholds at once
+
+    boxes must be sorted by descending confidence.
+    """
+
+    correct = np.zeros((len(boxes), len(iou_thresholds)), dtype=bool)
+    if len(boxes) == 0 or len(labels) == 0:
+        return correct
+
+    iou = box_iou(labels[:, 1:5], boxes[:, :4])
+    iou *= labels[:, 0][:, None] == boxes[:, 5][None, :]
+    matched = np.zeros((len(labels), len(iou_thresholds)), dtype=bool)
+    columns = np.arange(len(iou_thresholds))
+    for j in np.flatnonzero((iou >= iou_thresholds.min()).any(axis=0)):
+        available = np.where(matched, 0, iou[:, j, None])  # unclaimed labels per threshold
+        best = available.argmax(axis=0)
+        correct[j] = available[best, columns] >= iou_thresholds
+        matched[best, columns] |= correct[j]
+    return correct
+
+
+def evaluate(predictions, ground_truth, names, conf=0.001, iou=0.7, max_det=300,
+             plot_dir=None):
+    """mAP, precision and recall (overall and per class) from cached predictions"""
+
+    from ultralytics.utils.metrics import ap_per_class
+
+    tp, confidences, pred_classes, target_classes = [], [], [], []
+    for path, entry in predictions.items():
+        boxes = filter_predictions(entry['boxes'], conf, iou, max_det)
+        labels = ground_truth[path]
+        tp.append(match_predictions(boxes, labels))
+        confidences.append(boxes[:, 4])
+        pred_classes.append(boxes[:, 5])
+        target_classes.append(labels[:, 0])
+
+    target_classes = np.concatenate(target_classes) if target_classes else np.zeros(0)
+    report = {'images': len(predictions), 'instances': int(len(target_classes)),
+              'conf': conf, 'iou': iou, 'map50': 0.0, 'map50_95': 0.0,
+              'precision': 0.0, 'recall': 0.0, 'classes': {}}
+    if not len(target_classes):
+        return report
+
+    if plot_dir:
+        os.makedirs(plot_dir, exist_ok=True)
+    from pathlib import Path
+    _, _, p, r, _, ap, classes, *_ = ap_per_class(
+        np.concatenate(tp), np.concatenate(confidences), np.concatenate(pred_classes),
+        target_classes, plot=bool(plot_dir), save_dir=Path(plot_dir or '.'), names=names)
+
+    instances = np.bincount(target_classes.astype(np.int64))
+    report.update(map50=float(ap[:, 0].mean()), map50_95=float(ap.mean()),
+                  precision=float(p.mean()), recall=float(r.mean()))
+    for i, class_id in enumerate(classes.astype(int)):
+        report['classes'][names.get(class_id, str(class_id))] = {
+            'instances': int(instances[class_id]),
+            'precision': float(p[i]), 'recall': float(r[i]),
+            'map50': float(ap[i, 0]), 'map50_95': float(ap[i].mean()),
+        }
+    return report
+
+
+def incremental_validate(weights=CUSTOM_MODEL_PATH, data='data.yaml', split='val', imgsz=640,
+                         conf=0.001, iou=0.7, max_det=300, cache_dir=DEFAULT_CACHE_DIR,
+                         batch_size=8, workers=4, plot_dir=None):
+    """Drop-in for model.val() metrics that only runs inference on changed images"""
+
+    config = load_dataset_config(data)
+    image_paths = list_split_images(config, split)
+    if not image_paths:
+        raise FileNotFoundError(f"No images in the '{split}' split of {data}")
+
+    predictions = PredictionCache(weights, cache_dir, imgsz).predict(image_paths, batch_size,
+                                                                     workers)
+    return evaluate(predictions, load_ground_truth(predictions), config['names'], conf, iou,
+                    max_det, plot_dir)
+
+
+def print_validation_report(report):
+    print(f"\n📊 {report['images']} images, {report['instances']} instances "
+          f"(conf={report['conf']}, iou={report['iou']})")
+    print(f"{'Class':<20} | {'Instances':>9} | {'P':>6} | {'R':>6} | {'mAP50':>6} | {'mAP50-95':>8}")
+    print("-" * 70)
+    print(f"{'all':<20} | {report['instances']:>9} | {report['precision']:6.3f} | "
+          f"{report['recall']:6.3f} | {report['map50']:6.3f} | {report['map50_95']:8.3f}")
+    for name, row in report['classes'].items():
+        print(f"{name:<20} | {row['instances']:>9} | {row['precision']:6.3f} | "
+              f"{row['recall']:6.3f} | {row['map50']:6.3f} | {row['map50_95']:8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validation with cached predictions')
+    parser.add_argument('--weights', default=CUSTOM_MODEL_PATH)
+    parser.add_argument('--data', default='data.yaml')
+    parser.add_argument('--split', default='val')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.001)
+    parser.add_argument('--iou', type=float, default=0.7, help='NMS IoU threshold')
+    parser.add_argument('--max-det', type=int, default=300)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--plots', help='directory for PR / F1 curve plots')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        print(f"❌ Model {args.weights} not found!")
+        return
+
+    report = incremental_validate(args.weights, args.data, args.split, args.imgsz, args.conf,
+                                  args.iou, args.max_det, args.cache_dir, args.batch,
+                                  plot_dir=args.plots)
+    print_validation_report(report)
+
+
+if __name__ == "__main__":
+    main()
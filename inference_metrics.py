@@ -0,0 +1,369 @@
+"""
+Inference Stage Metrics
+
+Always-on timers and counters for the inference hot path, so a slow run can
+be attributed to a stage without a manual profiling session:
+
+    decode       cv2.imread / imdecode
+    preprocess   letterbox + HWC->CHW (and ultralytics' own preprocess)
+    forward      model forward pass
+    nms          NMS / postprocess
+    postprocess  mapping boxes back to the original image, building Results
+    plot         r.plot()
+    imwrite      cv2.imwrite of annotated images
+    write_rows   detection rows to JSONL/Parquet
+
+Every stage feeds a fixed-bucket histogram (one bisect and two additions per
+observation); every entry point (single, folder, compare, ...) counts its
+requests and their end-to-end latency.
+
+Exposure, configured from the environment by configure_from_env():
+
+    INFERENCE_METRICS_PORT=9100        Prometheus text on :9100/metrics,
+                                       JSON on :9100/metrics.json
+    INFERENCE_METRICS_JSON=path.json   JSON snapshot every
+                                       INFERENCE_METRICS_INTERVAL seconds
+                                       (default 60) and at exit
+    INFERENCE_PROFILE=cprofile|torch   capture a profile of
+    INFERENCE_PROFILE_SAMPLES=5        every INFERENCE_PROFILE_EVERY-th
+    INFERENCE_PROFILE_EVERY=10         request until SAMPLES are taken, into
+    INFERENCE_PROFILE_DIR=profiles     this folder (.prof for snakeviz/pstats,
+                                       .json Chrome traces for torch)
+
+Usage:
+    metrics = get_metrics()
+    with metrics.stage('decode'):
+        image = cv2.imread(path)
+
+    @instrumented('single')
+    def test_custom_model_single(image_path):
+        ...
+"""
+
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_ORDER = ('decode', 'preprocess', 'forward', 'nms', 'postprocess', 'plot', 'imwrite',
+               'write_rows')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus-style)"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, count=1):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += count
+            self.count += count
+            self.sum += seconds * count
+
+    def quantile(self, q):
+        """q-quantile estimate, interpolated inside its bucket like Prometheus does"""
+
+        rank, seen, lower = q * self.count, 0, 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        # Past the last finite bucket
+        return self.buckets[-1] if self.count else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, seen = [], 0
+            for count in self.counts:
+                seen += count
+                cumulative.append(seen)
+            return {
+                'count': self.count,
+                'sum_s': self.sum,
+                'mean_s': self.sum / self.count if self.count else 0.0,
+                'p50_s': self.quantile(0.5),
+                'p90_s': self.quantile(0.9),
+                'p99_s': self.quantile(0.99),
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], cumulative)),
+            }
+
+
+class InferenceMetrics:
+    """Per-stage histograms, per-entry request histograms and counters"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._stages = {}
+        self._requests = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+        self.profile = None
+        self.profile_samples = 0
+        self.profile_every = 1
+        self.profile_dir = 'profiles'
+        self._request_seq = 0
+        self._profiles_taken = 0
+        self._profiling = False
+
+    def _histogram(self, table, name):
+        histogram = table.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds, count=1):
+        """Record count observations of seconds for a stage"""
+
+        self._histogram(self._stages, stage).observe(seconds, count)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def record_speed(self, results, preprocess=True):
+        """Stage times ultralytics measured for each Results (ms per image)
+
+        Pass preprocess=False when the inputs were letterboxed beforehand
+        (already timed), so ultralytics' tensor conversion is not counted twice.
+        """
+
+        stages = (('preprocess', 'preprocess'), ('inference', 'forward'), ('postprocess', 'nms'))
+        for result in results:
+            speed = getattr(result, 'speed', None) or {}
+            for key, stage in stages[0 if preprocess else 1:]:
+                if speed.get(key) is not None:
+                    self.observe(stage, speed[key] / 1000)
+
+    def observe_request(self, entry, seconds):
+        self._histogram(self._requests, entry).observe(seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def request(self, entry):
+        """Time one call of an entry point, profiling it if it is sampled"""
+
+        profiler = self._start_profile(entry)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_request(entry, time.perf_counter() - start)
+            if profiler is not None:
+                self._finish_profile(*profiler)
+
+    def configure_profiling(self, kind, samples=5, every=1, output_dir='profiles'):
+        if kind not in (None, 'cprofile', 'torch'):
+            raise ValueError(f"Unknown profiler '{kind}', choose cprofile or torch")
+        self.profile, self.profile_samples = kind, samples
+        self.profile_every, self.profile_dir = max(every, 1), output_dir
+
+    def _start_profile(self, entry):
+        if self.profile is None:
+            return None
+        with self._lock:
+            sequence = self._request_seq
+            self._request_seq += 1
+            # One capture at a time: nested entry points and other threads run unprofiled
+            if (self._profiling or self._profiles_taken >= self.profile_samples
+                    or sequence % self.profile_every):
+                return None
+            self._profiling = True
+            self._profiles_taken += 1
+            index = self._profiles_taken
+
+        if self.profile == 'torch':
+            import torch
+
+            profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            profiler.__enter__()
+        else:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler, entry, index
+
+    def _finish_profile(self, profiler, entry, index):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if self.profile == 'torch':
+            profiler.__exit__(None, None, None)
+            path = os.path.join(self.profile_dir, f'{entry}-{index:03d}.json')
+            profiler.export_chrome_trace(path)
+        else:
+            profiler.disable()
+            path = os.path.join(self.profile_dir, f'{entry}-{index:03d}.prof')
+            profiler.dump_stats(path)
+        with self._lock:
+            self._profiling = False
+        print(f"🔬 Profile of {entry} request saved as: {path}")
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._requests.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            stages, requests = dict(self._stages), dict(self._requests)
+            counters = dict(self._counters)
+        order = {name: i for i, name in enumerate(STAGE_ORDER)}
+        return {
+            'uptime_s': time.time() - self.started,
+            'stages': {name: stages[name].snapshot()
+                       for name in sorted(stages, key=lambda name: (order.get(name, 99), name))},
+            'requests': {entry: histogram.snapshot() for entry, histogram in requests.items()},
+            'counters': counters,
+        }
+
+    def prometheus_text(self):
+        """Snapshot in the Prometheus text exposition format"""
+
+        snapshot = self.snapshot()
+        lines = []
+        for family, label, table, help_text in (
+                ('inference_stage_seconds', 'stage', snapshot['stages'],
+                 'Time per image spent in each inference stage'),
+                ('inference_request_seconds', 'entry', snapshot['requests'],
+                 'End-to-end latency of inference entry points')):
+            lines += [f'# HELP {family} {help_text}', f'# TYPE {family} histogram']
+            for name, histogram in table.items():
+                for bound, count in histogram['buckets'].items():
+                    lines.append(f'{family}_bucket{{{label}="{name}",le="{bound}"}} {count}')
+                lines.append(f'{family}_sum{{{label}="{name}"}} {histogram["sum_s"]:.6f}')
+                lines.append(f'{family}_count{{{label}="{name}"}} {histogram["count"]}')
+        for name, value in snapshot['counters'].items():
+            lines += [f'# TYPE inference_{name}_total counter', f'inference_{name}_total {value}']
+        lines.append(f'inference_uptime_seconds {snapshot["uptime_s"]:.1f}')
+        return '\n'.join(lines) + '\n'
+
+    def dump_json(self, path):
+        """Write a snapshot atomically, so readers never see a partial file"""
+
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+
+_metrics = InferenceMetrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def instrumented(entry, metrics=_metrics):
+    """Decorator that runs every call of a function as one request of entry"""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.request(entry):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = _metrics
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = self.metrics.prometheus_text(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, content_type = json.dumps(self.metrics.snapshot()), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1', metrics=_metrics):
+    """Serve /metrics and /metrics.json from a daemon thread"""
+
+    handler = type('BoundMetricsHandler', (MetricsHandler,), {'metrics': metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_json_dump(path, interval=60.0, metrics=_metrics):
+    """Dump a JSON snapshot every interval seconds and once more at exit"""
+
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            metrics.dump_json(path)
+
+    threading.Thread(target=loop, daemon=True).start()
+    atexit.register(lambda: (stop.set(), metrics.dump_json(path)))
+    return stop
+
+
+def configure_from_env(metrics=_metrics):
+    """Start the exporters and profiler requested by INFERENCE_* variables"""
+
+    port = os.environ.get('INFERENCE_METRICS_PORT')
+    if port:
+        start_metrics_server(int(port), metrics=metrics)
+        print(f"📈 Metrics on http://127.0.0.1:{port}/metrics")
+    json_path = os.environ.get('INFERENCE_METRICS_JSON')
+    if json_path:
+        start_json_dump(json_path, float(os.environ.get('INFERENCE_METRICS_INTERVAL', 60)),
+                        metrics=metrics)
+        print(f"📈 Metrics snapshots to {json_path}")
+    profile = os.environ.get('INFERENCE_PROFILE')
+    if profile:
+        metrics.configure_profiling(profile, int(os.environ.get('INFERENCE_PROFILE_SAMPLES', 5)),
+                                    int(os.environ.get('INFERENCE_PROFILE_EVERY', 1)),
+                                    os.environ.get('INFERENCE_PROFILE_DIR', 'profiles'))
+
+
+def print_stage_summary(snapshot):
+    """Per-stage time breakdown of a snapshot"""
+
+    stages = snapshot['stages']
+    if not stages:
+        return
+    total = sum(stage['sum_s'] for stage in stages.values())
+    print(f"\n{'Stage':<12} | {'Count':>6} | {'Mean ms':>8} | {'p90 ms':>7} | {'Total s':>7} | "
+          f"{'Share':>5}")
+    print("-" * 62)
+    for name, stage in stages.items():
+        print(f"{name:<12} | {stage['count']:>6} | {stage['mean_s'] * 1000:8.1f} | "
+              f"{stage['p90_s'] * 1000:7.1f} | {stage['sum_s']:7.2f} | "
+              f"{stage['sum_s'] / total * 100 if total else 0:4.0f}%")
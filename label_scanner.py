@@ -0,0 +1,183 @@
+"""
+Parallel, Cached YOLO Label Scanner
+
+Counts annotations per class across a labels directory without building a
+list of every class id:
+
+- label files are parsed across a process pool, with NumPy instead of
+  per-line Python loops
+- per-class counts are kept as small count arrays and summed incrementally
+- results are cached on disk next to the labels directory (like the
+  ultralytics labels/train.cache), keyed by file path, size and mtime, so a
+  re-run only re-reads files that changed; per-file warnings are cached too
+  and replayed, so a re-run reports the same problems as the first run
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+CACHE_VERSION = 2
+
+
+def parse_label_file(label_file):
+    """Parse a YOLO label file into an (N, 5) float32 array of class, x, y, w, h
+
+    Lines with fewer than 5 fields are ignored and segment lines are cut to
+    the first 5 fields, as before. Returns (boxes, warnings).
+    """
+
+    with open(label_file, 'r') as f:
+        return parse_label_text(f.read(), label_file)
+
+
+def parse_label_text(text, label_file=''):
+    """parse_label_file for label content already in memory (e.g. from a shard)
+
+    Short lines are dropped even when the total field count is a multiple of
+    5, so they can't shift the fields of the following boxes:
+
+    >>> parse_label_text('0 .1 .2 .3\\n1 0 .5 .5 .1 .1')[0][:, 0].tolist()
+    [1.0]
+    """
+
+    lines = [line.split() for line in text.splitlines() if line.strip()]
+    if not lines:
+        return np.zeros((0, 5), dtype=np.float32), []
+
+    # Fast path: plain detection labels, exactly 5 numeric fields on every line
+    if all(len(parts) == 5 for parts in lines):
+        try:
+            boxes = np.array(lines, dtype=np.float32)
+            if np.all(boxes[:, 0] == np.round(boxes[:, 0])) and np.all(boxes[:, 0] >= 0):
+                return boxes, []
+        except ValueError:
+            pass
+
+    # Slow path for segment lines and malformed content
+    rows, warnings = [], []
+    for parts in lines:
+        line = ' '.join(parts)
+        if len(parts) < 5:
+            continue
+        try:
+            class_id = int(parts[0])
+            if class_id < 0:
+                raise ValueError
+        except ValueError:
+            warnings.append(f"Invalid class ID in {label_file}: {parts[0]}")
+            continue
+        try:
+            rows.append([class_id, *map(float, parts[1:5])])
+        except ValueError:
+            warnings.append(f"Invalid coordinates in {label_file}: {line}")
+    return np.array(rows, dtype=np.float32).reshape(-1, 5), warnings
+
+
+def scan_label_file(label_file):
+    """Pool worker: per-class counts for one file plus its cache key"""
+
+    stat = os.stat(label_file)
+    try:
+        boxes, warnings = parse_label_file(label_file)
+        counts = np.bincount(boxes[:, 0].astype(np.int64))
+        error = None
+    except Exception as e:
+        counts, warnings, error = np.zeros(0, dtype=np.int64), [], str(e)
+    return label_file, stat.st_size, stat.st_mtime_ns, counts, warnings, error
+
+
+def cache_path_for(label_dir):
+    """datasets/custom/labels/train -> datasets/custom/labels/train.scan.cache"""
+
+    return os.path.normpath(label_dir) + '.scan.cache'
+
+
+def load_cache(cache_path):
+    try:
+        cache = np.load(cache_path, allow_pickle=True).item()
+        if cache.get('version') == CACHE_VERSION:
+            return cache['files']
+    except (OSError, ValueError, EOFError, KeyError, AttributeError):
+        pass
+    return {}
+
+
+def save_cache(cache_path, files):
+    try:
+        # np.save appends .npy, so write there and rename like ultralytics does
+        np.save(cache_path + '.npy', {'version': CACHE_VERSION, 'files': files})
+        os.replace(cache_path + '.npy', cache_path)
+    except OSError as e:
+        print(f"⚠️  Could not write label scan cache {cache_path}: {e}")
+
+
+def add_counts(total, counts):
+    """Add a per-file bincount into the running total, growing it if needed"""
+
+    if len(counts) > len(total):
+        total = np.pad(total, (0, len(counts) - len(total)))
+    total[:len(counts)] += counts
+    return total
+
+
+def scan_labels(label_dir, workers=None, use_cache=True, chunksize=256):
+    """Count annotations per class for every .txt file in label_dir
+
+    Returns a dict with 'counts' (array indexed by class id), 'files',
+    'annotations', 'rescanned' (files actually read this run) and 'messages'
+    (warnings and errors).
+    """
+
+    label_files = sorted(glob.glob(os.path.join(label_dir, '*.txt')))
+    cache_path = cache_path_for(label_dir)
+    cached = load_cache(cache_path) if use_cache else {}
+
+    files, stale = {}, []
+    for label_file in label_files:
+        entry = cached.get(label_file)
+        stat = os.stat(label_file)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            files[label_file] = entry
+        else:
+            stale.append(label_file)
+
+    errors = {}
+    if stale:
+        if len(stale) < chunksize:
+            scanned = map(scan_label_file, stale)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            scanned = pool.map(scan_label_file, stale, chunksize=chunksize)
+        for label_file, size, mtime_ns, counts, warnings, error in scanned:
+            if error is not None:
+                errors[label_file] = f"❌ Error reading {label_file}: {error}"
+                continue
+            files[label_file] = (size, mtime_ns, counts, warnings)
+        if pool is not None:
+            pool.shutdown()
+
+    if use_cache and (stale or len(files) != len(cached)):
+        save_cache(cache_path, files)
+
+    # Warnings come from the cache for unchanged files, in file order
+    total = np.zeros(0, dtype=np.int64)
+    messages = []
+    for label_file in label_files:
+        if label_file in errors:
+            messages.append(errors[label_file])
+        elif label_file in files:
+            _, _, counts, warnings = files[label_file]
+            total = add_counts(total, counts)
+            messages.extend(f"⚠️  {w}" for w in warnings)
+
+    return {
+        'counts': total,
+        'files': len(files),
+        'annotations': int(total.sum()),
+        'rescanned': len(stale),
+        'messages': messages,
+    }
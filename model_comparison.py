@@ -0,0 +1,190 @@
+"""
+Multi-Model Comparison Engine
+
+Compares K models over a whole folder instead of eyeballing two PNGs:
+
+- every image is decoded and letterboxed once, and the same input tensor is
+  fed to all K models, which run concurrently on a thread pool
+- boxes of every model pair are matched with a vectorized IoU matrix
+- agreement/disagreement statistics are aggregated over the folder and
+  written as JSON
+
+Matching happens in the shared letterbox coordinates. All models see the same
+transform, so IoU is the same as in original image coordinates.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import torch
+
+from batch_inference import iter_prepared_batches
+from inference_metrics import get_metrics
+
+metrics = get_metrics()
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) and (M, 4) xyxy arrays -> (N, M)"""
+
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:4], boxes_b[None, :, 2:4])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def match_boxes(boxes_a, boxes_b, iou_threshold=0.5):
+    """One-to-one matching of boxes, highest IoU first
+
+    Returns (pairs, ious) where pairs is a (K, 2) array of indices into
+    boxes_a and boxes_b.
+    """
+
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0)
+
+    iou = box_iou(boxes_a, boxes_b)
+    candidates = np.argwhere(iou >= iou_threshold)
+    candidates = candidates[iou[candidates[:, 0], candidates[:, 1]].argsort(kind='stable')[::-1]]
+    used_a = np.zeros(len(boxes_a), dtype=bool)
+    used_b = np.zeros(len(boxes_b), dtype=bool)
+    keep = []
+    for k, (i, j) in enumerate(candidates):
+        if not used_a[i] and not used_b[j]:
+            used_a[i] = used_b[j] = True
+            keep.append(k)
+    pairs = candidates[keep].reshape(-1, 2)
+    return pairs, iou[pairs[:, 0], pairs[:, 1]]
+
+
+def _class_name_array(names):
+    """Lower-cased class names indexed by class id, for cross-model comparison"""
+
+    return np.array([str(names[i]).lower() for i in range(max(names) + 1)])
+
+
+class PairStats:
+    """Running agreement statistics for one pair of models"""
+
+    def __init__(self, name_a, name_b):
+        self.name_a = name_a
+        self.name_b = name_b
+        self.images = 0
+        self.images_in_full_agreement = 0
+        self.matched = 0
+        self.same_class = 0
+        self.only_a = 0
+        self.only_b = 0
+        self.iou_sum = 0.0
+        self.class_confusions = {}
+
+    def update(self, boxes_a, boxes_b, names_a, names_b, iou_threshold):
+        pairs, ious = match_boxes(boxes_a[:, :4], boxes_b[:, :4], iou_threshold)
+        labels_a = names_a[boxes_a[pairs[:, 0], 5].astype(int)]
+        labels_b = names_b[boxes_b[pairs[:, 1], 5].astype(int)]
+        same = labels_a == labels_b
+
+        only_a = len(boxes_a) - len(pairs)
+        only_b = len(boxes_b) - len(pairs)
+        self.images += 1
+        self.matched += len(pairs)
+        self.same_class += int(same.sum())
+        self.only_a += only_a
+        self.only_b += only_b
+        self.iou_sum += float(ious.sum())
+        if only_a == 0 and only_b == 0 and same.all():
+            self.images_in_full_agreement += 1
+        for label_a, label_b in zip(labels_a[~same], labels_b[~same]):
+            key = f'{label_a} -> {label_b}'
+            self.class_confusions[key] = self.class_confusions.get(key, 0) + 1
+
+    def summary(self):
+        total_a = self.matched + self.only_a
+        total_b = self.matched + self.only_b
+        return {
+            'models': [self.name_a, self.name_b],
+            'images': self.images,
+            'images_in_full_agreement': self.images_in_full_agreement,
+            'matched_boxes': self.matched,
+            'matched_same_class': self.same_class,
+            f'only_{self.name_a}': self.only_a,
+            f'only_{self.name_b}': self.only_b,
+            'mean_matched_iou': self.iou_sum / self.matched if self.matched else 0.0,
+            f'recall_of_{self.name_a}_by_{self.name_b}': self.matched / total_a if total_a else 0.0,
+            f'recall_of_{self.name_b}_by_{self.name_a}': self.matched / total_b if total_b else 0.0,
+            'class_confusions': dict(sorted(self.class_confusions.items(),
+                                            key=lambda item: -item[1])),
+        }
+
+
+def compare_models_on_images(models, image_paths, batch_size=8, imgsz=640, conf=0.25,
+                             iou_threshold=0.5, workers=4):
+    """Run all models on shared preprocessed batches and compare their boxes
+
+    models maps a display name to a loaded YOLO model. Returns a report dict
+    with per-model detection counts and pairwise agreement statistics.
+    """
+
+    names = {name: _class_name_array(model.names) for name, model in models.items()}
+    pair_stats = {pair: PairStats(*pair) for pair in combinations(models, 2)}
+    detections = {name: 0 for name in models}
+    image_count = 0
+    start = time.perf_counter()
+
+    def predict(model, inputs):
+        predictions = model(inputs, imgsz=imgsz, conf=conf, verbose=False)
+        metrics.record_speed(predictions, preprocess=False)
+        return [p.boxes.data.cpu().numpy() for p in predictions]
+
+    with ThreadPoolExecutor(max_workers=len(models)) as pool:
+        for batch in iter_prepared_batches(image_paths, batch_size, imgsz, workers):
+            # Decoded and letterboxed once, shared by every model
+            inputs = torch.from_numpy(np.stack([item[2] for item in batch]))
+            futures = {name: pool.submit(predict, model, inputs) for name, model in models.items()}
+            boxes = {name: future.result() for name, future in futures.items()}
+
+            for i in range(len(batch)):
+                for name in models:
+                    detections[name] += len(boxes[name][i])
+                for (name_a, name_b), stats in pair_stats.items():
+                    stats.update(boxes[name_a][i], boxes[name_b][i], names[name_a],
+                                 names[name_b], iou_threshold)
+            image_count += len(batch)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'images': image_count,
+        'seconds': elapsed,
+        'images_per_sec': image_count / elapsed if elapsed > 0 else 0.0,
+        'iou_threshold': iou_threshold,
+        'conf': conf,
+        'detections': detections,
+        'pairs': [stats.summary() for stats in pair_stats.values()],
+    }
+
+
+def save_report(report, output_path):
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def print_report(report):
+    print(f"\n📊 Compared {len(report['detections'])} models on {report['images']} images "
+          f"({report['images_per_sec']:.2f} images/sec)")
+    for name, count in report['detections'].items():
+        print(f"   {name}: {count} detections")
+    for pair in report['pairs']:
+        name_a, name_b = pair['models']
+        print(f"\n🔍 {name_a} vs {name_b}:")
+        print(f"   Matched boxes: {pair['matched_boxes']} "
+              f"({pair['matched_same_class']} with the same class name)")
+        print(f"   Only {name_a}: {pair[f'only_{name_a}']}, only {name_b}: {pair[f'only_{name_b}']}")
+        print(f"   Mean IoU of matches: {pair['mean_matched_iou']:.3f}")
+        print(f"   Images in full agreement: {pair['images_in_full_agreement']}/{pair['images']}")
+        for confusion, count in list(pair['class_confusions'].items())[:5]:
+            print(f"   - {confusion}: {count}")
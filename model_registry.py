@@ -0,0 +1,144 @@
+"""
+Shared Model Registry
+
+Loads each YOLO model once per process and hands the same warmed-up instance
+to every entry point (single image, folder, compare).
+
+Models are keyed by (weights path, file hash, device), so retraining into the
+same path loads the new checkpoint instead of serving a stale one. When the
+loaded models exceed the memory budget, the least recently used one is evicted.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CUSTOM_MODEL_PATH = 'runs/custom/indoor_night2/weights/best.pt'
+PRETRAINED_MODEL_PATH = 'yolov8n.pt'
+
+# Memory budget for all cached models, override with MODEL_REGISTRY_BUDGET_MB
+DEFAULT_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_REGISTRY_BUDGET_MB', 2048))
+
+_hash_cache = {}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a weights file, memoized on (path, size, mtime)
+
+    Directories (e.g. OpenVINO model folders) hash all files they contain.
+    """
+
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(path)):
+            if os.path.isfile(os.path.join(path, name)):
+                digest.update(f'{name}:{file_hash(os.path.join(path, name))}'.encode())
+        return digest.hexdigest()
+
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _hash_cache:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _hash_cache[memo_key] = digest.hexdigest()
+    return _hash_cache[memo_key]
+
+
+def model_size_bytes(model, weights):
+    """Approximate resident size of a YOLO model (parameters + buffers)"""
+
+    torch_model = model.model
+    if not hasattr(torch_model, 'parameters'):
+        # Exported backends (ONNX, OpenVINO) keep their weights outside torch,
+        # so use the size of the exported file or directory instead
+        if os.path.isdir(weights):
+            return sum(entry.stat().st_size for entry in os.scandir(weights) if entry.is_file())
+        return os.path.getsize(weights) if os.path.exists(weights) else 0
+    tensors = list(torch_model.parameters()) + list(torch_model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """LRU cache of loaded, warmed-up YOLO models"""
+
+    def __init__(self, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, warmup_imgsz=640):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.warmup_imgsz = warmup_imgsz
+        self._models = OrderedDict()  # key -> (model, size_bytes)
+        self._lock = threading.Lock()
+
+    def _key(self, weights, device):
+        path = os.path.abspath(weights)
+        # Hub names like 'yolov8n.pt' may not exist until YOLO downloads them
+        digest = file_hash(path) if os.path.exists(path) else None
+        return (path, digest, str(device))
+
+    def get(self, weights, device='cpu', warmup=True):
+        """Return the cached model for weights/device, loading it on first use"""
+
+        key = self._key(weights, device)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+
+            # Imported on first load so scripts using the registry start quickly
+            from ultralytics import YOLO
+
+            start = time.perf_counter()
+            model = YOLO(weights)
+            if warmup:
+                # First predict builds the predictor and fuses Conv+BN once
+                dummy = np.zeros((self.warmup_imgsz, self.warmup_imgsz, 3), dtype=np.uint8)
+                model(dummy, device=device, imgsz=self.warmup_imgsz, verbose=False)
+            if key[1] is None and os.path.exists(key[0]):
+                key = self._key(weights, device)
+
+            size = model_size_bytes(model, weights)
+            self._models[key] = (model, size)
+            print(f"📦 Loaded {weights} on {device} "
+                  f"({size / 1e6:.1f} MB, {time.perf_counter() - start:.2f}s)")
+            self._evict(keep=key)
+            return model
+
+    def _evict(self, keep):
+        """Drop least recently used models until the budget is met"""
+
+        while self.total_bytes() > self.memory_budget and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            self._models.pop(oldest)
+            print(f"♻️  Evicted {oldest[0]} ({oldest[2]}) from model registry")
+
+    def total_bytes(self):
+        return sum(size for _, size in self._models.values())
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        """List cached models, least recently used first"""
+
+        return [{'weights': path, 'sha256': digest, 'device': device, 'bytes': size}
+                for (path, digest, device), (_, size) in self._models.items()]
+
+
+_registry = ModelRegistry()
+
+
+def get_registry():
+    return _registry
+
+
+def get_model(weights, device='cpu', warmup=True):
+    """Get a shared model instance from the process-wide registry"""
+
+    return _registry.get(weights, device=device, warmup=warmup)
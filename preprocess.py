@@ -0,0 +1,91 @@
+"""
+Shared Image Preprocessing
+
+Decode and letterbox helpers used by the batched inference paths. Images are
+prepared once as RGB float32 CHW arrays in [0, 1], the format YOLO accepts as a
+tensor without doing its own preprocessing again.
+"""
+
+import cv2
+import numpy as np
+
+from inference_metrics import get_metrics
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+
+metrics = get_metrics()
+
+
+def letterbox(image, imgsz=640, pad_value=114):
+    """Resize keeping aspect ratio and pad to a square imgsz x imgsz canvas
+
+    Returns the padded image plus (ratio, (pad_w, pad_h)) needed to map boxes
+    back to the original image.
+    """
+
+    h, w = image.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_w, pad_h = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right,
+                               cv2.BORDER_CONSTANT, value=(pad_value,) * 3)
+    return image, (ratio, (pad_w, pad_h))
+
+
+def to_model_input(image):
+    """BGR uint8 HWC -> RGB float32 CHW in [0, 1]"""
+
+    chw = image[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(chw, dtype=np.float32) / 255.0
+
+
+def prepare_image(original, imgsz=640):
+    """Letterbox a decoded BGR image; returns (model input array, ratio_pad)"""
+
+    padded, ratio_pad = letterbox(original, imgsz)
+    return to_model_input(padded), ratio_pad
+
+
+def load_and_letterbox(image_path, imgsz=640):
+    """Decode an image and prepare it for batched inference
+
+    Returns (original BGR image, model input array, ratio_pad), or None if the
+    image cannot be decoded.
+    """
+
+    with metrics.stage('decode'):
+        original = cv2.imread(image_path)
+    if original is None:
+        return None
+    with metrics.stage('preprocess'):
+        return (original, *prepare_image(original, imgsz))
+
+
+def decode_image_bytes(data):
+    """Decode encoded image bytes (JPEG, PNG, ...) to a BGR array, or None"""
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if not buffer.size:
+        return None
+    with metrics.stage('decode'):
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def scale_boxes_to_original(boxes, ratio_pad, original_shape):
+    """Map xyxy boxes from letterboxed coordinates back to the original image
+
+    Works on both numpy arrays and torch tensors; extra columns (conf, cls)
+    are left untouched.
+    """
+
+    ratio, (pad_w, pad_h) = ratio_pad
+    h, w = original_shape[:2]
+    boxes = boxes.clone() if hasattr(boxes, 'clone') else boxes.copy()
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_w) / ratio).clip(0, w)
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_h) / ratio).clip(0, h)
+    return boxes
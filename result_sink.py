@@ -0,0 +1,162 @@
+"""
+Asynchronous Result Sink
+
+Collects detections from the inference loop and writes them in the
+background, so the loop never waits on JPEG encoding or disk:
+
+- detections go out as batched rows (image, class_id, class_name, conf,
+  x1, y1, x2, y2) to JSONL, or to Parquet when pyarrow is installed
+- annotated images are optional; when enabled, r.plot() and cv2.imwrite run
+  on a writer thread pool
+- file writes happen on their own single thread, keeping rows in order
+
+Usage:
+    with ResultSink('detections.jsonl', render_dir=None) as sink:
+        for result in results:
+            sink.add(result)
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from detections import Detections
+from inference_metrics import get_metrics
+
+ROW_FIELDS = ('image', 'class_id', 'class_name', 'conf', 'x1', 'y1', 'x2', 'y2')
+
+metrics = get_metrics()
+
+
+def result_rows(result):
+    """One row dict per detection, with a single device-to-host transfer"""
+
+    return Detections.from_result(result).to_rows()
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self._file = open(path, 'w')
+
+    def write(self, rows):
+        self._file.write(''.join(json.dumps(row) + '\n' for row in rows))
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from None
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ('image', pa.string()), ('class_id', pa.int32()), ('class_name', pa.string()),
+            ('conf', pa.float32()), ('x1', pa.float32()), ('y1', pa.float32()),
+            ('x2', pa.float32()), ('y2', pa.float32()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        columns = {field: [row[field] for row in rows] for field in ROW_FIELDS}
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_writer(path):
+    """Pick the row writer from the file extension (.parquet or JSONL)"""
+
+    if path.endswith('.parquet'):
+        return ParquetWriter(path)
+    return JsonlWriter(path)
+
+
+class ResultSink:
+    """Buffers detection rows and renders images on background threads"""
+
+    def __init__(self, output_path=None, render_dir=None, render_suffix='_detection.jpg',
+                 render_workers=2, flush_rows=1000, max_pending_renders=32):
+        self.render_dir = render_dir
+        self.render_suffix = render_suffix
+        self.flush_rows = flush_rows
+        self.images = 0
+        self.detections = 0
+
+        self._writer = open_writer(output_path) if output_path else None
+        self._buffer = []
+        self._io = ThreadPoolExecutor(max_workers=1)
+        self._renderers = ThreadPoolExecutor(max_workers=render_workers) if render_dir else None
+        # Bounds memory held by images waiting to be rendered
+        self._render_slots = threading.BoundedSemaphore(max_pending_renders)
+        self._futures = []
+        if render_dir:
+            os.makedirs(render_dir, exist_ok=True)
+
+    def add(self, result):
+        """Record one ultralytics Results object; returns its detection rows"""
+
+        rows = self.add_rows(result_rows(result))
+
+        if self._renderers is not None:
+            self._render_slots.acquire()
+            future = self._renderers.submit(self._render, result)
+            future.add_done_callback(lambda _: self._render_slots.release())
+            self._futures.append(future)
+            self._futures = [f for f in self._futures if not f.done() or f.exception()]
+        return rows
+
+    def add_rows(self, rows, images=1):
+        """Record detection rows computed elsewhere (e.g. in worker processes)"""
+
+        self.images += images
+        self.detections += len(rows)
+        if self._writer is not None:
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.flush_rows:
+                self._flush()
+        return rows
+
+    def _render(self, result):
+        base_name = os.path.splitext(os.path.basename(result.path))[0]
+        output_path = os.path.join(self.render_dir, f'{base_name}{self.render_suffix}')
+        with metrics.stage('plot'):
+            image = result.plot()
+        with metrics.stage('imwrite'):
+            cv2.imwrite(output_path, image)
+
+    def _flush(self):
+        if self._buffer:
+            rows, self._buffer = self._buffer, []
+            self._futures.append(self._io.submit(self._write, rows))
+
+    def _write(self, rows):
+        with metrics.stage('write_rows'):
+            self._writer.write(rows)
+
+    def close(self):
+        """Flush remaining rows, wait for all background work and close files"""
+
+        if self._writer is not None:
+            self._flush()
+        if self._renderers is not None:
+            self._renderers.shutdown(wait=True)
+        self._io.shutdown(wait=True)
+        for future in self._futures:
+            future.result()  # re-raise background errors
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
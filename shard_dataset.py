@@ -0,0 +1,437 @@
+"""
+Sharded Dataset Format for Large-Scale Training
+
+Full COCO is ~120k loose JPEGs plus as many label files; on a network
+filesystem the per-file open/stat overhead dominates epoch time. This packs a
+YOLO dataset into a few large tar shards (webdataset layout, readable with
+plain tar) and reads them back sequentially:
+
+    <output>/train-00000.tar    000000123.jpg   original image bytes
+                                000000123.txt   YOLO label lines (may be empty)
+                                000000123.json  {"source": original relative path}
+    <output>/train.json         manifest: names, sample count, shards
+
+Samples are shuffled once while packing, so every shard is a random mix.
+
+Reading:
+- ShardStream / stream_loader: a torch IterableDataset that reads shards
+  sequentially, splits them across DataLoader workers, and shuffles samples
+  through a buffer. Batches are ultralytics-style dicts (img, cls, bboxes,
+  batch_idx), for custom training/eval loops.
+- stage_shards: ultralytics' trainer needs random access (mosaic), so for
+  model.train() the shards are copied to local scratch disk with a few large
+  sequential reads and a data.yaml for the local copy is written.
+
+Usage:
+    python shard_dataset.py pack --data coco.yaml --output datasets/coco_shards
+    python shard_dataset.py stage --shards datasets/coco_shards --stage-dir /scratch/coco
+    python shard_dataset.py stream --shards datasets/coco_shards --split val
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import shutil
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+import yaml
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from label_scanner import parse_label_text
+from preprocess import IMAGE_EXTENSIONS, decode_image_bytes, prepare_image
+
+MANIFEST_VERSION = 1
+
+
+# --- Reading the source dataset ------------------------------------------------
+
+def resolve_dataset_root(config, yaml_path):
+    """Dataset root from a data yaml, trying the places ultralytics would"""
+
+    root = config.get('path') or os.path.dirname(yaml_path)
+    if os.path.isabs(root):
+        return root
+
+    from ultralytics.utils import SETTINGS
+    candidates = list(dict.fromkeys([
+        os.path.join(os.path.dirname(yaml_path), root), os.path.join('datasets', root), root,
+        os.path.join(SETTINGS['datasets_dir'], root)]))
+    for candidate in candidates:
+        if os.path.isdir(candidate):
+            return candidate
+    raise FileNotFoundError(f"Dataset root '{root}' not found (tried {', '.join(candidates)})")
+
+
+def load_dataset_config(data='data.yaml'):
+    """Parsed data yaml (local file or ultralytics built-in such as coco8.yaml)"""
+
+    if not os.path.exists(data):
+        from ultralytics.utils.checks import check_yaml
+        data = check_yaml(data)
+    with open(data) as f:
+        config = yaml.safe_load(f)
+    config['root'] = resolve_dataset_root(config, data)
+    names = config.get('names', {})
+    config['names'] = dict(enumerate(names)) if isinstance(names, list) else names
+    return config
+
+
+def list_split_images(config, split):
+    """Image paths of one split (image directory or ultralytics .txt list)"""
+
+    entries = config.get(split)
+    if not entries:
+        return []
+    images = []
+    for entry in entries if isinstance(entries, list) else [entries]:
+        path = os.path.join(config['root'], entry)
+        if path.endswith('.txt'):
+            with open(path) as f:
+                images.extend(os.path.join(config['root'], line.strip()) for line in f
+                              if line.strip())
+        else:
+            images.extend(p for p in glob.glob(os.path.join(path, '**', '*'), recursive=True)
+                          if p.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(images)
+
+
+def label_path_for(image_path):
+    """Same images/ -> labels/ mapping as ultralytics' img2label_paths"""
+
+    sa, sb = f'{os.sep}images{os.sep}', f'{os.sep}labels{os.sep}'
+    return sb.join(image_path.rsplit(sa, 1)).rsplit('.', 1)[0] + '.txt'
+
+
+# --- Packing -------------------------------------------------------------------
+
+def _read_sample(image_path, root):
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+    label_path = label_path_for(image_path)
+    label_bytes = b''
+    if os.path.exists(label_path):
+        with open(label_path, 'rb') as f:
+            label_bytes = f.read()
+    return image_path, os.path.relpath(image_path, root), image_bytes, label_bytes
+
+
+def _add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 0  # reproducible shards
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _read_ahead(pool, images, root, window):
+    """_read_sample results in order, with at most window reads in flight"""
+
+    pending = deque()
+    for image_path in images:
+        pending.append(pool.submit(_read_sample, image_path, root))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def pack_split(config, split, output_dir, shard_size_mb=512, workers=16, seed=0):
+    """Write one split as tar shards plus its manifest; returns the manifest"""
+
+    images = list_split_images(config, split)
+    if not images:
+        print(f"⚠️  No images for split '{split}'")
+        return None
+    random.Random(seed).shuffle(images)
+    os.makedirs(output_dir, exist_ok=True)
+
+    shard_limit = shard_size_mb * 1024 * 1024
+    shards, tar, shard_bytes, shard_samples = [], None, 0, 0
+
+    def close_shard():
+        if tar is not None:
+            tar.close()
+            shards[-1].update(samples=shard_samples,
+                              bytes=os.path.getsize(os.path.join(output_dir, shards[-1]['file'])))
+
+    start = time.time()
+    # Reads are parallel (they are latency-bound on network storage), writes sequential
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for index, (image_path, source, image_bytes, label_bytes) in enumerate(
+                _read_ahead(pool, images, config['root'], window=workers * 4)):
+            if tar is None or shard_bytes >= shard_limit:
+                close_shard()
+                name = f'{split}-{len(shards):05d}.tar'
+                shards.append({'file': name})
+                tar = tarfile.open(os.path.join(output_dir, name), 'w')
+                shard_bytes, shard_samples = 0, 0
+
+            key = f'{index:09d}'
+            extension = os.path.splitext(image_path)[1].lower()
+            _add_member(tar, key + extension, image_bytes)
+            _add_member(tar, key + '.txt', label_bytes)
+            _add_member(tar, key + '.json', json.dumps({'source': source}).encode())
+            shard_bytes += len(image_bytes) + len(label_bytes)
+            shard_samples += 1
+            if (index + 1) % 10000 == 0:
+                print(f"   {index + 1}/{len(images)} samples packed")
+        close_shard()
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'split': split,
+        'names': config['names'],
+        'samples': len(images),
+        'shards': shards,
+    }
+    with open(os.path.join(output_dir, f'{split}.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✅ {split}: {len(images)} samples in {len(shards)} shards "
+          f"({sum(s['bytes'] for s in shards) / 1024 / 1024:.1f} MB, {time.time() - start:.1f}s)")
+    return manifest
+
+
+def load_manifest(shard_dir, split):
+    with open(os.path.join(shard_dir, f'{split}.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported shard manifest version in {shard_dir}/{split}.json")
+    manifest['names'] = {int(k): v for k, v in manifest['names'].items()}
+    return manifest
+
+
+def iter_shard(shard_path):
+    """Samples of one shard in order: dicts with key, source, image bytes, label text"""
+
+    sample = {}
+    # 'r|' streams the tar front to back without seeking
+    with tarfile.open(shard_path, 'r|') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            key, extension = os.path.splitext(member.name)
+            if sample and sample['key'] != key:
+                yield sample
+                sample = {}
+            sample['key'] = key
+            data = tar.extractfile(member).read()
+            if extension == '.txt':
+                sample['label_text'] = data.decode()
+            elif extension == '.json':
+                sample['source'] = json.loads(data)['source']
+            else:
+                sample['image_bytes'], sample['extension'] = data, extension
+    if sample:
+        yield sample
+
+
+# --- Streaming -----------------------------------------------------------------
+
+class ShardStream(IterableDataset):
+    """Sequential shard reader with a shuffle buffer, split across workers"""
+
+    def __init__(self, shard_dir, split='train', imgsz=640, shuffle_buffer=1000, shuffle=True,
+                 seed=0):
+        self.shard_dir = shard_dir
+        self.split = split
+        self.imgsz = imgsz
+        self.shuffle_buffer = shuffle_buffer if shuffle else 0
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.manifest = load_manifest(shard_dir, split)
+        self.names = self.manifest['names']
+
+    def __len__(self):
+        return self.manifest['samples']
+
+    def set_epoch(self, epoch):
+        """Different shard order and shuffle for every epoch"""
+
+        self.epoch = epoch
+
+    def _worker_shards(self):
+        shards = [os.path.join(self.shard_dir, shard['file']) for shard in self.manifest['shards']]
+        if self.shuffle:
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        worker = get_worker_info()
+        if worker is not None:
+            shards = shards[worker.id::worker.num_workers]
+        return shards
+
+    def _decode(self, sample):
+        image = decode_image_bytes(sample['image_bytes'])
+        if image is None:
+            return None
+        labels, _ = parse_label_text(sample.get('label_text', ''), sample.get('source', ''))
+        decoded = {'key': sample['key'], 'source': sample.get('source'), 'labels': labels,
+                   'orig_shape': image.shape[:2]}
+        if self.imgsz:
+            decoded['img'], decoded['ratio_pad'] = prepare_image(image, self.imgsz)
+        else:
+            decoded['image'] = image
+        return decoded
+
+    def __iter__(self):
+        worker = get_worker_info()
+        rng = random.Random((self.seed + self.epoch) * 1000 + (worker.id if worker else 0))
+        buffer = []
+        for shard in self._worker_shards():
+            for sample in iter_shard(shard):
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append(sample)
+                    continue
+                if buffer:
+                    index = rng.randrange(len(buffer))
+                    buffer[index], sample = sample, buffer[index]
+                decoded = self._decode(sample)
+                if decoded is not None:
+                    yield decoded
+        rng.shuffle(buffer)
+        for sample in buffer:
+            decoded = self._decode(sample)
+            if decoded is not None:
+                yield decoded
+
+
+def collate_samples(samples):
+    """Batch letterboxed samples the way ultralytics batches training data"""
+
+    labels = [sample['labels'] for sample in samples]
+    batch_idx = np.concatenate([np.full(len(l), i, dtype=np.float32)
+                                for i, l in enumerate(labels)]) if labels else np.zeros(0)
+    labels = np.concatenate(labels) if labels else np.zeros((0, 5), dtype=np.float32)
+    return {
+        'img': torch.from_numpy(np.stack([sample['img'] for sample in samples])),
+        'cls': torch.from_numpy(labels[:, :1]),
+        'bboxes': torch.from_numpy(labels[:, 1:5]),  # normalized xywh of the original image
+        'batch_idx': torch.from_numpy(batch_idx),
+        'ratio_pad': [sample['ratio_pad'] for sample in samples],
+        'ori_shape': [sample['orig_shape'] for sample in samples],
+        'keys': [sample['key'] for sample in samples],
+    }
+
+
+def stream_loader(shard_dir, split='train', batch_size=16, imgsz=640, workers=4,
+                  shuffle_buffer=1000, shuffle=True, seed=0):
+    """DataLoader over ShardStream; call loader.dataset.set_epoch(e) per epoch"""
+
+    dataset = ShardStream(shard_dir, split, imgsz, shuffle_buffer, shuffle, seed)
+    return DataLoader(dataset, batch_size=batch_size, num_workers=workers,
+                      collate_fn=collate_samples, persistent_workers=False,
+                      prefetch_factor=4 if workers else None)
+
+
+# --- Staging for ultralytics training ------------------------------------------
+
+def _stage_shard(shard_path, image_dir, label_dir):
+    for sample in iter_shard(shard_path):
+        name = sample['key']
+        with open(os.path.join(image_dir, name + sample['extension']), 'wb') as f:
+            f.write(sample['image_bytes'])
+        with open(os.path.join(label_dir, name + '.txt'), 'w') as f:
+            f.write(sample.get('label_text', ''))
+
+
+def stage_shards(shard_dir, stage_dir, splits=('train', 'val'), workers=8):
+    """Unpack shards to local disk as a YOLO dataset; returns its data.yaml path
+
+    Already staged splits (same manifest) are not unpacked again; a split
+    whose manifest changed is cleared and unpacked from scratch.
+    """
+
+    config = {'path': os.path.abspath(stage_dir)}
+    for split in splits:
+        if not os.path.exists(os.path.join(shard_dir, f'{split}.json')):
+            continue
+        manifest = load_manifest(shard_dir, split)
+        config[split] = f'images/{split}'
+        config['names'] = manifest['names']
+
+        marker = os.path.join(stage_dir, f'.{split}.staged.json')
+        if os.path.exists(marker):
+            with open(marker) as f:
+                if json.load(f) == manifest['shards']:
+                    print(f"✅ {split} already staged in {stage_dir}")
+                    continue
+
+        # Start from empty split dirs: keys and extensions of a re-packed dataset
+        # differ, so leftovers of the previous staging would end up in training
+        image_dir = os.path.join(stage_dir, 'images', split)
+        label_dir = os.path.join(stage_dir, 'labels', split)
+        if os.path.exists(marker):
+            os.remove(marker)
+        shutil.rmtree(image_dir, ignore_errors=True)
+        shutil.rmtree(label_dir, ignore_errors=True)
+        os.makedirs(image_dir, exist_ok=True)
+        os.makedirs(label_dir, exist_ok=True)
+        start = time.time()
+        shard_paths = [os.path.join(shard_dir, shard['file']) for shard in manifest['shards']]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_stage_shard, shard_paths, [image_dir] * len(shard_paths),
+                          [label_dir] * len(shard_paths)))
+        with open(marker, 'w') as f:
+            json.dump(manifest['shards'], f)
+        print(f"📦 Staged {manifest['samples']} {split} samples from {len(shard_paths)} shards "
+              f"in {time.time() - start:.1f}s")
+
+    data_path = os.path.join(stage_dir, 'data.yaml')
+    with open(data_path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return data_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack, stage and stream sharded YOLO datasets')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pack = commands.add_parser('pack', help='pack a YOLO dataset into tar shards')
+    pack.add_argument('--data', default='data.yaml', help='dataset yaml (e.g. coco.yaml)')
+    pack.add_argument('--output', required=True, help='shard output directory')
+    pack.add_argument('--splits', default='train,val')
+    pack.add_argument('--shard-size-mb', type=int, default=512)
+    pack.add_argument('--workers', type=int, default=16)
+
+    stage = commands.add_parser('stage', help='unpack shards to local disk for model.train()')
+    stage.add_argument('--shards', required=True)
+    stage.add_argument('--stage-dir', required=True)
+    stage.add_argument('--splits', default='train,val')
+
+    stream = commands.add_parser('stream', help='measure streaming read throughput')
+    stream.add_argument('--shards', required=True)
+    stream.add_argument('--split', default='train')
+    stream.add_argument('--batch', type=int, default=16)
+    stream.add_argument('--imgsz', type=int, default=640)
+    stream.add_argument('--workers', type=int, default=4)
+    stream.add_argument('--shuffle-buffer', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        config = load_dataset_config(args.data)
+        print(f"📦 Packing {args.data} ({config['root']}) into {args.output}")
+        for split in args.splits.split(','):
+            pack_split(config, split, args.output, args.shard_size_mb, args.workers)
+    elif args.command == 'stage':
+        data_path = stage_shards(args.shards, args.stage_dir, args.splits.split(','))
+        print(f"✅ Train with: model.train(data='{data_path}')")
+    else:
+        loader = stream_loader(args.shards, args.split, args.batch, args.imgsz, args.workers,
+                               args.shuffle_buffer)
+        start, images, boxes = time.time(), 0, 0
+        for batch in loader:
+            images += len(batch['keys'])
+            boxes += len(batch['cls'])
+        seconds = time.time() - start
+        print(f"✅ Streamed {images} images ({boxes} boxes) in {seconds:.2f}s "
+              f"({images / max(seconds, 1e-9):.1f} images/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Parallel Training Sweep Scheduler
+
+Runs a grid of training configurations concurrently instead of one at a time.
+The machine's cores are split into worker slots; each slot runs one training
+at a time in a fresh process pinned to its cores (CPU affinity), with torch,
+OpenMP and the dataloader workers limited to that many threads so jobs don't
+fight over the same cores.
+
+Sweep spec (YAML):
+
+    project: runs/sweep
+    threads_per_job: 8          # cores per slot; slots = available cores / this
+    image_cache: true           # share decoded images between jobs (image_cache.py)
+    base:                       # model.train() arguments common to every job
+      data: data.yaml
+      epochs: 20
+      patience: 10
+    grid:                       # every combination becomes one job
+      model: [yolov8n.pt, yolov8s.pt]
+      imgsz: [480, 640]
+      batch: [8, 16]
+      lr0: [0.01, 0.005]
+      augmentation: [default, night]
+    augmentations:              # named presets referenced by grid.augmentation
+      default: {}
+      night: {hsv_v: 0.6, hsv_s: 0.5, mosaic: 0.5}
+
+Interrupted sweeps resume where they stopped: finished jobs are skipped and
+jobs with a last.pt checkpoint continue from it. When all jobs are done a
+summary table built from every run's results.csv is printed and saved as
+<project>/sweep_summary.csv.
+
+Usage:
+    python sweep_scheduler.py sweep.yaml [--threads-per-job 8] [--slots 4]
+"""
+
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import get_context
+
+import yaml
+
+SUMMARY_FIELDS = ('name', 'status', 'epochs', 'best_epoch', 'map50', 'map50_95',
+                  'precision', 'recall', 'train_minutes')
+
+
+def load_spec(path):
+    with open(path) as f:
+        spec = yaml.safe_load(f) or {}
+    spec.setdefault('project', 'runs/sweep')
+    spec.setdefault('base', {})
+    spec.setdefault('grid', {})
+    spec.setdefault('augmentations', {'default': {}})
+    return spec
+
+
+def _value_label(value):
+    if isinstance(value, str):
+        return os.path.splitext(os.path.basename(value))[0]
+    return f'{value:g}' if isinstance(value, float) else str(value)
+
+
+def expand_jobs(spec):
+    """One job dict (name + train arguments) per combination of the grid"""
+
+    grid = spec['grid']
+    keys = list(grid)
+    jobs = []
+    for values in product(*(grid[key] if isinstance(grid[key], list) else [grid[key]]
+                            for key in keys)):
+        params = dict(zip(keys, values))
+        name = '_'.join(f'{key}{_value_label(value)}' if key not in ('model', 'augmentation')
+                        else _value_label(value) for key, value in params.items())
+
+        train_args = dict(spec['base'])
+        augmentation = params.pop('augmentation', None)
+        if augmentation is not None:
+            if augmentation not in spec['augmentations']:
+                raise ValueError(f"Unknown augmentation preset '{augmentation}'")
+            train_args.update(spec['augmentations'][augmentation])
+        model = params.pop('model', train_args.pop('model', 'yolov8n.pt'))
+        train_args.update(params)
+        jobs.append({'name': name or 'run', 'model': model, 'train_args': train_args})
+    return jobs
+
+
+def make_slots(threads_per_job=None, slots=None):
+    """Split the cores this process may use into contiguous per-job core sets"""
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+        else list(range(os.cpu_count() or 1))
+    if slots is None:
+        slots = max(1, len(cores) // (threads_per_job or len(cores)))
+    slots = max(1, min(slots, len(cores)))
+    per_slot = len(cores) // slots
+    return [cores[i * per_slot:(i + 1) * per_slot] for i in range(slots)]
+
+
+def run_job(job, cores, project, image_cache=False, log_path=None):
+    """Train one configuration; runs inside a fresh process pinned to cores"""
+
+    threads = str(len(cores))
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[variable] = threads
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+
+    if log_path:
+        # Concurrent jobs would interleave their progress bars on the terminal
+        log = open(log_path, 'a', buffering=1)
+        os.dup2(log.fileno(), sys.stdout.fileno())
+        os.dup2(log.fileno(), sys.stderr.fileno())
+
+    import torch
+    torch.set_num_threads(len(cores))
+    from ultralytics import YOLO
+
+    from training_profiler import add_training_profiler
+
+    trainer = None
+    if image_cache:
+        from image_cache import CachedDetectionTrainer as trainer
+
+    start = time.perf_counter()
+    last_checkpoint = os.path.join(project, job['name'], 'weights', 'last.pt')
+    if os.path.exists(last_checkpoint):
+        # ultralytics marks finished checkpoints with epoch -1; nothing to resume
+        if torch.load(last_checkpoint, map_location='cpu', weights_only=False).get('epoch', -1) == -1:
+            print(f"⏭️  {job['name']} had already finished training")
+            return 0.0
+        print(f"🔁 Resuming {job['name']} from {last_checkpoint}")
+        model = YOLO(last_checkpoint)
+        add_training_profiler(model)
+        model.train(resume=True, trainer=trainer)
+    else:
+        train_args = {'device': 'cpu', **job['train_args']}
+        # Dataloader workers share the slot's cores (ultralytics defaults to 8 per job)
+        train_args['workers'] = min(len(cores), train_args.get('workers', 8))
+        model = YOLO(job['model'])
+        add_training_profiler(model)
+        model.train(project=project, name=job['name'], exist_ok=True, plots=False,
+                    trainer=trainer, **train_args)
+    return time.perf_counter() - start
+
+
+class SweepState:
+    """Job statuses persisted in <project>/sweep_state.json for resuming"""
+
+    def __init__(self, project):
+        self.path = os.path.join(project, 'sweep_state.json')
+        self._lock = threading.Lock()
+        self.jobs = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.jobs = json.load(f)
+
+    def status(self, name):
+        return self.jobs.get(name, {}).get('status')
+
+    def update(self, name, **fields):
+        with self._lock:
+            self.jobs.setdefault(name, {}).update(fields)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.jobs, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def run_sweep(spec, slots):
+    """Run every pending job of the spec on the given core slots"""
+
+    project = os.path.abspath(spec['project'])
+    os.makedirs(project, exist_ok=True)
+    state = SweepState(project)
+    jobs = expand_jobs(spec)
+    pending = queue.Queue()
+    for job in jobs:
+        if state.status(job['name']) == 'done':
+            print(f"⏭️  {job['name']} already finished")
+        else:
+            pending.put(job)
+
+    print(f"🚀 {pending.qsize()} of {len(jobs)} jobs to run on {len(slots)} slots "
+          f"of {len(slots[0])} cores")
+    spawn = get_context('spawn')
+
+    def slot_worker(cores):
+        while True:
+            try:
+                job = pending.get_nowait()
+            except queue.Empty:
+                return
+            log_path = os.path.join(project, f"{job['name']}.log")
+            print(f"▶️  {job['name']} on cores {cores[0]}-{cores[-1]} (log: {log_path})")
+            state.update(job['name'], status='running', model=job['model'],
+                         train_args={k: str(v) for k, v in job['train_args'].items()})
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    seconds = pool.submit(run_job, job, cores, project,
+                                          spec.get('image_cache', False), log_path).result()
+                state.update(job['name'], status='done', train_minutes=seconds / 60)
+                print(f"✅ {job['name']} finished in {seconds / 60:.1f} min")
+            except Exception:
+                state.update(job['name'], status='failed', error=traceback.format_exc(limit=3))
+                print(f"❌ {job['name']} failed, see {log_path}")
+
+    threads = [threading.Thread(target=slot_worker, args=(cores,), daemon=True) for cores in slots]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(project, jobs, state)
+
+
+def _metric(row, name):
+    for key, value in row.items():
+        if key.strip() == name:
+            return float(value)
+    return float('nan')
+
+
+def summarize(project, jobs, state):
+    """Best epoch of every job from its results.csv (by ultralytics fitness)"""
+
+    summary = []
+    for job in jobs:
+        row = {'name': job['name'], 'status': state.status(job['name']) or 'pending',
+               'train_minutes': state.jobs.get(job['name'], {}).get('train_minutes')}
+        results_path = os.path.join(project, job['name'], 'results.csv')
+        if os.path.exists(results_path):
+            with open(results_path) as f:
+                epochs = list(csv.DictReader(f))
+            if epochs:
+                best = max(epochs, key=lambda r: 0.1 * _metric(r, 'metrics/mAP50(B)') +
+                           0.9 * _metric(r, 'metrics/mAP50-95(B)'))
+                row.update({
+                    # a resumed run can log its interrupted epoch twice
+                    'epochs': len({int(_metric(r, 'epoch')) for r in epochs}),
+                    'best_epoch': int(_metric(best, 'epoch')),
+                    'map50': _metric(best, 'metrics/mAP50(B)'),
+                    'map50_95': _metric(best, 'metrics/mAP50-95(B)'),
+                    'precision': _metric(best, 'metrics/precision(B)'),
+                    'recall': _metric(best, 'metrics/recall(B)'),
+                })
+        summary.append(row)
+
+    summary.sort(key=lambda row: -(row.get('map50_95') or 0))
+    summary_path = os.path.join(project, 'sweep_summary.csv')
+    with open(summary_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summary)
+    print_summary(summary)
+    print(f"\n✅ Summary saved as: {summary_path}")
+    return summary
+
+
+def print_summary(summary):
+    width = max([len(row['name']) for row in summary] + [4])
+    print(f"\n{'Run':<{width}} | {'Status':<7} | {'Epochs':>6} | {'mAP50':>6} | "
+          f"{'mAP50-95':>8} | {'Minutes':>7}")
+    print("-" * (width + 50))
+    for row in summary:
+        def fmt(key, spec):
+            return format(row[key], spec) if row.get(key) is not None else '-'
+        print(f"{row['name']:<{width}} | {row['status']:<7} | {fmt('epochs', 'd'):>6} | "
+              f"{fmt('map50', '.4f'):>6} | {fmt('map50_95', '.4f'):>8} | "
+              f"{fmt('train_minutes', '.1f'):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a training sweep in parallel')
+    parser.add_argument('spec', help='sweep spec YAML')
+    parser.add_argument('--threads-per-job', type=int,
+                        help='cores per job (default: threads_per_job from the spec, or 8)')
+    parser.add_argument('--slots', type=int, help='number of concurrent jobs (overrides '
+                                                  '--threads-per-job)')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='only rebuild the summary table from existing runs')
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    if args.summary_only:
+        project = os.path.abspath(spec['project'])
+        summarize(project, expand_jobs(spec), SweepState(project))
+        return 0
+
+    slots = make_slots(args.threads_per_job or spec.get('threads_per_job', 8), args.slots)
+    summary = run_sweep(spec, slots)
+    return 1 if any(row['status'] == 'failed' for row in summary) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,16 +4,55 @@ Custom Model Testing Script
 Test your trained indoor/night object detection model on new images.
 """
 
-from ultralytics import YOLO
 import cv2
 import os
+import time
 
-def test_custom_model_single(image_path):
-    """Test custom model on a single image"""
+from export_backend import custom_model_path
+from inference_metrics import configure_from_env, get_metrics, instrumented, print_stage_summary
+from model_registry import CUSTOM_MODEL_PATH, PRETRAINED_MODEL_PATH, get_model
+from preprocess import IMAGE_EXTENSIONS
+
+# Modules that pull in torch/ultralytics are imported inside the functions
+# that use them, so the menu (and the deploy backend) start without them
+
+# Backend for the custom model: pt, onnx, onnx-int8, openvino-int8 or deploy
+# (export the onnx/openvino backends first with: python export_backend.py,
+# the fast-loading deploy artifact with: python deploy_artifact.py)
+CUSTOM_MODEL_BACKEND = os.environ.get('CUSTOM_MODEL_BACKEND', 'pt')
+CUSTOM_MODEL = custom_model_path(CUSTOM_MODEL_BACKEND)
+
+# Cascade mode: this model runs first at the reduced imgsz, the custom model
+# only on images it is unsure about (tune thresholds with: python cascade.py evaluate)
+CASCADE_FAST_MODEL = os.environ.get('CASCADE_FAST_MODEL', CUSTOM_MODEL)
+CASCADE_FAST_IMGSZ = int(os.environ.get('CASCADE_FAST_IMGSZ', 320))
+CASCADE_ESCALATE_CONF = float(os.environ.get('CASCADE_ESCALATE_CONF', 0.5))
+
+# Per-stage timings of every entry point below; export them with
+# INFERENCE_METRICS_PORT / INFERENCE_METRICS_JSON (see inference_metrics.py)
+metrics = get_metrics()
+
+@instrumented('single')
+def test_custom_model_single(image_path, tiled=False):
+    """Test custom model on a single image
+
+    With tiled=True the image is cut into overlapping 640px tiles that run as
+    one batch (see tiled_inference.py), so small objects in large captures
+    are not lost to downscaling.
+    """
     
-    model_path = 'runs/custom/indoor_night2/weights/best.pt'
+    return _run_single(image_path, tiled)
+
+def _run_single(image_path, tiled=False, sink=None):
+    """test_custom_model_single without the request metrics, for callers that
+    are entry points themselves (folder, compare)
+
+    The annotated image is rendered by sink (a ResultSink writing
+    <name>_custom_detection.jpg), or by a sink of its own that is closed
+    before returning.
+    """
     
-    if not os.path.exists(model_path):
+    if not os.path.exists(CUSTOM_MODEL):
         print("❌ Custom model not found!")
         print("   Train your model first using: python train_custom.py")
         return
@@ -25,51 +64,94 @@ def test_custom_model_single(image_path):
     print(f"🌙 Testing custom model on: {image_path}")
     print("=" * 50)
     
-    # Load your custom trained model
-    model = YOLO(model_path)
-    
-    # Run detection
-    results = model(image_path)
-    
-    # Save result image
     base_name = os.path.splitext(os.path.basename(image_path))[0]
     output_path = f'{base_name}_custom_detection.jpg'
     
-    for r in results:
-        im_array = r.plot()
-        cv2.imwrite(output_path, im_array)
+    if CUSTOM_MODEL_BACKEND == 'deploy' and not tiled:
+        # Lightweight loader: no ultralytics import, no checkpoint unpickling
+        from deploy_artifact import draw_detections, get_artifact, is_stale
+        
+        if os.path.exists(CUSTOM_MODEL_PATH) and is_stale(CUSTOM_MODEL, CUSTOM_MODEL_PATH):
+            print(f"⚠️  {CUSTOM_MODEL} was built from older weights, "
+                  f"rebuild it with: python deploy_artifact.py")
+        prediction = get_artifact(CUSTOM_MODEL).predict(image_path)
+        if prediction is None:
+            print(f"❌ Could not read {image_path}")
+            return
+        detections, original = prediction
+        with metrics.stage('plot'):
+            im_array = draw_detections(original, detections)
+        with metrics.stage('imwrite'):
+            cv2.imwrite(output_path, im_array)
+        results = detections
+    else:
+        from detections import Detections
+        
+        # Get the shared custom model (loaded and warmed up once per process)
+        model = get_model(CUSTOM_MODEL)
+        
+        # Run detection
+        if tiled:
+            from tiled_inference import tiled_predict
+            results = [tiled_predict(model, image_path)]
+        else:
+            with metrics.stage('decode'):
+                image = cv2.imread(image_path)
+            if image is None:
+                print(f"❌ Could not read {image_path}")
+                return
+            results = model(image)
+            metrics.record_speed(results)
+            for r in results:
+                r.path = image_path  # name the rendered image after the file
+        
+        # Save result image (plot and imwrite run on the sink's render threads)
+        if sink is None:
+            from result_sink import ResultSink
+            with ResultSink(render_dir='.', render_suffix='_custom_detection.jpg') as own_sink:
+                for r in results:
+                    own_sink.add(r)
+        else:
+            for r in results:
+                sink.add(r)
+        detections = Detections.from_results(results)
     
     print(f"✅ Result saved as: {output_path}")
     
     # Print detected objects
     print("\n📋 Custom model detected:")
-    total_detections = 0
-    for r in results:
-        boxes = r.boxes
-        if boxes is not None:
-            for box in boxes:
-                class_id = int(box.cls[0])
-                class_name = model.names[class_id]
-                confidence = float(box.conf[0])
-                print(f"   - {class_name}: {confidence:.3f} confidence")
-                total_detections += 1
-    
-    if total_detections == 0:
+    for class_name, confidence in zip(detections.class_names, detections.conf.tolist()):
+        print(f"   - {class_name}: {confidence:.3f} confidence")
+    
+    if len(detections) == 0:
         print("   - No objects detected")
+    else:
+        summary = ', '.join(f"{count} {name}" for name, count in detections.counts().items())
+        print(f"   Total: {len(detections)} ({summary})")
     
     return results
 
-def test_custom_model_folder(folder_path):
-    """Test custom model on all images in a folder"""
+@instrumented('folder')
+def test_custom_model_folder(folder_path, batch_size=1, tiled=False, save_images=True,
+                             detections_path='detections.jsonl', processes=1):
+    """Test custom model on all images in a folder
+
+    With batch_size > 1 images are decoded ahead of time on a thread pool and
+    run through the model in batches (see batch_inference.py); detections are
+    written to detections_path (.jsonl or .parquet) and annotated images are
+    only rendered when save_images is set. With processes > 1 the batches are
+    spread over that many worker processes sharing one copy of the weights
+    (see worker_pool.py). With tiled=True each image is processed as a batch
+    of tiles instead.
+    """
     
     if not os.path.exists(folder_path):
         print(f"❌ Folder {folder_path} not found!")
         return
     
     # Find all image files
-    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
     image_files = [f for f in os.listdir(folder_path) 
-                   if f.lower().endswith(image_extensions)]
+                   if f.lower().endswith(IMAGE_EXTENSIONS)]
     
     if not image_files:
         print(f"❌ No image files found in {folder_path}")
@@ -78,11 +160,179 @@ def test_custom_model_folder(folder_path):
     print(f"🌙 Testing custom model on {len(image_files)} images in: {folder_path}")
     print("=" * 60)
     
-    for image_file in image_files:
-        image_path = os.path.join(folder_path, image_file)
-        print(f"\n🖼️  Processing: {image_file}")
-        test_custom_model_single(image_path)
+    if batch_size > 1 and not tiled:
+        if not os.path.exists(CUSTOM_MODEL):
+            print("❌ Custom model not found!")
+            print("   Train your model first using: python train_custom.py")
+            return
+        
+        image_paths = [os.path.join(folder_path, f) for f in image_files]
+        if processes > 1:
+            if CUSTOM_MODEL_BACKEND != 'pt':
+                print(f"⚠️  Worker processes need the pt backend, running "
+                      f"{CUSTOM_MODEL_BACKEND} in one process")
+            else:
+                from worker_pool import print_pool_stats, run_pool
+                stats = run_pool(CUSTOM_MODEL, image_paths, processes, batch_size=batch_size,
+                                 save_images=save_images, detections_path=detections_path)
+                print_pool_stats(stats)
+                print(f"📄 {stats['detections']} detections saved to: {detections_path}")
+                return stats
+        
+        from batch_inference import run_batched_inference
+        
+        model = get_model(CUSTOM_MODEL)
+        
+        def report(result):
+            count = len(result.boxes) if result.boxes is not None else 0
+            print(f"🖼️  {os.path.basename(result.path)}: {count} objects")
+        
+        stats = run_batched_inference(model, image_paths, batch_size=batch_size,
+                                      save_images=save_images, detections_path=detections_path,
+                                      on_result=report)
+        print(f"\n⚡ Processed {stats['images']} images in {stats['seconds']:.1f}s "
+              f"({stats['images_per_sec']:.2f} images/sec)")
+        print(f"📄 {stats['detections']} detections saved to: {detections_path}")
+        return stats
+    
+    from result_sink import ResultSink
+    
+    # One sink for the folder, so rendering overlaps the next image's inference
+    start = time.perf_counter()
+    with ResultSink(render_dir='.', render_suffix='_custom_detection.jpg') as sink:
+        for image_file in image_files:
+            image_path = os.path.join(folder_path, image_file)
+            print(f"\n🖼️  Processing: {image_file}")
+            _run_single(image_path, tiled=tiled, sink=sink)
+    
+    elapsed = time.perf_counter() - start
+    print(f"\n⚡ Processed {len(image_files)} images in {elapsed:.1f}s "
+          f"({len(image_files) / elapsed:.2f} images/sec)")
+
+@instrumented('cascade')
+def test_custom_model_cascade(folder_path, batch_size=8, save_images=True,
+                              detections_path='detections.jsonl'):
+    """Test on a folder with the model cascade
+
+    The fast model (CASCADE_FAST_MODEL at CASCADE_FAST_IMGSZ) runs on every
+    image; only images with low-confidence or ambiguous detections are run
+    through the custom model at full resolution (see cascade.py).
+    """
+    
+    if not os.path.exists(folder_path):
+        print(f"❌ Folder {folder_path} not found!")
+        return
+    
+    for weights in (CASCADE_FAST_MODEL, CUSTOM_MODEL):
+        if not os.path.exists(weights):
+            print(f"❌ Model {weights} not found!")
+            print("   Train your model first using: python train_custom.py")
+            return
+    
+    image_paths = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path))
+                   if f.lower().endswith(IMAGE_EXTENSIONS)]
+    if not image_paths:
+        print(f"❌ No image files found in {folder_path}")
+        return
+    
+    print(f"🌙 Cascade on {len(image_paths)} images in: {folder_path}")
+    print(f"   fast: {CASCADE_FAST_MODEL} @{CASCADE_FAST_IMGSZ}, full: {CUSTOM_MODEL} @640, "
+          f"escalate below conf {CASCADE_ESCALATE_CONF}")
+    print("=" * 60)
+    
+    def report(result, escalated):
+        count = len(result.boxes) if result.boxes is not None else 0
+        print(f"🖼️  {os.path.basename(result.path)}: {count} objects"
+              f"{' (escalated)' if escalated else ''}")
+    
+    from cascade import Cascade, print_cascade_stats
+    
+    cascade = Cascade(CASCADE_FAST_MODEL, CUSTOM_MODEL, fast_imgsz=CASCADE_FAST_IMGSZ,
+                      escalate_conf=CASCADE_ESCALATE_CONF)
+    stats = cascade.run(image_paths, batch_size, save_images=save_images,
+                        detections_path=detections_path, on_result=report)
+    print_cascade_stats(stats)
+    print(f"📄 {stats['detections']} detections saved to: {detections_path}")
+    return stats
 
+@instrumented('bulk')
+def test_custom_model_bulk(source, shard=0, shards=1, job_dir=None, processes=1):
+    """Resumable bulk job over a whole directory tree (see bulk_jobs.py)
+
+    Rerunning with the same arguments skips every chunk that already
+    finished; shard i of n lets several machines share one corpus.
+    """
+    
+    if not os.path.isdir(source):
+        print(f"❌ Folder {source} not found!")
+        return
+    
+    if not os.path.exists(CUSTOM_MODEL):
+        print("❌ Custom model not found!")
+        print("   Train your model first using: python train_custom.py")
+        return
+    
+    if processes > 1 and CUSTOM_MODEL_BACKEND != 'pt':
+        print(f"⚠️  Worker processes need the pt backend, running "
+              f"{CUSTOM_MODEL_BACKEND} in one process")
+        processes = 1
+    
+    job_dir = job_dir or os.path.join('runs', 'bulk',
+                                      os.path.basename(os.path.abspath(source)))
+    print(f"🌙 Bulk job: shard {shard} of {shards} of {source} -> {job_dir}")
+    print("=" * 60)
+    from bulk_jobs import run_shard
+    
+    totals = run_shard(source, job_dir, shard, shards, CUSTOM_MODEL, processes=processes)
+    if totals is None:
+        return
+    print(f"\n⚡ {totals['chunks']} chunks ({totals['images']} images, "
+          f"{totals['detections']} detections) in {totals['seconds']:.1f}s; "
+          f"{totals['skipped_chunks']} chunks already done")
+    print(f"📄 Detections saved per chunk in: {job_dir}")
+    return totals
+
+@instrumented('video')
+def test_custom_model_video(source, frame_stride=1):
+    """Test custom model on a video file or camera index (e.g. '0')
+
+    Frames are read, detected and written on separate threads; with
+    frame_stride=k only every k-th frame is run through the model.
+    """
+    
+    if not os.path.exists(CUSTOM_MODEL):
+        print("❌ Custom model not found!")
+        print("   Train your model first using: python train_custom.py")
+        return
+    
+    if not str(source).isdigit() and not os.path.exists(source):
+        print(f"❌ Video {source} not found!")
+        return
+    
+    print(f"🎥 Testing custom model on: {source}")
+    print("=" * 50)
+    
+    from video_detection import VideoPipeline, print_video_stats
+    
+    model = get_model(CUSTOM_MODEL)
+    
+    if str(source).isdigit():
+        output_path = f'camera{source}_custom_detection.mp4'
+    else:
+        output_path = f'{os.path.splitext(os.path.basename(source))[0]}_custom_detection.mp4'
+    
+    pipeline = VideoPipeline(model, source, output_path=output_path, frame_stride=frame_stride)
+    try:
+        stats = pipeline.run()
+    except IOError as e:
+        print(f"❌ {e}")
+        return
+    
+    print(f"✅ Result saved as: {output_path}")
+    print_video_stats(stats)
+    return stats
+
+@instrumented('compare')
 def compare_models(image_path):
     """Compare custom model vs pre-trained model"""
     
@@ -97,61 +347,138 @@ def compare_models(image_path):
     
     # Test pre-trained model
     print("🔄 Testing PRE-TRAINED model...")
-    pretrained_model = YOLO('yolov8n.pt')
+    pretrained_model = get_model(PRETRAINED_MODEL_PATH)
     results_pretrained = pretrained_model(image_path)
+    metrics.record_speed(results_pretrained)
     
-    for r in results_pretrained:
-        im_array = r.plot()
-        cv2.imwrite(f'{base_name}_pretrained.jpg', im_array)
-    
-    print("📋 Pre-trained model detected:")
-    for r in results_pretrained:
-        boxes = r.boxes
-        if boxes is not None:
-            for box in boxes:
-                class_id = int(box.cls[0])
-                class_name = pretrained_model.names[class_id]
-                confidence = float(box.conf[0])
-                print(f"   - {class_name}: {confidence:.3f}")
+    from detections import Detections
+    from result_sink import ResultSink
     
-    # Test custom model
-    print("\n🌙 Testing CUSTOM model...")
-    test_custom_model_single(image_path)
+    # The pre-trained image renders in the background while the custom model runs
+    with ResultSink(render_dir='.', render_suffix='_pretrained.jpg') as sink:
+        for r in results_pretrained:
+            sink.add(r)
+        
+        print("📋 Pre-trained model detected:")
+        detections = Detections.from_results(results_pretrained)
+        for class_name, confidence in zip(detections.class_names, detections.conf.tolist()):
+            print(f"   - {class_name}: {confidence:.3f}")
+        
+        # Test custom model
+        print("\n🌙 Testing CUSTOM model...")
+        _run_single(image_path)
     
     print(f"\n🎯 Comparison complete!")
     print(f"   📸 {base_name}_pretrained.jpg - Pre-trained results")
     print(f"   📸 {base_name}_custom_detection.jpg - Custom results")
 
+@instrumented('compare_folder')
+def compare_models_folder(folder_path, report_path='model_comparison.json'):
+    """Compare custom vs pre-trained model on every image in a folder
+
+    Each image is decoded once and shared by both models; box-level
+    agreement statistics are printed and saved as JSON.
+    """
+    
+    if not os.path.exists(folder_path):
+        print(f"❌ Folder {folder_path} not found!")
+        return
+    
+    if not os.path.exists(CUSTOM_MODEL):
+        print("❌ Custom model not found!")
+        print("   Train your model first using: python train_custom.py")
+        return
+    
+    image_paths = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path))
+                   if f.lower().endswith(IMAGE_EXTENSIONS)]
+    if not image_paths:
+        print(f"❌ No image files found in {folder_path}")
+        return
+    
+    print(f"🔍 Comparing models on {len(image_paths)} images in: {folder_path}")
+    print("=" * 60)
+    
+    from model_comparison import compare_models_on_images, print_report, save_report
+    
+    models = {
+        'pretrained': get_model(PRETRAINED_MODEL_PATH),
+        'custom': get_model(CUSTOM_MODEL),
+    }
+    report = compare_models_on_images(models, image_paths)
+    print_report(report)
+    save_report(report, report_path)
+    print(f"\n✅ Report saved as: {report_path}")
+    return report
+
 def main():
     """Main testing function"""
     
+    configure_from_env()
+    
     print("🌙 Custom Indoor/Night Object Detection Testing")
+    print(f"   Backend: {CUSTOM_MODEL_BACKEND} ({CUSTOM_MODEL})")
     print("=" * 60)
     print("1. Test on single image")
     print("2. Test on folder of images")
     print("3. Compare custom vs pre-trained model")
-    print("4. Exit")
+    print("4. Compare custom vs pre-trained model on a folder")
+    print("5. Test on video file or camera")
+    print("6. Test on folder with model cascade (fast model first)")
+    print("7. Resumable bulk job over a directory tree")
+    print("8. Exit")
     
     while True:
-        choice = input("\nEnter your choice (1-4): ").strip()
+        choice = input("\nEnter your choice (1-8): ").strip()
         
         if choice == '1':
             image_path = input("Enter path to image: ").strip()
-            test_custom_model_single(image_path)
+            tiled = input("Use tiled inference for large images? (y/N): ").strip().lower() == 'y'
+            test_custom_model_single(image_path, tiled=tiled)
             break
         elif choice == '2':
             folder_path = input("Enter path to folder: ").strip()
-            test_custom_model_folder(folder_path)
+            tiled = input("Use tiled inference for large images? (y/N): ").strip().lower() == 'y'
+            batch_size = '' if tiled else input("Batch size (Enter for 1): ").strip()
+            save_images, processes = True, ''
+            if batch_size and int(batch_size) > 1:
+                save_images = input("Save annotated images? (Y/n): ").strip().lower() != 'n'
+                processes = input("Worker processes (Enter for 1): ").strip()
+            test_custom_model_folder(folder_path, int(batch_size) if batch_size else 1, tiled,
+                                     save_images, processes=int(processes) if processes else 1)
             break
         elif choice == '3':
             image_path = input("Enter path to image: ").strip()
             compare_models(image_path)
             break
         elif choice == '4':
+            folder_path = input("Enter path to folder: ").strip()
+            compare_models_folder(folder_path)
+            break
+        elif choice == '5':
+            source = input("Enter path to video (or camera index, e.g. 0): ").strip()
+            stride = input("Process every k-th frame (Enter for 1): ").strip()
+            test_custom_model_video(source, int(stride) if stride else 1)
+            break
+        elif choice == '6':
+            folder_path = input("Enter path to folder: ").strip()
+            save_images = input("Save annotated images? (Y/n): ").strip().lower() != 'n'
+            test_custom_model_cascade(folder_path, save_images=save_images)
+            break
+        elif choice == '7':
+            source = input("Enter path to image tree: ").strip()
+            shard = input("Shard i/n (Enter for all, e.g. 0/4): ").strip()
+            shard, shards = (int(part) for part in shard.split('/')) if shard else (0, 1)
+            processes = input("Worker processes (Enter for 1): ").strip()
+            test_custom_model_bulk(source, shard, shards,
+                                   processes=int(processes) if processes else 1)
+            break
+        elif choice == '8':
             print("Goodbye!")
             break
         else:
-            print("Invalid choice. Please enter 1-4.")
+            print("Invalid choice. Please enter 1-8.")
+    
+    print_stage_summary(metrics.snapshot())
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -4,8 +4,10 @@ Test Your Trained YOLOv8 Model
 This script demonstrates how to use your trained model and compare it with the pre-trained model.
 """
 
-from ultralytics import YOLO
 import cv2
+import os
+
+from model_registry import CUSTOM_MODEL_PATH, PRETRAINED_MODEL_PATH, get_model
 
 def test_pretrained_model():
     """Test the original pre-trained model"""
@@ -14,7 +16,7 @@ def test_pretrained_model():
     print("=" * 50)
     
     # Load pre-trained model
-    model = YOLO('yolov8n.pt')
+    model = get_model(PRETRAINED_MODEL_PATH)
     
     # Test on bus.jpg
     results = model('bus.jpg')
@@ -27,14 +29,12 @@ def test_pretrained_model():
     print("✅ Pre-trained model results saved as 'bus_pretrained_result.jpg'")
     
     # Print detected objects
+    from detections import Detections
+    
     print("\n📋 Pre-trained model detected:")
-    for r in results:
-        boxes = r.boxes
-        for box in boxes:
-            class_id = int(box.cls[0])
-            class_name = model.names[class_id]
-            confidence = float(box.conf[0])
-            print(f"   - {class_name}: {confidence:.3f} confidence")
+    detections = Detections.from_results(results)
+    for class_name, confidence in zip(detections.class_names, detections.conf.tolist()):
+        print(f"   - {class_name}: {confidence:.3f} confidence")
     
     return results
 
@@ -45,7 +45,7 @@ def test_trained_model():
     print("=" * 50)
     
     # Load YOUR trained model
-    model = YOLO('runs/detect/yolov8_coco8/weights/best.pt')
+    model = get_model('runs/detect/yolov8_coco8/weights/best.pt')
     
     # Test on the same bus.jpg
     results = model('bus.jpg')
@@ -58,14 +58,12 @@ def test_trained_model():
     print("✅ Trained model results saved as 'bus_trained_result.jpg'")
     
     # Print detected objects
+    from detections import Detections
+    
     print("\n📋 Your trained model detected:")
-    for r in results:
-        boxes = r.boxes
-        for box in boxes:
-            class_id = int(box.cls[0])
-            class_name = model.names[class_id]
-            confidence = float(box.conf[0])
-            print(f"   - {class_name}: {confidence:.3f} confidence")
+    detections = Detections.from_results(results)
+    for class_name, confidence in zip(detections.class_names, detections.conf.tolist()):
+        print(f"   - {class_name}: {confidence:.3f} confidence")
     
     return results
 
@@ -93,11 +91,11 @@ def test_on_different_image(image_path):
     print("=" * 50)
     
     # Pre-trained model
-    pretrained_model = YOLO('yolov8n.pt')
+    pretrained_model = get_model(PRETRAINED_MODEL_PATH)
     results_pretrained = pretrained_model(image_path)
     
     # Your trained model  
-    trained_model = YOLO('runs/custom/indoor_night2/weights/best.pt')
+    trained_model = get_model(CUSTOM_MODEL_PATH)
     results_trained = trained_model(image_path)
     
     # Save results
@@ -156,5 +154,4 @@ def main():
             print("Invalid choice. Please enter 1-5.")
 
 if __name__ == "__main__":
-    import os
     main() 
\ No newline at end of file
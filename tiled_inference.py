@@ -0,0 +1,140 @@
+"""
+Tiled (Sliced) Inference for High-Resolution Images
+
+Plain model(image) shrinks a 4000x3000 capture to imgsz=640, and small
+objects (frames, lamps, nightstands) disappear. Tiled inference instead:
+
+1. cuts the image into overlapping tile x tile crops (plus, optionally, the
+   whole image downscaled, so very large objects are still seen in one piece)
+2. skips tiles with almost no texture (flat walls, black night sky)
+3. runs all remaining tiles through the model as one batch
+4. maps boxes back to global coordinates and merges duplicates from
+   overlapping tiles with class-aware NMS or weighted box fusion (WBF)
+
+Every tile is processed at native resolution, so cost grows with the number
+of tiles instead of quadratically with imgsz.
+"""
+
+import cv2
+import numpy as np
+import torch
+import torchvision
+from ultralytics.engine.results import Results
+
+from inference_metrics import get_metrics
+from model_comparison import box_iou
+from preprocess import prepare_image, scale_boxes_to_original
+
+metrics = get_metrics()
+
+
+def make_tiles(height, width, tile_size=640, overlap=0.2):
+    """Top-left/bottom-right corners of overlapping tiles covering the image"""
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = max(1, int(tile_size * (1 - overlap)))
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)  # last tile flush with the edge
+        return positions
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def is_low_variance(tile, threshold=4.0):
+    """True for near-uniform tiles (grayscale std below threshold)"""
+
+    small = cv2.resize(tile, (64, 64), interpolation=cv2.INTER_AREA)
+    return float(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).std()) < threshold
+
+
+def class_aware_nms(detections, iou_threshold=0.5):
+    """Indices of detections ((N, 6) xyxy, conf, cls) kept by per-class NMS"""
+
+    boxes = torch.as_tensor(detections[:, :4], dtype=torch.float32)
+    scores = torch.as_tensor(detections[:, 4], dtype=torch.float32)
+    classes = torch.as_tensor(detections[:, 5], dtype=torch.int64)
+    return torchvision.ops.batched_nms(boxes, scores, classes, iou_threshold).numpy()
+
+
+def weighted_box_fusion(detections, iou_threshold=0.5):
+    """Fuse overlapping same-class boxes into confidence-weighted averages
+
+    NMS picks one representative per cluster; every box is then assigned to
+    the same-class representative it overlaps most, and each cluster's
+    coordinates are averaged with confidence weights.
+    """
+
+    keep = class_aware_nms(detections, iou_threshold)
+    kept = detections[keep]
+
+    iou = box_iou(detections[:, :4], kept[:, :4])
+    iou[detections[:, 5][:, None] != kept[:, 5][None, :]] = 0
+    cluster = iou.argmax(axis=1)
+    member = iou[np.arange(len(detections)), cluster] >= iou_threshold
+    cluster, members = cluster[member], detections[member]
+
+    weights = members[:, 4:5]
+    fused = np.zeros((len(kept), 4))
+    weight_sum = np.zeros(len(kept))
+    np.add.at(fused, cluster, members[:, :4] * weights)
+    np.add.at(weight_sum, cluster, weights[:, 0])
+
+    result = kept.copy()
+    result[:, :4] = fused / np.maximum(weight_sum, 1e-9)[:, None]
+    return result
+
+
+def tiled_predict(model, image_path, tile_size=640, overlap=0.2, conf=0.25,
+                  merge='nms', merge_iou=0.5, include_full_image=True,
+                  skip_low_variance=True, variance_threshold=4.0):
+    """Sliced inference on one image; returns an ultralytics Results object"""
+
+    with metrics.stage('decode'):
+        image = cv2.imread(image_path)
+    if image is None:
+        raise IOError(f"Could not read {image_path}")
+    height, width = image.shape[:2]
+
+    regions = make_tiles(height, width, tile_size, overlap)
+    # A single tile already covers the whole image; decided before dropping
+    # dark tiles, so large objects spanning them still get the full-image pass
+    tile_count = len(regions)
+    crops = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in regions]
+    if skip_low_variance:
+        informative = [not is_low_variance(crop, variance_threshold) for crop in crops]
+        regions = [r for r, keep in zip(regions, informative) if keep]
+        crops = [c for c, keep in zip(crops, informative) if keep]
+    if include_full_image and tile_count != 1:
+        regions.append((0, 0, width, height))
+        crops.append(image)
+
+    detections = np.zeros((0, 6), dtype=np.float32)
+    if crops:
+        with metrics.stage('preprocess'):
+            prepared = [prepare_image(crop, tile_size) for crop in crops]
+        inputs = torch.from_numpy(np.stack([model_input for model_input, _ in prepared]))
+        predictions = model(inputs, imgsz=tile_size, conf=conf, verbose=False)
+        metrics.record_speed(predictions, preprocess=False)
+
+        per_tile = []
+        for (x0, y0, _, _), crop, (_, ratio_pad), prediction in zip(regions, crops, prepared,
+                                                                    predictions):
+            boxes = scale_boxes_to_original(prediction.boxes.data.cpu().numpy(), ratio_pad,
+                                            crop.shape)
+            boxes[:, [0, 2]] += x0
+            boxes[:, [1, 3]] += y0
+            per_tile.append(boxes)
+        detections = np.concatenate(per_tile)
+
+    if len(detections):
+        with metrics.stage('nms'):
+            if merge == 'wbf':
+                detections = weighted_box_fusion(detections, merge_iou)
+            else:
+                detections = detections[class_aware_nms(detections, merge_iou)]
+
+    return Results(image, path=image_path, names=model.names,
+                   boxes=torch.as_tensor(detections, dtype=torch.float32))
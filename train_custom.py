@@ -13,41 +13,62 @@ Make sure to:
 from ultralytics import YOLO
 import os
 
+from dataset_checker import check_dataset, print_check_report
+from image_cache import CachedDetectionTrainer
+from incremental_validation import incremental_validate, print_validation_report
+from training_profiler import add_training_profiler
+
 def check_dataset_structure():
-    """Check if the dataset structure is correct"""
+    """Check every image/label pair of the dataset; returns True if training can start
+
+    Uses dataset_checker.py: corrupt images, out-of-range class ids (vs. nc in
+    data.yaml) and malformed boxes are errors. Pairs verified in an earlier
+    check are not opened again unless they changed.
+    """
     
-    required_dirs = [
-        'datasets/custom/images/train',
-        'datasets/custom/images/val',
-        'datasets/custom/labels/train',
-        'datasets/custom/labels/val'
-    ]
+    if not os.path.exists('data.yaml'):
+        print("❌ data.yaml NOT FOUND")
+        return False
+    print("✅ data.yaml found")
     
-    print("🔍 Checking dataset structure...")
-    for dir_path in required_dirs:
-        if os.path.exists(dir_path):
-            file_count = len([f for f in os.listdir(dir_path) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.txt'))])
-            print(f"✅ {dir_path} - {file_count} files")
-        else:
-            print(f"❌ {dir_path} - NOT FOUND")
+    print("🔍 Checking dataset images and labels...")
+    try:
+        report = check_dataset('data.yaml')
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        return False
+    print_check_report(report)
     
-    # Check data.yaml
-    if os.path.exists('data.yaml'):
-        print("✅ data.yaml found")
-    else:
-        print("❌ data.yaml NOT FOUND")
+    if not any(split['images'] for split in report['splits'].values()):
+        print("❌ No images found in datasets/custom/images/train or val")
+        return False
+    if report['errors']:
+        print(f"\n❌ {len(report['errors'])} files have errors, fix them before training")
+        return False
+    return True
 
-def train_custom_model():
-    """Train YOLOv8 on custom indoor/night dataset"""
+def train_custom_model(use_image_cache=True):
+    """Train YOLOv8 on custom indoor/night dataset
+
+    With use_image_cache, decoded and resized images come from the shared
+    memory-mapped cache (image_cache.py) instead of being decoded from JPEG
+    every epoch; the cache is reused by later experiments at the same imgsz.
+    """
     
     print("🌙 Starting Custom Indoor/Night Object Detection Training...")
     print("=" * 60)
     
     # Load pre-trained YOLOv8 model for transfer learning
     model = YOLO('yolov8n.pt')  # Start with nano model for faster training
+
+    # Phase timings (dataloader wait, forward, backward, val) -> timing.csv in the run dir
+    add_training_profiler(model)
     
     # Train the model
+    if use_image_cache:
+        print(f"🗃️  Using shared image cache: {CachedDetectionTrainer.cache_dir}")
     results = model.train(
+        trainer=CachedDetectionTrainer if use_image_cache else None,
         data='data.yaml',           # Custom dataset configuration
         epochs=20,                  # Adjust based on your dataset size
         imgsz=640,                  # Input image size
@@ -65,11 +86,16 @@ def train_custom_model():
     print("🎯 Custom training completed!")
     print(f"📁 Best model saved at: {results.save_dir}")
     print(f"📊 Results saved in: runs/custom/indoor_night/")
+    print(f"⏱️  Phase timings saved in: {os.path.join(results.save_dir, 'timing.csv')}")
     
     return results
 
-def validate_custom_model():
-    """Validate the trained custom model"""
+def validate_custom_model(incremental=True):
+    """Validate the trained custom model
+
+    incremental=True evaluates from cached per-image predictions and only runs
+    inference on new or changed val images (see incremental_validation.py).
+    """
     
     model_path = 'runs/custom/indoor_night/weights/best.pt'
     
@@ -78,6 +104,11 @@ def validate_custom_model():
         return
     
     print("🔍 Validating custom model...")
+    if incremental:
+        report = incremental_validate(model_path, 'data.yaml')
+        print_validation_report(report)
+        return report
+
     model = YOLO(model_path)
     
     # Run validation
@@ -101,9 +132,12 @@ def main():
             check_dataset_structure()
             break
         elif choice == '2':
-            check_dataset_structure()
+            if not check_dataset_structure():
+                print("🛑 Training aborted, the dataset check found problems")
+                break
+            use_cache = input("Use shared image cache? (Y/n): ").strip().lower() != 'n'
             print("\n" + "="*60)
-            train_custom_model()
+            train_custom_model(use_image_cache=use_cache)
             break
         elif choice == '3':
             validate_custom_model()
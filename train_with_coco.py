@@ -6,15 +6,25 @@ This script shows different ways to train YOLOv8 using COCO dataset configuratio
 
 from ultralytics import YOLO
 
-def train_full_coco():
-    """Train on full COCO dataset (80 classes, ~20GB download)"""
+from shard_dataset import stage_shards
+
+def train_full_coco(shard_dir=None, stage_dir='datasets/coco_staged'):
+    """Train on full COCO dataset (80 classes, ~20GB download)
+
+    With shard_dir (made by: python shard_dataset.py pack --data coco.yaml),
+    the tar shards are unpacked to stage_dir on local disk first, instead of
+    reading ~120k loose files from the network filesystem every epoch.
+    """
     
     print("Training with full COCO dataset...")
     model = YOLO('yolov8n.pt')
     
     # This will automatically download COCO dataset if not present
+    data = 'coco.yaml'
+    if shard_dir:
+        data = stage_shards(shard_dir, stage_dir)
     results = model.train(
-        data='coco.yaml',           # Use built-in COCO configuration
+        data=data,                  # Built-in COCO configuration or staged shards
         epochs=100,
         imgsz=640,
         batch=16,
@@ -93,7 +103,8 @@ def main():
         choice = input("\nEnter your choice (1-5): ").strip()
         
         if choice == '1':
-            train_full_coco()
+            shard_dir = input("COCO shard directory (Enter to use coco.yaml): ").strip()
+            train_full_coco(shard_dir or None)
             break
         elif choice == '2':
             train_coco_subset()
@@ -0,0 +1,234 @@
+"""
+Training Phase Profiler
+
+Ultralytics callbacks that record where training time goes, so a slow run can
+be diagnosed from its run directory (next to results.csv):
+
+    timing.csv          one row per epoch: seconds spent waiting on the
+                        dataloader, preprocessing the batch, in forward (incl.
+                        loss), in backward + optimizer step, in validation,
+                        in everything else after the epoch (checkpoint
+                        saving, logging), plus peak RSS and dataloader
+                        worker utilization
+    timing_batches.csv  the same phases for every training batch
+    timing.png          stacked per-epoch phase breakdown
+
+Reading it:
+    data wait dominates       -> more dataloader workers or image_cache.py
+    forward/backward dominate -> smaller imgsz or model
+    worker utilization ~100%  -> workers are the bottleneck, add workers
+
+Usage:
+    model = YOLO('yolov8n.pt')
+    add_training_profiler(model)
+    model.train(...)
+"""
+
+import csv
+import os
+import time
+
+import psutil
+
+EPOCH_FIELDS = ('epoch', 'batches', 'train_s', 'data_wait_s', 'preprocess_s', 'forward_s',
+                'backward_opt_s', 'val_s', 'other_s', 'peak_rss_mb', 'workers', 'worker_util')
+BATCH_FIELDS = ('epoch', 'batch', 'data_wait_s', 'preprocess_s', 'forward_s', 'backward_opt_s')
+PHASES = ('data_wait_s', 'preprocess_s', 'forward_s', 'backward_opt_s', 'val_s', 'other_s')
+
+
+class TrainingProfiler:
+    """Phase timers driven by trainer callbacks and model forward hooks"""
+
+    def __init__(self, rss_interval=1.0):
+        self.rss_interval = rss_interval
+        self.epochs = []
+        self._process = psutil.Process()
+        self._hooks = []
+        self._cuda = False
+        self._batch_file = None
+
+    # --- helpers -------------------------------------------------------------
+
+    def _now(self):
+        if self._cuda:
+            import torch
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _sample_rss(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self._last_rss_sample < self.rss_interval:
+            return
+        self._last_rss_sample = now
+        try:
+            rss = self._process.memory_info().rss
+            for child in self._process.children(recursive=True):
+                rss += child.memory_info().rss
+        except psutil.Error:
+            return
+        self._epoch['peak_rss_mb'] = max(self._epoch['peak_rss_mb'], rss / 1024 / 1024)
+
+    def _worker_cpu_seconds(self):
+        total = 0.0
+        for child in self._process.children(recursive=True):
+            try:
+                times = child.cpu_times()
+                total += times.user + times.system
+            except psutil.Error:
+                pass
+        return total
+
+    # --- model forward hooks -------------------------------------------------
+
+    def _forward_start(self, module, inputs):
+        if self._in_batch:
+            self._t_forward_start = self._now()
+
+    def _forward_end(self, module, inputs, outputs):
+        if self._in_batch:
+            self._t_forward_end = self._now()
+
+    # --- trainer callbacks ---------------------------------------------------
+
+    def on_train_start(self, trainer):
+        self._cuda = trainer.device.type == 'cuda'
+        self._hooks = [trainer.model.register_forward_pre_hook(self._forward_start),
+                       trainer.model.register_forward_hook(self._forward_end)]
+        self._in_batch = self._in_epoch_val = False
+        self._last_rss_sample = 0.0
+        self._workers = getattr(trainer.train_loader, 'num_workers', 0)
+        self._batch_file = open(os.path.join(trainer.save_dir, 'timing_batches.csv'), 'a',
+                                newline='')
+        self._batch_writer = csv.DictWriter(self._batch_file, fieldnames=BATCH_FIELDS)
+        if self._batch_file.tell() == 0:
+            self._batch_writer.writeheader()
+
+    def on_train_epoch_start(self, trainer):
+        self._epoch = {field: 0.0 for field in EPOCH_FIELDS}
+        self._epoch.update(epoch=trainer.epoch + 1, batches=0, workers=self._workers)
+        self._t_epoch_start = self._t_batch_end = self._now()
+        self._worker_cpu_start = self._worker_cpu_seconds() if self._workers else 0.0
+        self._sample_rss(force=True)
+
+    def on_train_batch_start(self, trainer):
+        self._t_batch_start = self._now()
+        self._t_forward_start = self._t_forward_end = None
+        self._in_batch = True
+
+    def on_train_batch_end(self, trainer):
+        end = self._now()
+        self._in_batch = False
+        forward_start = self._t_forward_start or self._t_batch_start
+        forward_end = self._t_forward_end or forward_start
+        row = {
+            'epoch': self._epoch['epoch'],
+            'batch': self._epoch['batches'],
+            'data_wait_s': self._t_batch_start - self._t_batch_end,
+            'preprocess_s': forward_start - self._t_batch_start,
+            'forward_s': forward_end - forward_start,
+            'backward_opt_s': end - forward_end,
+        }
+        self._batch_writer.writerow(row)
+        for phase in BATCH_FIELDS[2:]:
+            self._epoch[phase] += row[phase]
+        self._epoch['batches'] += 1
+        self._t_batch_end = end
+        self._sample_rss()
+
+    def on_train_epoch_end(self, trainer):
+        self._t_train_end = self._now()
+        self._epoch['train_s'] = self._t_train_end - self._t_epoch_start
+        if self._workers:
+            busy = self._worker_cpu_seconds() - self._worker_cpu_start
+            self._epoch['worker_util'] = busy / (self._epoch['train_s'] * self._workers)
+        self._t_val_start = None
+        self._in_epoch_val = True
+        self._sample_rss(force=True)
+
+    def on_val_start(self, validator):
+        # Only per-epoch validation, not the final evaluation after training
+        if self._in_epoch_val:
+            self._t_val_start = self._now()
+
+    def on_val_end(self, validator):
+        if self._in_epoch_val and self._t_val_start is not None:
+            self._epoch['val_s'] += self._now() - self._t_val_start
+
+    def on_fit_epoch_end(self, trainer):
+        # Also fired once more by the final evaluation, after the last epoch
+        if not self._in_epoch_val:
+            return
+        self._in_epoch_val = False
+        epoch = self._epoch
+        epoch['other_s'] = max(0.0, self._now() - self._t_train_end - epoch['val_s'])
+        self._sample_rss(force=True)
+        self.epochs.append(epoch)
+        self._write_epochs(trainer.save_dir)
+        self._batch_file.flush()
+
+    def on_train_end(self, trainer):
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+        if self._batch_file is not None:
+            self._batch_file.close()
+            self._batch_file = None
+        if self.epochs:
+            plot_timing(self.epochs, os.path.join(trainer.save_dir, 'timing.png'))
+            print_timing_summary(self.epochs)
+
+    # --- output --------------------------------------------------------------
+
+    def _write_epochs(self, save_dir):
+        with open(os.path.join(save_dir, 'timing.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=EPOCH_FIELDS)
+            writer.writeheader()
+            for epoch in self.epochs:
+                writer.writerow({key: round(value, 4) if isinstance(value, float) else value
+                                 for key, value in epoch.items()})
+
+    def register(self, model):
+        """Add every callback of this profiler to an ultralytics YOLO model"""
+
+        for event in ('on_train_start', 'on_train_epoch_start', 'on_train_batch_start',
+                      'on_train_batch_end', 'on_train_epoch_end', 'on_val_start', 'on_val_end',
+                      'on_fit_epoch_end', 'on_train_end'):
+            model.add_callback(event, getattr(self, event))
+        return self
+
+
+def add_training_profiler(model, rss_interval=1.0):
+    return TrainingProfiler(rss_interval).register(model)
+
+
+def plot_timing(epochs, output_path):
+    """Stacked bar chart of seconds per phase for every epoch"""
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    x = [epoch['epoch'] for epoch in epochs]
+    fig, ax = plt.subplots(figsize=(max(6, len(epochs) * 0.4), 4))
+    bottom = [0.0] * len(epochs)
+    for phase in PHASES:
+        values = [epoch[phase] for epoch in epochs]
+        ax.bar(x, values, bottom=bottom, label=phase[:-2].replace('_', ' '))
+        bottom = [b + v for b, v in zip(bottom, values)]
+    ax.set_xlabel('epoch')
+    ax.set_ylabel('seconds')
+    ax.set_title('Training time per phase')
+    ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=120)
+    plt.close(fig)
+
+
+def print_timing_summary(epochs):
+    total = sum(sum(epoch[phase] for phase in PHASES) for epoch in epochs)
+    print("\n⏱️  Training time by phase:")
+    for phase in PHASES:
+        seconds = sum(epoch[phase] for epoch in epochs)
+        print(f"   {phase[:-2].replace('_', ' '):<15} {seconds:8.1f}s  "
+              f"({seconds / max(total, 1e-9) * 100:4.1f}%)")
+    print(f"   peak RSS        {max(epoch['peak_rss_mb'] for epoch in epochs):8.0f} MB")
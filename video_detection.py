@@ -0,0 +1,238 @@
+"""
+Streaming Video Detection Pipeline
+
+Runs a YOLO model over a camera feed or video file using three threads:
+
+    reader (cv2.VideoCapture) -> frame queue -> inference -> write queue -> writer
+
+The frame queue is bounded. For live sources it uses a latest-frame-wins
+policy: when inference falls behind, the oldest queued frame is dropped
+instead of letting latency grow. Video files are processed without dropping
+unless asked to; realtime=True paces file reads at the source FPS so the
+live-camera behaviour can be reproduced from a local file.
+
+Annotated frames are plotted and written on the writer thread, so encoding
+never blocks inference.
+"""
+
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from inference_metrics import get_metrics
+
+_END = object()
+metrics = get_metrics()
+
+
+def _put_latest(frame_queue, item):
+    """Put item, dropping the oldest queued frame if the queue is full
+
+    Returns the number of frames dropped (0 or 1).
+    """
+
+    try:
+        frame_queue.put_nowait(item)
+        return 0
+    except queue.Full:
+        pass
+    try:
+        frame_queue.get_nowait()
+        dropped = 1
+    except queue.Empty:
+        dropped = 0
+    frame_queue.put(item)
+    return dropped
+
+
+def open_source(source):
+    """Open a camera index ('0', '1', ...) or a video file/stream URL"""
+
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not capture.isOpened():
+        return None
+    return capture
+
+
+class VideoPipeline:
+    """Reader -> inference -> writer pipeline with bounded queues"""
+
+    def __init__(self, model, source, output_path=None, frame_stride=1, drop_frames=None,
+                 queue_size=2, conf=0.25, imgsz=640, warmup_frames=5, realtime=False):
+        self.model = model
+        self.source = source
+        self.output_path = output_path
+        self.frame_stride = max(1, frame_stride)
+        # Live cameras drop stale frames by default, files process every frame
+        self.drop_frames = str(source).isdigit() if drop_frames is None else drop_frames
+        self.conf = conf
+        self.imgsz = imgsz
+        self.warmup_frames = warmup_frames
+        self.realtime = realtime
+
+        self._frames = queue.Queue(maxsize=queue_size)
+        self._outputs = queue.Queue(maxsize=queue_size * 4)
+        self._stop = threading.Event()
+        self._error = None
+
+        self.frames_read = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+        self.latencies = []
+        self.completion_times = []
+
+    def _fail(self, error):
+        """Remember the first error of any thread and stop the reader"""
+
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    @staticmethod
+    def _drain(item_queue):
+        """Consume a queue up to _END, so the upstream thread never blocks on put"""
+
+        while item_queue.get() is not _END:
+            pass
+
+    # Every thread always puts _END downstream, even after an error, so the
+    # pipeline shuts down and run() can re-raise instead of hanging
+    def _read(self, capture, fps):
+        try:
+            started = time.perf_counter()
+            while not self._stop.is_set():
+                if self.realtime:
+                    delay = started + self.frames_read / fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                index = self.frames_read
+                self.frames_read += 1
+                if index % self.frame_stride:
+                    self.frames_skipped += 1
+                    continue
+
+                item = (index, time.perf_counter(), frame)
+                if self.drop_frames:
+                    self.frames_dropped += _put_latest(self._frames, item)
+                else:
+                    self._frames.put(item)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            capture.release()
+            self._frames.put(_END)
+
+    def _infer(self):
+        try:
+            while True:
+                item = self._frames.get()
+                if item is _END:
+                    break
+                index, captured_at, frame = item
+                result = self.model(frame, conf=self.conf, imgsz=self.imgsz, verbose=False)[0]
+                metrics.record_speed([result])
+                self._outputs.put((index, captured_at, result))
+        except Exception as e:
+            self._fail(e)
+            self._drain(self._frames)
+        finally:
+            self._outputs.put(_END)
+
+    def _write(self, writer_size, fps):
+        writer = None
+        try:
+            if self.output_path:
+                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                writer = cv2.VideoWriter(self.output_path, fourcc, fps, writer_size)
+
+            while True:
+                item = self._outputs.get()
+                if item is _END:
+                    break
+                _, captured_at, result = item
+                if writer is not None:
+                    with metrics.stage('plot'):
+                        frame = result.plot()
+                    with metrics.stage('imwrite'):
+                        writer.write(frame)
+                now = time.perf_counter()
+                self.latencies.append(now - captured_at)
+                self.completion_times.append(now)
+        except Exception as e:
+            self._fail(e)
+            self._drain(self._outputs)
+        finally:
+            if writer is not None:
+                writer.release()
+
+    def run(self):
+        """Process the whole source (or until stop()) and return statistics"""
+
+        capture = open_source(self.source)
+        if capture is None:
+            raise IOError(f"Could not open video source {self.source}")
+
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+        threads = [
+            threading.Thread(target=self._read, args=(capture, fps), daemon=True),
+            threading.Thread(target=self._infer, daemon=True),
+            threading.Thread(target=self._write, args=((width, height), fps / self.frame_stride),
+                             daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.stats()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """Steady-state FPS (after warmup frames) and latency percentiles"""
+
+        processed = len(self.completion_times)
+        steady = self.completion_times[self.warmup_frames:]
+        if len(steady) > 1:
+            steady_fps = (len(steady) - 1) / (steady[-1] - steady[0])
+        else:
+            steady_fps = 0.0
+
+        latencies_ms = np.array(self.latencies) * 1000
+        percentiles = (np.percentile(latencies_ms, [50, 95, 99]) if processed
+                       else np.zeros(3))
+        return {
+            'frames_read': self.frames_read,
+            'frames_processed': processed,
+            'frames_skipped': self.frames_skipped,
+            'frames_dropped': self.frames_dropped,
+            'steady_fps': steady_fps,
+            'latency_p50_ms': float(percentiles[0]),
+            'latency_p95_ms': float(percentiles[1]),
+            'latency_p99_ms': float(percentiles[2]),
+        }
+
+
+def print_video_stats(stats):
+    print(f"\n🎞️  Frames: {stats['frames_read']} read, {stats['frames_processed']} processed, "
+          f"{stats['frames_skipped']} skipped, {stats['frames_dropped']} dropped")
+    print(f"⚡ Steady-state FPS: {stats['steady_fps']:.2f}")
+    print(f"⏱️  Latency p50/p95/p99: {stats['latency_p50_ms']:.1f} / "
+          f"{stats['latency_p95_ms']:.1f} / {stats['latency_p99_ms']:.1f} ms")
@@ -0,0 +1,283 @@
+"""
+Multi-Process Inference Worker Pool
+
+One PyTorch process stops scaling long before 32-64 cores: for a small
+model, intra-op threads spend more time synchronizing than computing. The
+worker pool runs N processes with T threads each instead:
+
+1. the model is loaded once in the parent, and the predictor (Conv+BN fused
+   copy of the weights) is built there with a single-threaded warmup. Its
+   weights are moved to shared memory before the workers are forked, so N
+   workers map one copy of the weights instead of building N
+2. every worker gets its own thread budget (torch threads, pinned to its own
+   cores when processes x threads fits the machine)
+3. batches of image paths are dispatched to the workers, which decode,
+   letterbox, run the model and optionally render annotated images
+4. detections come back in input order to a single ResultSink
+
+run_pool() reports per-worker throughput and utilization. calibrate() runs
+the same images with several processes x threads splits and reports the
+scaling efficiency of each against one single-threaded process, to pick the
+best split per host.
+
+CPU only: CUDA can't be used in forked workers.
+
+Usage:
+    python worker_pool.py --source folder/ --processes 8 --threads 4
+    python worker_pool.py --source folder/ --calibrate 1x1,1x32,4x8,8x4,32x1
+"""
+
+import argparse
+import json
+import os
+import time
+from multiprocessing import get_context
+
+import cv2
+import numpy as np
+import psutil
+import torch
+from ultralytics.engine.results import Results
+
+from detections import Detections
+from model_registry import CUSTOM_MODEL_PATH
+from preprocess import IMAGE_EXTENSIONS, load_and_letterbox, scale_boxes_to_original
+from result_sink import ResultSink
+from sweep_scheduler import make_slots
+
+# Set in the parent right before forking; the workers inherit it
+_shared_model = None
+_worker = {}
+
+
+def load_shared_model(weights, imgsz=640):
+    """Load weights and build the fused predictor once, with weights in shared memory
+
+    The warmup runs single-threaded so no OpenMP thread pool exists in the
+    parent when the workers are forked.
+    """
+
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    try:
+        dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        model(dummy, imgsz=imgsz, device='cpu', verbose=False)
+    finally:
+        torch.set_num_threads(threads)
+    model.predictor.model.share_memory()
+    return model
+
+
+def _init_worker(worker_ids, core_sets, threads, imgsz, conf, render_dir):
+    worker_id = worker_ids.get()
+    if core_sets and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, core_sets[worker_id])
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(1)
+    _worker.update(id=worker_id, imgsz=imgsz, conf=conf, render_dir=render_dir,
+                   process=psutil.Process())
+
+
+def _infer_batch(image_paths):
+    """Worker: decode, letterbox and detect one batch of images"""
+
+    start = time.perf_counter()
+    imgsz = _worker['imgsz']
+    loaded = [(path, load_and_letterbox(path, imgsz)) for path in image_paths]
+    batch = [(path, *prepared) for path, prepared in loaded if prepared is not None]
+
+    results = []
+    if batch:
+        inputs = torch.from_numpy(np.stack([item[2] for item in batch]))
+        predictions = _shared_model(inputs, imgsz=imgsz, conf=_worker['conf'], device='cpu',
+                                    verbose=False)
+        for (path, original, _, ratio_pad), prediction in zip(batch, predictions):
+            boxes = scale_boxes_to_original(prediction.boxes.data, ratio_pad, original.shape)
+            result = Results(original, path=path, names=_shared_model.names, boxes=boxes)
+            if _worker['render_dir']:
+                base_name = os.path.splitext(os.path.basename(path))[0]
+                cv2.imwrite(os.path.join(_worker['render_dir'],
+                                         f'{base_name}_custom_detection.jpg'), result.plot())
+            results.append(result)
+
+    memory = _worker['process'].memory_full_info()
+    return {
+        'worker': _worker['id'],
+        'images': len(batch),
+        'skipped': [path for path, prepared in loaded if prepared is None],
+        'detections': Detections.from_results(results),
+        'busy_s': time.perf_counter() - start,
+        'rss_mb': memory.rss / 1024 / 1024,
+        'uss_mb': memory.uss / 1024 / 1024,
+    }
+
+
+def run_pool(weights, image_paths, processes=4, threads=None, batch_size=8, imgsz=640,
+             conf=0.25, output_dir='.', save_images=False, detections_path=None, model=None,
+             on_batch=None):
+    """Run the model over image_paths on processes x threads workers
+
+    Detections are written to detections_path (.jsonl or .parquet) in input
+    order. Pass an already loaded shared model (load_shared_model) to reuse it
+    across runs. Returns throughput statistics with a per-worker breakdown.
+    """
+
+    global _shared_model
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+        else list(range(os.cpu_count() or 1))
+    threads = threads or max(1, len(cores) // processes)
+    # Pin only when every worker gets cores of its own
+    core_sets = None
+    if processes * threads <= len(cores):
+        core_sets = [slot[:threads] for slot in make_slots(slots=processes)]
+
+    _shared_model = model or load_shared_model(weights, imgsz)
+    render_dir = output_dir if save_images else None
+    if render_dir:
+        os.makedirs(render_dir, exist_ok=True)
+
+    fork = get_context('fork')
+    worker_ids = fork.Queue()
+    for worker_id in range(processes):
+        worker_ids.put(worker_id)
+
+    batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+    workers = {worker_id: {'worker': worker_id, 'batches': 0, 'images': 0, 'busy_s': 0.0,
+                           'peak_rss_mb': 0.0, 'peak_uss_mb': 0.0}
+               for worker_id in range(processes)}
+    start = time.perf_counter()
+    sink = ResultSink(detections_path)
+    with sink, fork.Pool(processes, initializer=_init_worker,
+                         initargs=(worker_ids, core_sets, threads, imgsz, conf,
+                                   render_dir)) as pool:
+        # imap hands back batches in input order, whichever worker finishes first
+        for output in pool.imap(_infer_batch, batches):
+            for path in output['skipped']:
+                print(f"⚠️  Could not read {path}, skipping")
+            sink.add_rows(output['detections'].to_rows(), images=output['images'])
+            stats = workers[output['worker']]
+            stats['batches'] += 1
+            stats['images'] += output['images']
+            stats['busy_s'] += output['busy_s']
+            stats['peak_rss_mb'] = max(stats['peak_rss_mb'], output['rss_mb'])
+            stats['peak_uss_mb'] = max(stats['peak_uss_mb'], output['uss_mb'])
+            if on_batch is not None:
+                on_batch(output)
+    elapsed = time.perf_counter() - start
+    _shared_model = None
+
+    for stats in workers.values():
+        stats['images_per_sec'] = stats['images'] / stats['busy_s'] if stats['busy_s'] else 0.0
+        stats['utilization'] = stats['busy_s'] / elapsed if elapsed > 0 else 0.0
+    return {
+        'processes': processes,
+        'threads': threads,
+        'pinned': core_sets is not None,
+        'images': sink.images,
+        'detections': sink.detections,
+        'seconds': elapsed,
+        'images_per_sec': sink.images / elapsed if elapsed > 0 else 0.0,
+        'workers': list(workers.values()),
+    }
+
+
+def calibrate(weights, image_paths, splits, batch_size=8, imgsz=640, conf=0.25):
+    """Throughput and scaling efficiency of every (processes, threads) split
+
+    Efficiency is throughput divided by cores used x the throughput of one
+    single-threaded process, which is always measured first.
+    """
+
+    model = load_shared_model(weights, imgsz)
+    splits = [(1, 1)] + [split for split in splits if split != (1, 1)]
+    reports = []
+    for processes, threads in splits:
+        print(f"⏱️  {processes} processes x {threads} threads...")
+        report = run_pool(weights, image_paths, processes, threads, batch_size, imgsz, conf,
+                          model=model)
+        baseline = reports[0]['images_per_sec'] if reports else report['images_per_sec']
+        report['efficiency'] = report['images_per_sec'] / (baseline * processes * threads) \
+            if baseline else 0.0
+        print(f"   {report['images_per_sec']:.2f} images/sec, "
+              f"efficiency {report['efficiency'] * 100:.0f}%")
+        reports.append(report)
+    return reports
+
+
+def print_pool_stats(report):
+    print(f"\n⚡ {report['processes']} processes x {report['threads']} threads"
+          f"{' (pinned)' if report['pinned'] else ''}: {report['images']} images in "
+          f"{report['seconds']:.1f}s ({report['images_per_sec']:.2f} images/sec)")
+    print(f"{'Worker':>6} | {'Images':>6} | {'Images/s':>8} | {'Util':>5} | "
+          f"{'RSS MB':>7} | {'Own MB':>7}")
+    print("-" * 55)
+    for worker in report['workers']:
+        print(f"{worker['worker']:>6} | {worker['images']:>6} | {worker['images_per_sec']:8.2f} | "
+              f"{worker['utilization'] * 100:4.0f}% | {worker['peak_rss_mb']:7.0f} | "
+              f"{worker['peak_uss_mb']:7.0f}")
+
+
+def print_calibration(reports):
+    print(f"\n{'Processes x threads':<20} | {'Images/s':>8} | {'Efficiency':>10}")
+    print("-" * 46)
+    for report in reports:
+        split = f"{report['processes']} x {report['threads']}"
+        print(f"{split:<20} | {report['images_per_sec']:8.2f} | "
+              f"{report['efficiency'] * 100:9.0f}%")
+    best = max(reports, key=lambda report: report['images_per_sec'])
+    print(f"\n💡 Fastest split: {best['processes']} processes x {best['threads']} threads")
+
+
+def _split_list(value):
+    return [tuple(int(part) for part in split.split('x')) for split in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-process inference over a folder')
+    parser.add_argument('--weights', default=CUSTOM_MODEL_PATH)
+    parser.add_argument('--source', required=True, help='folder of images')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, help='torch threads per worker '
+                                                    '(default: cores / processes)')
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--detections', default='detections.jsonl')
+    parser.add_argument('--save', action='store_true', help='save annotated images')
+    parser.add_argument('--calibrate', type=_split_list,
+                        help='comma-separated processes x threads splits, e.g. 1x8,2x4,8x1')
+    parser.add_argument('--report', help='save the statistics as JSON')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        print(f"❌ Model {args.weights} not found!")
+        return
+    image_paths = [os.path.join(args.source, f) for f in sorted(os.listdir(args.source))
+                   if f.lower().endswith(IMAGE_EXTENSIONS)]
+    if not image_paths:
+        print(f"❌ No image files found in {args.source}")
+        return
+
+    if args.calibrate:
+        report = calibrate(args.weights, image_paths, args.calibrate, args.batch, args.imgsz,
+                           args.conf)
+        print_calibration(report)
+    else:
+        report = run_pool(args.weights, image_paths, args.processes, args.threads, args.batch,
+                          args.imgsz, args.conf, save_images=args.save,
+                          detections_path=args.detections)
+        print_pool_stats(report)
+        print(f"📄 {report['detections']} detections saved to: {args.detections}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report saved as: {args.report}")
+
+
+if __name__ == "__main__":
+    main()